@@ -0,0 +1,83 @@
+"""
+# Lock manager contention
+# Runs mixed read/write transactions from several workers against one table and reports commits, aborts,
+# throughput and latency for each read ratio and number of lock table stripes.
+# Every transaction reads or updates a few keys, most of them drawn from a small hot set so workers collide.
+# Conflicting requests are refused at once (no-wait), so contention shows up as aborts and never as blocked threads.
+# Usage: python -m benchmarks.lock_contention [workers] [transactions_per_worker]
+"""
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+from lstore.lock_manager import LockManager
+from time import perf_counter
+import random
+import shutil
+import sys
+import tempfile
+
+NUM_RECORDS = 8192
+HOT_KEYS = 64 # keys most operations go to
+HOT_FRACTION = 0.8 # share of operations on the hot keys
+QUERIES_PER_TRANSACTION = 4
+READ_RATIOS = (0.5, 0.9)
+STRIPES = (1, 64)
+
+
+def build_transaction(query, table, rng, read_ratio):
+    transaction = Transaction()
+    for _ in range(QUERIES_PER_TRANSACTION):
+        key = rng.randrange(HOT_KEYS) if rng.random() < HOT_FRACTION else rng.randrange(NUM_RECORDS)
+        if rng.random() < read_ratio:
+            transaction.add_query(query.select, table, key, 0, [1, 1, 1, 1, 1])
+        else:
+            transaction.add_query(query.update, table, key, None, rng.randrange(100), None, None, None)
+    return transaction
+
+
+def run(workers=8, transactions_per_worker=500):
+    path = tempfile.mkdtemp(prefix='lstore_bench_')
+    try:
+        db = Database()
+        db.open(path)
+        table = db.create_table('Grades', 5, 0)
+        query = Query(table)
+        for key in range(NUM_RECORDS):
+            query.insert(key, 0, 0, 0, 0)
+
+        print(f"{'stripes':>7} {'reads':>5} {'commits':>8} {'aborts':>7} {'commit/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+        results = []
+        rng = random.Random(165)
+        for num_stripes in STRIPES:
+            for read_ratio in READ_RATIOS:
+                table.lock_manager = LockManager(num_stripes)
+                pool = [TransactionWorker() for _ in range(workers)]
+                for worker in pool:
+                    for _ in range(transactions_per_worker):
+                        worker.add_transaction(build_transaction(query, table, rng, read_ratio))
+
+                start = perf_counter()
+                for worker in pool:
+                    worker.run()
+                for worker in pool:
+                    worker.join()
+                elapsed = perf_counter() - start
+
+                summaries = [worker.summary() for worker in pool]
+                commits = sum(summary['commits'] for summary in summaries)
+                aborts = sum(summary['aborts'] for summary in summaries)
+                p50 = max(summary['latency_p50'] for summary in summaries)
+                p99 = max(summary['latency_p99'] for summary in summaries)
+                results.append({'stripes': num_stripes, 'read_ratio': read_ratio, 'commits': commits, 'aborts': aborts,
+                                'throughput': commits / elapsed, 'latency_p50': p50, 'latency_p99': p99})
+                print(f"{num_stripes:>7} {read_ratio:>5} {commits:>8} {aborts:>7} {commits / elapsed:>9.0f} {p50:>9.3f} {p99:>9.3f}")
+
+        db.close()
+        return results
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,283 @@
+"""
+# Benchmark suite
+# Runs every workload at each table size on a fresh database and reports throughput, latency, how far the peak
+# memory grew during the workload and the bytes the database takes on disk. Every table size, and the catalog
+# workload, runs in its own process so the memory of one size does not hide that of the next. Results are written as JSON so two runs can be diffed; given a baseline
+# file the suite compares throughput workload by workload and exits with status 1 if any of them regressed.
+#
+#   bulk_insert      insert_columns in batches of BATCH_SIZE records
+#   point_select     select by primary key, all columns
+#   update_heavy     updates of one column on random keys
+#   range_sum        sum over RANGE_WIDTH consecutive keys
+#   versioned_read   select_version one version back on records that were updated
+#   merge_under_load updates from TransactionWorkers while the background merge runs
+#   close_reopen     Database.close, then open and get_table
+#   cold_range_sum   range_sum again once every full page range of the reopened table is packed (compressed)
+#   catalog_open     once per run: open a database of CATALOG_TABLES tables and get_table one of them, then load
+#                    the others in parallel (records = number of tables)
+#
+# Usage: python -m benchmarks.suite [--records 10000 100000 1000000] [--output results.json] [--baseline old.json]
+#                                  [--threshold 0.1]
+"""
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker, percentile
+from time import perf_counter
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:
+    resource = None # not available on Windows, the RSS growth is then left out
+
+NUM_COLUMNS = 5
+RECORDS = (10000, 100000)
+BATCH_SIZE = 10000
+OPERATIONS = 20000 # point operations per workload, fewer on smaller tables
+RANGE_WIDTH = 1000
+RANGE_SUMS = 200
+WORKERS = 4
+TRANSACTIONS_PER_WORKER = 250
+QUERIES_PER_TRANSACTION = 4
+CATALOG_TABLES = 32
+CATALOG_RECORDS = 1000 # records per table of the catalog_open workload
+REGRESSION_THRESHOLD = 0.10 # a workload regressed if its throughput dropped by more than this fraction
+
+
+def peak_rss():
+    # ru_maxrss is the peak of the whole process so far, in kilobytes on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak * 1024 if sys.platform != 'darwin' else peak
+
+
+def disk_bytes(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+"""
+# Runs operation once per argument, timing each call, and returns the workload's result entry
+# Latencies are in milliseconds, throughput counts operations (records for batched workloads) per second
+"""
+def measure(workload, records, operation, arguments, operations_per_call=1):
+    latencies = []
+    peak_before = peak_rss()
+    start = perf_counter()
+    for argument in arguments:
+        call_start = perf_counter()
+        operation(argument)
+        latencies.append((perf_counter() - call_start) * 1000)
+    elapsed = perf_counter() - start
+    return result(workload, records, len(latencies) * operations_per_call, elapsed, latencies, peak_before)
+
+
+"""
+# peak_before is peak_rss() taken when the workload started: ru_maxrss only ever grows, so the entry reports how far
+# the workload raised the peak (0 if it stayed below an earlier workload's peak), not the memory it used
+"""
+def result(workload, records, operations, elapsed, latencies, peak_before):
+    peak = peak_rss()
+    return {
+        'workload': workload,
+        'records': records,
+        'operations': operations,
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(operations / elapsed, 1) if elapsed > 0 else None,
+        'latency_p50_ms': round(percentile(latencies, 50), 4) if latencies else None,
+        'latency_p99_ms': round(percentile(latencies, 99), 4) if latencies else None,
+        'peak_rss_growth_bytes': peak - peak_before if peak is not None else None,
+    }
+
+
+def update_transaction(query, table, rng, records):
+    transaction = Transaction()
+    for _ in range(QUERIES_PER_TRANSACTION):
+        transaction.add_query(query.update, table, rng.randrange(records), None, rng.randrange(100), None, None, None)
+    return transaction
+
+
+"""
+# Runs every workload on a fresh table of the given size and returns their result entries
+"""
+def run_size(records, seed=165):
+    rng = random.Random(seed)
+    operations = min(OPERATIONS, records)
+    path = tempfile.mkdtemp(prefix='lstore_bench_')
+    results = []
+    try:
+        db = Database()
+        db.open(path)
+        table = db.create_table('Grades', NUM_COLUMNS, 0)
+        query = Query(table)
+
+        def insert_batch(start):
+            count = min(BATCH_SIZE, records - start)
+            keys = list(range(start, start + count))
+            query.insert_columns([keys] + [[rng.randrange(100) for _ in keys] for _ in range(NUM_COLUMNS - 1)])
+        entry = measure('bulk_insert', records, insert_batch, range(0, records, BATCH_SIZE))
+        entry.update({'operations': records, 'ops_per_sec': round(records / entry['seconds'], 1)}) # latencies are per batch
+        results.append(entry)
+
+        keys = [rng.randrange(records) for _ in range(operations)]
+        projection = [1] * NUM_COLUMNS
+        results.append(measure('point_select', records, lambda key: query.select(key, 0, projection), keys))
+
+        results.append(measure('update_heavy', records, lambda key: query.update(key, None, rng.randrange(100), None, None, None), keys))
+
+        starts = [rng.randrange(max(records - RANGE_WIDTH, 1)) for _ in range(RANGE_SUMS)]
+        results.append(measure('range_sum', records, lambda start: query.sum(start, start + RANGE_WIDTH - 1, 1), starts, RANGE_WIDTH))
+
+        results.append(measure('versioned_read', records, lambda key: query.select_version(key, 0, projection, -1), keys))
+
+        merges_before = table.merge_metrics()['merges']
+        peak_before = peak_rss()
+        workers = [TransactionWorker() for _ in range(WORKERS)]
+        for worker in workers:
+            for _ in range(TRANSACTIONS_PER_WORKER):
+                worker.add_transaction(update_transaction(query, table, rng, records))
+        start = perf_counter()
+        for worker in workers:
+            worker.run()
+        for worker in workers:
+            worker.join()
+        table.drain_merges() # the merges the updates triggered are part of the workload
+        elapsed = perf_counter() - start
+        latencies = [latency * 1000 for worker in workers for latency in worker.latencies]
+        entry = result('merge_under_load', records, sum(worker.result for worker in workers), elapsed, latencies, peak_before)
+        entry['aborts'] = WORKERS * TRANSACTIONS_PER_WORKER - entry['operations']
+        entry['merges'] = table.merge_metrics()['merges'] - merges_before
+        results.append(entry)
+
+        peak_before = peak_rss()
+        start = perf_counter()
+        db.close()
+        close_time = perf_counter() - start
+        size = disk_bytes(path)
+        start = perf_counter()
+        db = Database()
+        db.open(path)
+        table = db.get_table('Grades')
+        open_time = perf_counter() - start
+        entry = result('close_reopen', records, 1, close_time + open_time, [close_time * 1000, open_time * 1000], peak_before)
+        entry.update({'close_seconds': round(close_time, 4), 'open_seconds': round(open_time, 4), 'disk_bytes': size})
+        results.append(entry)
+
+        query = Query(table)
+        start = perf_counter()
+        packed = table.compress_cold_ranges(idle=True)
+        compress_time = perf_counter() - start
+        entry = measure('cold_range_sum', records, lambda start: query.sum(start, start + RANGE_WIDTH - 1, 1), starts, RANGE_WIDTH)
+        db.close()
+        entry.update({'ranges_packed': packed, 'compress_seconds': round(compress_time, 4), 'disk_bytes': disk_bytes(path)})
+        results.append(entry)
+        return results
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+"""
+# Times opening a database of many tables: only the table asked for is loaded, the rest on a later get_tables
+"""
+def run_catalog(tables=CATALOG_TABLES):
+    path = tempfile.mkdtemp(prefix='lstore_bench_')
+    try:
+        db = Database()
+        db.open(path)
+        names = [f'Grades{number}' for number in range(tables)]
+        for name in names:
+            keys = list(range(CATALOG_RECORDS))
+            Query(db.create_table(name, NUM_COLUMNS, 0)).insert_columns([keys] + [keys] * (NUM_COLUMNS - 1))
+        start = perf_counter()
+        db.close()
+        close_time = perf_counter() - start
+
+        peak_before = peak_rss()
+        start = perf_counter()
+        db = Database()
+        db.open(path)
+        db.get_table(names[0])
+        open_time = perf_counter() - start
+        start = perf_counter()
+        db.get_tables(*names)
+        load_time = perf_counter() - start
+        db.close()
+        entry = result('catalog_open', tables, 1, open_time, [open_time * 1000], peak_before)
+        entry.update({'close_seconds': round(close_time, 4), 'open_seconds': round(open_time, 4), 'load_all_seconds': round(load_time, 4)})
+        return entry
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+"""
+# Compares two result lists by (workload, records), returns the entries whose throughput dropped past the threshold
+"""
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    previous = {(entry['workload'], entry['records']): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry['workload'], entry['records']))
+        if old is None or not old['ops_per_sec'] or not entry['ops_per_sec']:
+            continue
+        change = entry['ops_per_sec'] / old['ops_per_sec'] - 1
+        print(f"{entry['workload']:>16} {entry['records']:>8} {old['ops_per_sec']:>12.0f} -> {entry['ops_per_sec']:>12.0f} {change:>+8.1%}")
+        if change < -threshold:
+            regressions.append(entry)
+    return regressions
+
+
+"""
+# Yields the result entries of every workload, each table size and the catalog workload in a fresh process
+"""
+def workloads(records):
+    context = multiprocessing.get_context('spawn')
+    for size in records:
+        with context.Pool(1) as pool:
+            yield from pool.apply(run_size, (size,))
+    with context.Pool(1) as pool:
+        yield pool.apply(run_catalog)
+
+
+def run(records=RECORDS, output=None, baseline=None, threshold=REGRESSION_THRESHOLD):
+    print(f"{'workload':>16} {'records':>8} {'ops/s':>12} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    results = []
+    for entry in workloads(records):
+        results.append(entry)
+        print(f"{entry['workload']:>16} {entry['records']:>8} {entry['ops_per_sec']:>12.0f} {entry['latency_p50_ms']:>9.3f} {entry['latency_p99_ms']:>9.3f}")
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    regressions = []
+    if baseline is not None:
+        with open(baseline) as file:
+            regressions = compare(results, json.load(file)['results'], threshold)
+        for entry in regressions:
+            print(f"regression: {entry['workload']} at {entry['records']} records")
+    return report, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='L-Store benchmark suite')
+    parser.add_argument('--records', type=int, nargs='+', default=list(RECORDS), help='table sizes to run')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='largest tolerated throughput drop')
+    arguments = parser.parse_args()
+    report, regressions = run(arguments.records, arguments.output, arguments.baseline, arguments.threshold)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,49 @@
+"""
+# Update latency as the tail pages grow
+# Updates a fixed set of records over and over and reports the mean latency of each round.
+# With the indirection column kept current on the base records every update is a constant-time
+# pointer hop, so the per-round latency should stay flat while the tail keeps growing.
+# Usage: python -m benchmarks.update_latency [rounds] [updates_per_round]
+"""
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+import shutil
+import sys
+import tempfile
+
+NUM_RECORDS = 8192 # one full page range
+
+
+def run(rounds=10, updates_per_round=2000):
+    path = tempfile.mkdtemp(prefix='lstore_bench_')
+    try:
+        db = Database()
+        db.open(path)
+        table = db.create_table('Grades', 5, 0)
+        query = Query(table)
+        for key in range(NUM_RECORDS):
+            query.insert(key, 0, 0, 0, 0)
+
+        print(f"{'round':>5} {'tail pages':>10} {'mean update (us)':>17}")
+        results = []
+        for round_number in range(rounds):
+            start = perf_counter()
+            for i in range(updates_per_round):
+                # keep hitting the same small set of keys so their version chains get long
+                query.update(i % 64, None, round_number, i, None, None)
+            elapsed = perf_counter() - start
+            tail_pages = sum(len(page_range['tail_pages']) for page_range in table.page_ranges)
+            mean_us = elapsed / updates_per_round * 1e6
+            results.append(mean_us)
+            print(f"{round_number:>5} {tail_pages:>10} {mean_us:>17.1f}")
+
+        print(f"last/first round latency ratio: {results[-1] / results[0]:.2f}")
+        db.close()
+        return results
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,169 @@
+"""
+Batch aggregation straight over the packed column pages. Matching base RIDs are grouped into runs of consecutive
+slots on the same page, and every run whose records were never updated or deleted is reduced as one contiguous slice.
+NumPy is used for the reductions when it is installed, otherwise the builtins reduce the memoryview slices.
+Runs on the packed pages of a cold page range are reduced straight from their encoded form when none of their records
+was updated, RLE-encoded columns run by run without being decoded, and their pages never enter the bufferpool.
+"""
+from lstore import compression
+from lstore.page import NULL_VALUE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AGGREGATES = ('sum', 'count', 'min', 'max', 'avg')
+
+
+class Aggregator:
+
+    """
+    # Computes any of sum/count/min/max/avg over one data column in a single pass
+    """
+    def __init__(self, table):
+        self.table = table
+
+    """
+    # :param rids: iterable of base RIDs to aggregate over
+    # :param column: int     #Index of the data column to aggregate
+    # :param aggregates: which of AGGREGATES to return
+    # Returns a dict of aggregate name to value, min/max/avg are None when no record matched
+    # None cells are skipped: count counts the non-None values and avg averages over them
+    """
+    def aggregate(self, rids, column, aggregates=AGGREGATES):
+        self.total = 0
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self.want_extremes = 'min' in aggregates or 'max' in aggregates
+
+        for first, last in self.page_runs(sorted(rids)):
+            self.reduce_run(first, last, column)
+
+        results = {
+            'sum': self.total,
+            'count': self.count,
+            'min': self.minimum,
+            'max': self.maximum,
+            'avg': self.total / self.count if self.count else None,
+        }
+        return {name: results[name] for name in aggregates}
+
+    """
+    # Groups sorted base RIDs into (first, last) runs of consecutive slots on the same base page
+    """
+    def page_runs(self, rids):
+        records_per_page = self.table.max_records_per_page
+        first = last = None
+        for rid in rids:
+            if last is not None and rid == last + 1 and (rid - 1) % records_per_page != 0:
+                last = rid
+                continue
+            if first is not None:
+                yield first, last
+            first = last = rid
+        if first is not None:
+            yield first, last
+
+    def reduce_run(self, first, last, column):
+        table = self.table
+        page_range, page_number, start = table.base_location(first)
+        end = start + last - first + 1
+        merged_tail = table.page_ranges[page_range]['TPS'] # tail records below this position are in the base pages
+        columns = (table.num_columns, table.num_columns + 1, column) # RID, indirection, aggregate column
+        if table.page_ranges[page_range]['packed'] and self.reduce_packed(page_range, page_number, start, end, first, columns):
+            return
+        pages = [table.pin_column(page_range, 'base', page_number, c) for c in columns]
+        try:
+            rid_view, indirection_view, value_view = [page.view()[start:end] for page in pages]
+            if np is not None:
+                rids = np.frombuffer(rid_view, dtype=np.int64)
+                indirections = np.frombuffer(indirection_view, dtype=np.int64)
+                values = np.frombuffer(value_view, dtype=np.int64)
+                expected = np.arange(first, last + 1, dtype=np.int64)
+                # live records still carry their RID, current ones point at themselves or at a merged tail record
+                live = rids == expected
+                current = live & ((indirections == expected) | ((indirections < 0) & (-indirections - 1 < merged_tail)))
+                self.add_values(values[current & (values != NULL_VALUE)])
+                stale = (expected[live & ~current]).tolist()
+            else:
+                expected = list(range(first, last + 1))
+                rids = rid_view.tolist()
+                indirections = indirection_view.tolist()
+                if rids == expected and indirections == expected:
+                    self.add_values(value_view)
+                    stale = []
+                else:
+                    current = []
+                    stale = []
+                    for rid, expected_rid, indirection, value in zip(rids, expected, indirections, value_view):
+                        if rid != expected_rid:
+                            continue
+                        if indirection == rid or (indirection < 0 and -indirection - 1 < merged_tail):
+                            current.append(value)
+                        else:
+                            stale.append(rid)
+                    self.add_values(current)
+        finally:
+            for c in columns:
+                table.unpin_column(page_range, 'base', page_number, c)
+
+        # updated records get their newest value from the version chain
+        if stale:
+            values = [table.latest_value(rid, column) for rid in stale]
+            self.add_values([value for value in values if value is not None])
+
+    """
+    # Reduces a run of a packed page from the encoded blobs if every record of it is live and was never updated
+    # Returns False if the run has to be read through the bufferpool instead
+    """
+    def reduce_packed(self, page_range, page_number, start, end, first, columns):
+        blobs = [self.table.encoded_column(page_range, page_number, c) for c in columns]
+        if None in blobs:
+            return False
+        expected = list(range(first, first + end - start))
+        for blob in blobs[:2]:
+            # live records carry their RID, records never updated point at themselves
+            if compression.sequence(blob) != (first - start, 1) and compression.decode(blob)[start:end].tolist() != expected:
+                return False
+        runs = compression.runs(blobs[2])
+        if runs is None:
+            self.add_values(compression.decode(blobs[2])[start:end])
+            return True
+        position = 0
+        for value, length in runs:
+            covered = min(position + length, end) - max(position, start) # slots of the run inside [start, end)
+            position += length
+            if covered > 0 and value != NULL_VALUE:
+                self.total += value * covered
+                self.count += covered
+                if self.want_extremes:
+                    self.update_extremes(value, value)
+            if position >= end:
+                break
+        return True
+
+    def add_values(self, values):
+        if len(values) == 0:
+            return
+        if np is not None and isinstance(values, np.ndarray):
+            self.total += int(values.sum())
+            self.count += len(values)
+            if self.want_extremes:
+                self.update_extremes(int(values.min()), int(values.max()))
+            return
+        if NULL_VALUE in values:
+            values = [value for value in values if value != NULL_VALUE]
+            if not values:
+                return
+        self.total += sum(values)
+        self.count += len(values)
+        if self.want_extremes:
+            self.update_extremes(min(values), max(values))
+
+    def update_extremes(self, low, high):
+        if self.minimum is None or low < self.minimum:
+            self.minimum = low
+        if self.maximum is None or high > self.maximum:
+            self.maximum = high
@@ -0,0 +1,195 @@
+"""
+Compressed RID bitmaps in the style of Roaring bitmaps. A RID is split into its high and low 16 bits; the high bits
+pick a container and the low bits are stored in it. A container holding few RIDs is a sorted array of low bits, one
+holding ARRAY_LIMIT or more is a 65536 bit bitset, so sparse and dense runs of RIDs both stay small.
+Setting or clearing a RID touches a single container, and AND / OR / AND NOT combine two bitmaps container by
+container, dense containers as big integers so the work is done in C.
+"""
+from bisect import bisect_left
+from array import array
+
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_MASK = CONTAINER_SIZE - 1
+ARRAY_LIMIT = 4096 # an array container of this many entries takes as much room as a bitset
+BITSET_BYTES = CONTAINER_SIZE // 8
+
+# positions of the set bits of every byte value
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+# maps a byte per RID (0 or 1) to the digit characters of a base 2 literal
+BIT_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def bitset_positions(bitset):
+    positions = []
+    for byte_number, byte in enumerate(bitset):
+        if byte:
+            base = byte_number << 3
+            positions.extend(base + bit for bit in BYTE_BITS[byte])
+    return positions
+
+
+def to_bitset(lows):
+    bitset = bytearray(BITSET_BYTES)
+    for low in lows:
+        bitset[low >> 3] |= 1 << (low & 7)
+    return bitset
+
+
+def to_int(container):
+    if isinstance(container, array):
+        container = to_bitset(container)
+    return int.from_bytes(container, 'little')
+
+
+"""
+# Turns the result of a container operation back into the smallest container, None if it is empty
+"""
+def from_int(value):
+    count = value.bit_count()
+    if count == 0:
+        return None
+    bitset = bytearray(value.to_bytes(BITSET_BYTES, 'little'))
+    if count < ARRAY_LIMIT:
+        return array('H', bitset_positions(bitset))
+    return bitset
+
+
+class Bitmap:
+
+    def __init__(self, rids=()):
+        self.containers = {} # high bits -> sorted array('H') of low bits or bytearray bitset
+        for rid in rids:
+            self.add(rid)
+
+    """
+    # Bitmap of the RIDs whose byte in live is 1 (the page directory's live array), built a container at a time
+    """
+    @classmethod
+    def from_live(cls, live):
+        bitmap = cls()
+        for start in range(0, len(live), CONTAINER_SIZE):
+            chunk = live[start:start + CONTAINER_SIZE].tobytes()
+            container = from_int(int(chunk[::-1].translate(BIT_DIGITS), 2))
+            if container is not None:
+                bitmap.containers[start >> CONTAINER_BITS] = container
+        return bitmap
+
+    def add(self, rid):
+        high, low = rid >> CONTAINER_BITS, rid & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array('H', [low])
+        elif isinstance(container, array):
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                return
+            container.insert(position, low)
+            if len(container) >= ARRAY_LIMIT:
+                self.containers[high] = to_bitset(container)
+        else:
+            container[low >> 3] |= 1 << (low & 7)
+
+    def discard(self, rid):
+        high, low = rid >> CONTAINER_BITS, rid & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, array):
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                del container[position]
+                if not container:
+                    del self.containers[high]
+        else:
+            # dense containers stay bitsets until an operation rebuilds them
+            container[low >> 3] &= ~(1 << (low & 7)) & 0xFF
+
+    def __contains__(self, rid):
+        container = self.containers.get(rid >> CONTAINER_BITS)
+        if container is None:
+            return False
+        low = rid & LOW_MASK
+        if isinstance(container, array):
+            position = bisect_left(container, low)
+            return position < len(container) and container[position] == low
+        return bool(container[low >> 3] >> (low & 7) & 1)
+
+    def __len__(self):
+        return sum(len(container) if isinstance(container, array) else to_int(container).bit_count()
+                   for container in self.containers.values())
+
+    def __bool__(self):
+        return any(isinstance(container, array) or any(container) for container in self.containers.values())
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            base = high << CONTAINER_BITS
+            lows = container if isinstance(container, array) else bitset_positions(container)
+            for low in lows:
+                yield base + low
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and list(self) == list(other)
+
+    def tolist(self):
+        return list(self)
+
+    def copy(self):
+        bitmap = Bitmap()
+        bitmap.containers = {high: container[:] for high, container in self.containers.items()}
+        return bitmap
+
+    """
+    # Combinators: AND (&), OR (|), AND NOT (-); NOT is the difference from a universe, see complement
+    """
+    def __and__(self, other):
+        result = Bitmap()
+        for high in self.containers.keys() & other.containers.keys():
+            left, right = self.containers[high], other.containers[high]
+            if isinstance(left, array) and isinstance(right, array):
+                container = array('H', sorted(set(left).intersection(right))) or None
+            elif isinstance(left, array) or isinstance(right, array):
+                lows, bitset = (left, right) if isinstance(left, array) else (right, left)
+                container = array('H', [low for low in lows if bitset[low >> 3] >> (low & 7) & 1]) or None
+            else:
+                container = from_int(to_int(left) & to_int(right))
+            if container is not None:
+                result.containers[high] = container
+        return result
+
+    def __or__(self, other):
+        result = self.copy()
+        for high, right in other.containers.items():
+            left = result.containers.get(high)
+            if left is None:
+                result.containers[high] = right[:]
+            elif isinstance(left, array) and isinstance(right, array) and len(left) + len(right) < ARRAY_LIMIT:
+                result.containers[high] = array('H', sorted(set(left).union(right)))
+            else:
+                result.containers[high] = from_int(to_int(left) | to_int(right))
+        return result
+
+    def __sub__(self, other):
+        result = Bitmap()
+        for high, left in self.containers.items():
+            right = other.containers.get(high)
+            if right is None:
+                container = left[:]
+            elif isinstance(left, array):
+                if isinstance(right, array):
+                    container = array('H', sorted(set(left).difference(right))) or None
+                else:
+                    container = array('H', [low for low in left if not right[low >> 3] >> (low & 7) & 1]) or None
+            else:
+                container = from_int(to_int(left) & ~to_int(right))
+            if container is not None:
+                result.containers[high] = container
+        return result
+
+    """
+    # NOT: every RID of universe that is not in this bitmap
+    """
+    def complement(self, universe):
+        return universe - self
@@ -0,0 +1,235 @@
+import threading
+
+
+class Frame:
+
+    def __init__(self, table, page):
+        self.table = table # owning table, used to write the page back on eviction
+        self.page = page
+        self.pin_count = 0
+        self.dirty = False
+        self.referenced = True # CLOCK reference bit
+        self.lsn = 0 # LSN of the last logged change, the log is durable up to it before the page is written back
+
+
+class BufferPool:
+
+    """
+    # Page-granular bufferpool shared by every table of a Database
+    # Frames are keyed by (table name, page range, 'base' or 'tail', page number, column)
+    # :param size: int     #Maximum number of frames held in memory, None for unbounded
+    """
+    def __init__(self, size=None):
+        self.size = size
+        self.frames = {} # key -> Frame
+        self.clock = [] # keys in CLOCK order
+        self.hand = 0
+        self.latch = threading.Lock()
+        self.unsynced_log = None # (log, LSN) to sync before the dirty frames evict passed over can be written back
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+
+    """
+    # Returns the page for key and pins it, loading it through table.load_page on a miss
+    # Every call must be matched by an unpin
+    """
+    def pin(self, table, key):
+        with self.latch:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                frame = self.add_frame(table, key)
+            frame.pin_count += 1
+            frame.referenced = True
+            return frame.page
+
+    """
+    # Reads the slot at offset of several pages under one latch acquisition, loading the pages that are not cached
+    """
+    def read_slot(self, table, keys, offset):
+        with self.latch:
+            values = []
+            for key in keys:
+                frame = self.frames.get(key)
+                if frame is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    frame = self.add_frame(table, key)
+                frame.referenced = True
+                values.append(frame.page.read(offset))
+            return values
+
+    """
+    # :param lsn: LSN of the log record of the change made to the page while it was pinned, if any
+    """
+    def unpin(self, key, dirty=False, lsn=0):
+        with self.latch:
+            frame = self.frames[key]
+            if frame.pin_count <= 0:
+                raise Exception(f"Page {key} is not pinned")
+            frame.pin_count -= 1
+            if dirty:
+                frame.dirty = True
+                frame.lsn = max(frame.lsn, lsn)
+
+    def is_dirty(self, key):
+        with self.latch:
+            frame = self.frames.get(key)
+            return frame is not None and frame.dirty
+
+    def page_lsn(self, key):
+        with self.latch:
+            frame = self.frames.get(key)
+            return frame.lsn if frame is not None and frame.dirty else 0
+
+    """
+    # Places a freshly created page in the pool, it is dirty until first written back
+    """
+    def new_page(self, table, key, page):
+        with self.latch:
+            frame = self.add_frame(table, key, page)
+            frame.dirty = True
+
+    """
+    # Installs a new version of a page (e.g. a merged base page), pins on the old frame carry over
+    # :param lsn: the log has to be durable up to this LSN before the new version may reach the disk
+    """
+    def replace_page(self, table, key, page, lsn=0):
+        with self.latch:
+            frame = self.frames.get(key)
+            if frame is None:
+                frame = self.add_frame(table, key, page)
+            frame.page = page
+            frame.dirty = True
+            frame.lsn = max(frame.lsn, lsn)
+
+    """
+    # Adds the frame of key, holding page or the page faulted in through table.load_page, called with the latch held
+    # When the only frames left to evict are dirty ones whose log records are not durable yet, the latch is released
+    # while the log is synced, so the fsync holds up no other thread, and the lookup starts over
+    """
+    def add_frame(self, table, key, page=None):
+        while True:
+            frame = self.frames.get(key)
+            if frame is not None:
+                return frame # added by another thread while the log was synced
+            if self.size is None or len(self.frames) < self.size:
+                slot = None
+                break
+            slot = self.evict()
+            if slot is not None:
+                break
+            log, lsn = self.unsynced_log
+            self.latch.release()
+            try:
+                log.sync(lsn)
+            finally:
+                self.latch.acquire()
+        frame = Frame(table, page if page is not None else table.load_page(*key[1:]))
+        if slot is None:
+            self.clock.append(key)
+        else:
+            self.clock[slot] = key
+        self.frames[key] = frame
+        return frame
+
+    """
+    # CLOCK eviction: sweep the frames, giving referenced ones a second chance and never touching pinned ones
+    # Dirty frames are only written back once the log is durable up to their LSN, they are passed over until then
+    # Returns the clock slot that was freed, None if the log has to be synced up to unsynced_log first
+    """
+    def evict(self):
+        self.unsynced_log = None
+        for _ in range(2 * len(self.clock)):
+            slot = self.hand
+            self.hand = (self.hand + 1) % len(self.clock)
+            key = self.clock[slot]
+            frame = self.frames[key]
+            if frame.pin_count > 0:
+                continue
+            if frame.referenced:
+                frame.referenced = False
+                continue
+            if frame.dirty:
+                log = frame.table.wal
+                if log is not None and not log.is_durable(frame.lsn):
+                    if self.unsynced_log is None or frame.lsn < self.unsynced_log[1]:
+                        self.unsynced_log = (log, frame.lsn)
+                    continue
+                self.write_back(key, frame)
+            del self.frames[key]
+            self.evictions += 1
+            return slot
+        if self.unsynced_log is not None:
+            return None
+        raise Exception("Bufferpool is full, every frame is pinned")
+
+    def write_back(self, key, frame):
+        frame.table.write_page(*key[1:], frame.page)
+        frame.dirty = False
+        self.writebacks += 1
+
+    """
+    # Writes a single page back if it is dirty, the frame stays cached
+    # The log is synced up to the page LSN first, outside the latch
+    """
+    def flush_page(self, key):
+        while True:
+            with self.latch:
+                frame = self.frames.get(key)
+                if frame is None or not frame.dirty:
+                    return
+                log = frame.table.wal
+                if log is None or log.is_durable(frame.lsn):
+                    self.write_back(key, frame)
+                    return
+                lsn = frame.lsn
+            log.sync(lsn)
+
+    """
+    # Writes back every dirty frame, optionally only those of one table
+    # The latch is taken page by page, so readers and writers are not held up for the whole flush
+    """
+    def flush(self, table_name=None):
+        with self.latch:
+            keys = [key for key, frame in self.frames.items() if frame.dirty and (table_name is None or key[0] == table_name)]
+        for key in keys:
+            self.flush_page(key)
+
+    """
+    # Drops every frame of a table, dirty frames are written back first
+    """
+    def evict_table(self, table_name):
+        self.flush(table_name)
+        with self.latch:
+            self.clock = [key for key in self.clock if key[0] != table_name]
+            self.frames = {key: frame for key, frame in self.frames.items() if key[0] != table_name}
+            self.hand = 0
+
+    """
+    # Drops every frame of a table without writing anything back, for a table that is deleted
+    """
+    def drop_table(self, table_name):
+        with self.latch:
+            self.clock = [key for key in self.clock if key[0] != table_name]
+            self.frames = {key: frame for key, frame in self.frames.items() if key[0] != table_name}
+            self.hand = 0
+
+    def stats(self):
+        with self.latch:
+            return {
+                'frames': len(self.frames),
+                'size': self.size,
+                'pinned': sum(1 for frame in self.frames.values() if frame.pin_count > 0),
+                'dirty': sum(1 for frame in self.frames.values() if frame.dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'writebacks': self.writebacks,
+            }
@@ -0,0 +1,158 @@
+"""
+Lightweight compression of one column page (at most RECORDS_PER_PAGE int64 slots), used for the base pages of cold
+page ranges, see DiskManager.pack_range. The codec is chosen by the shape of the data, whichever encodes the page
+in the fewest bytes:
+
+    RAW     the slots as they are
+    FOR     frame of reference: the minimum, then every value minus it bit-packed at the width of the largest
+            difference, small integers take a few bits each. Widths are rounded up to 1, 2, 4, 8, 16, 32 or 64 bits
+            so pages decode through array and a per-byte lookup table instead of bit by bit in Python
+    DELTA   the first value, then the differences between neighbours frame-of-reference encoded; sequential RID
+            and indirection columns pack to a handful of bytes
+    RLE     (value, run length) pairs, for low-cardinality columns such as the schema encoding or the time of a
+            bulk load; aggregates can reduce the runs without decoding them, see runs
+
+    blob    codec, number of values, then the codec's fields
+"""
+from array import array
+from itertools import accumulate, chain, groupby
+import struct
+
+RAW, FOR, DELTA, RLE = range(4)
+HEADER_FORMAT = '<BH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FOR_FORMAT = '<qB' # reference, bit width
+DELTA_FORMAT = '<qqB' # first value, reference of the differences, bit width
+RUNS_FORMAT = '<H' # number of runs, then the run values (int64) and lengths (uint16)
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+WIDTHS = (0, 1, 2, 4, 8, 16, 32, 64)
+TYPECODES = {8: 'B', 16: 'H', 32: 'I', 64: 'Q'}
+# sub-byte widths: byte -> the values packed in it, lowest bits first
+BYTE_VALUES = {width: [tuple((byte >> shift) & ((1 << width) - 1) for shift in range(0, 8, width)) for byte in range(256)] for width in (1, 2, 4)}
+
+
+"""
+# Smallest supported width holding every offset below 1 << bits
+"""
+def round_width(bits):
+    return next(width for width in WIDTHS if width >= bits)
+
+
+def pack_bits(offsets, width):
+    if width == 0:
+        return b''
+    if width in TYPECODES:
+        return array(TYPECODES[width], offsets).tobytes()
+    packed = 0
+    for offset in reversed(offsets): # the first value ends up in the lowest bits
+        packed = (packed << width) | offset
+    return packed.to_bytes(packed_size(len(offsets), width), 'little')
+
+
+def unpack_bits(data, count, width):
+    if width == 0:
+        return [0] * count
+    if width in TYPECODES:
+        offsets = array(TYPECODES[width])
+        offsets.frombytes(data[:packed_size(count, width)])
+        return offsets
+    return list(chain.from_iterable(map(BYTE_VALUES[width].__getitem__, data[:packed_size(count, width)])))[:count]
+
+
+def packed_size(count, width):
+    return (count * width + 7) // 8
+
+
+"""
+# Encodes a page's values (raw int64 slot values, NULL sentinels included) with the codec that takes the least room
+"""
+def encode(values):
+    values = list(values)
+    count = len(values)
+    header = struct.pack(HEADER_FORMAT, RAW, count)
+    if count == 0:
+        return header
+
+    # estimate every codec's size from the data's shape, then encode only the smallest
+    sizes = {RAW: 8 * count}
+    reference = min(values)
+    for_width = round_width((max(values) - reference).bit_length())
+    sizes[FOR] = struct.calcsize(FOR_FORMAT) + packed_size(count, for_width)
+    deltas = [after - before for before, after in zip(values, values[1:])]
+    delta_reference = min(deltas, default=0)
+    delta_bits = (max(deltas, default=0) - delta_reference).bit_length()
+    if INT64_MIN <= delta_reference <= INT64_MAX and delta_bits <= 64:
+        delta_width = round_width(delta_bits)
+        sizes[DELTA] = struct.calcsize(DELTA_FORMAT) + packed_size(count - 1, delta_width)
+    runs = [(value, len(list(run))) for value, run in groupby(values)]
+    sizes[RLE] = struct.calcsize(RUNS_FORMAT) + 10 * len(runs)
+    codec = min(sizes, key=lambda codec: (sizes[codec], codec))
+
+    header = struct.pack(HEADER_FORMAT, codec, count)
+    if codec == FOR:
+        return header + struct.pack(FOR_FORMAT, reference, for_width) + pack_bits([value - reference for value in values], for_width)
+    if codec == DELTA:
+        offsets = [delta - delta_reference for delta in deltas]
+        return header + struct.pack(DELTA_FORMAT, values[0], delta_reference, delta_width) + pack_bits(offsets, delta_width)
+    if codec == RLE:
+        return (header + struct.pack(RUNS_FORMAT, len(runs)) + array('q', [value for value, length in runs]).tobytes()
+                + array('H', [length for value, length in runs]).tobytes())
+    return header + array('q', values).tobytes()
+
+
+def codec(blob):
+    return struct.unpack_from(HEADER_FORMAT, blob)[0]
+
+
+"""
+# Returns the values of a blob as an array('q')
+"""
+def decode(blob):
+    codec, count = struct.unpack_from(HEADER_FORMAT, blob)
+    body = memoryview(blob)[HEADER_SIZE:]
+    if codec == RAW:
+        values = array('q')
+        values.frombytes(body[:8 * count])
+        return values
+    if codec == FOR:
+        reference, width = struct.unpack_from(FOR_FORMAT, body)
+        if width == 0:
+            return array('q', [reference]) * count
+        offsets = unpack_bits(body[struct.calcsize(FOR_FORMAT):], count, width)
+        return array('q', [reference + offset for offset in offsets])
+    if codec == DELTA:
+        first, reference, width = struct.unpack_from(DELTA_FORMAT, body)
+        if width == 0 and reference != 0:
+            return array('q', range(first, first + count * reference, reference))
+        offsets = unpack_bits(body[struct.calcsize(DELTA_FORMAT):], count - 1, width)
+        return array('q', accumulate(chain((first,), [reference + offset for offset in offsets])))
+    values = array('q')
+    for value, length in runs(blob):
+        values.extend(array('q', [value]) * length)
+    return values
+
+
+"""
+# Returns (first value, step) if a blob holds an arithmetic sequence (a DELTA blob of constant differences), else None
+"""
+def sequence(blob):
+    if codec(blob) != DELTA:
+        return None
+    first, reference, width = struct.unpack_from(DELTA_FORMAT, blob, HEADER_SIZE)
+    return (first, reference) if width == 0 else None
+
+
+"""
+# Returns the (value, length) runs of an RLE blob, None for the other codecs
+"""
+def runs(blob):
+    if codec(blob) != RLE:
+        return None
+    (num_runs,) = struct.unpack_from(RUNS_FORMAT, blob, HEADER_SIZE)
+    start = HEADER_SIZE + struct.calcsize(RUNS_FORMAT)
+    values = array('q')
+    values.frombytes(blob[start:start + 8 * num_runs])
+    lengths = array('H')
+    lengths.frombytes(blob[start + 8 * num_runs:start + 10 * num_runs])
+    return list(zip(values, lengths))
@@ -1,145 +1,240 @@
 from lstore.table import Table, Record
-import pandas as pd
-import csv
+from lstore.disk import DiskManager
+from lstore.bufferpool import BufferPool
+from lstore.metrics import SamplingProfiler
+from lstore.wal import WriteAheadLog, recovery_tables
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 import os
 import logging
-import random
-import struct
-import pickle
+import shutil
+import threading
+
+"""
+Database layout under its path:
+
+    catalog.txt                 names of the tables, one per line
+    tables/<name>/              one directory per table: table_info.txt (name, number of columns, key column), the
+                                page range files and the page directory and index snapshots
+    wal/                        write-ahead log shared by the tables, see lstore/wal.py
+
+Opening a database reads the catalog only; a table is loaded on its first get_table. Tables are loaded, flushed and
+closed independently, several at a time on a thread pool.
+"""
+CATALOG_FILE = 'catalog.txt'
+TABLES_DIRECTORY = 'tables'
+TABLE_INFO_FILE = 'table_info.txt'
+PAGE_DIRECTORY_FILE = 'page_directory.txt'
+INDEX_FILE = 'index.txt'
+INDEX_DELTA_FILE = 'index.delta'
+
 
-pathway = ""
 class Database():
 
-    def __init__(self, bufferpool_size = 10):
-        self.tables = {}
-        self.dirty_pages = set() # Set of page names that have been modified
-        self.pinned_pages = set() # Dictionary of page names to pin count
-        '''
-        self.pinned_values = {}
-        '''
-        self.bufferpool = []   # Fixed-size list of pages in memory for simplicity
+    """
+    :param bufferpool_size: int     #Number of 4KB page frames shared by all tables
+    :param sync_policy: string      #When commits are fsynced to the write-ahead log: 'commit', 'interval' or 'none'
+    :param checkpoint_interval: float   #Seconds between two background checkpoints, None to only checkpoint on close
+    :param compression: bool        #Pack the base pages of cold page ranges into compressed files, see Table.compress_cold_ranges
+    :param workers: int             #Threads loading, flushing and closing tables in parallel
+    """
+    def __init__(self, bufferpool_size = 4096, sync_policy = 'commit', checkpoint_interval = 5.0, compression = True, workers = 4):
+        self.tables = {} # open tables, name -> Table
+        self.catalog = [] # names of every table of the database, open or not
+        self.catalog_latch = threading.RLock() # serializes creating, dropping and opening tables
+        self.sync_policy = sync_policy
+        self.wal = None # write-ahead log of the database, opened by open
+        self.checkpoint_interval = checkpoint_interval
+        self.compression = compression
+        self.workers = workers
+        self.checkpoint_latch = threading.Lock() # one checkpoint at a time
+        self.checkpoint_thread = None
+        self.checkpoints_stopped = threading.Event()
+        self.bufferpool = BufferPool(bufferpool_size)
         self.bufferpool_size = bufferpool_size
         self.path = ""
-        self.num_columns = 0
-        self.page_directory_file_path = ""
-        self.index_file_path = ""
-        self.pages_file_path = ""
-        self.table_info_path = ""
-        self.name = ""
+        self.profiler = None # SamplingProfiler while profiling is turned on
 
     def get_path(self):
-        return pathway
+        return self.path
 
-    # Not required for milestone1
+    """
+    # Opens the database at path: reads the catalog and opens the write-ahead log
+    # If the database was not closed, the tables the log holds changes of are loaded and recovered (in parallel),
+    # every other table waits for its first get_table
+    """
     def open(self, path):
         self.path = path
-        pass
-
+        os.makedirs(path, exist_ok=True)
+        self.catalog = self.read_catalog()
+        self.wal = WriteAheadLog(os.path.join(path, 'wal'), self.sync_policy)
+        records = self.wal.records()
+        names = [name for name in sorted(recovery_tables(records)) if name in self.catalog]
+        if names:
+            # replay what was logged since the last checkpoint, then checkpoint so the log is not needed again
+            self.load_tables(names, records)
+            self.checkpoint()
+        self.start_checkpoints()
 
     def close(self):
         try:
-            open(self.page_directory_file_path, 'w').close()
-            with open(self.page_directory_file_path, 'wb') as file:
-                # Serialize and write page directory
-                self.serialize_page_directory(file)
-            
-            open(self.index_file_path, 'w').close()
-            with open(self.index_file_path, 'wb') as file:
-                # Serialize and write index
-                self.serialize_index(file)
-            
-            # Serialize and write pages
-            self.serialize_page_ranges()
+            self.stop_checkpoints()
+            tables = list(self.tables.values())
+            # queued merges finish before the last checkpoint
+            self.parallel(lambda table: table.stop_merge(), tables)
+
+            # Write out the snapshots and the pages changed since the last checkpoint, after which the log is no longer needed
+            self.checkpoint()
+            self.parallel(self.close_table, tables)
+            self.tables = {}
+            self.wal.truncate()
+            self.wal.close()
+            self.wal = None
 
             logging.info(f"Successfully closed database and wrote changes to path: {self.path}")
         except Exception as e:
             logging.error(f"Error closing database at path: {self.path}: {e}")
 
-    def serialize_page_directory(self, file):
-        # Serialize page directory
-        for rid, record in self.tables[self.name].page_directory.items():
-            # Serialize record data
-            serialized_record = self.serialize_record(record)
-            # Write the length of the serialized record
-            file.write(struct.pack('<I', len(serialized_record)))
-            # Write the serialized record
-            file.write(serialized_record)
-
-    def serialize_record(self, record):
-        """
-        Serialize a record to bytes.
-        Modify this function according to the structure of the Record class.
-        """
-        # Encode record attributes to bytes
-        serialized_data = b''
-        serialized_data += struct.pack('<I', record.rid)
-        serialized_data += struct.pack('<I', record.key)
-        # Assuming columns is a list of integers
-        serialized_data += b''.join(struct.pack('<I', column) for column in record.columns)
-        # Encode is_valid flag (assuming it's boolean)
-        serialized_data += struct.pack('<?', record.is_valid)
-        return serialized_data
-
-    def serialize_index(self, file):
-        # Serialize index using pickle
-        serialized_index = pickle.dumps(self.tables[self.name].index)
-        file.write(struct.pack('<I', len(serialized_index)))
-        file.write(serialized_index)
-
-    def serialize_page_ranges(self):
-    # Serialize page ranges manually
-        for page_range in self.tables[self.name].page_ranges:
-        # Serialize base pages
-            for base_page in page_range['base_pages']:
-                for column_name, column_data in base_page.items():
-                    bpage_path = os.path.join(self.path, 'Base' + 'Column_' + column_name[7:] + '.txt')
-                    check = column_data[0]
-
-                    if column_name == "Column_8" or column_name == "Column_9":
-                        with open(bpage_path, 'w') as file:
-                            file.write(','.join(str(item) for item in column_data))
-                    else:
-                        # Encode column data for base pages
-                        serialized_column_data = self.encode_column_data(column_data)
-                        # Write the length of the encoded data
-                        with open(bpage_path, 'wb') as file:
-                            file.write(struct.pack('<I', len(serialized_column_data)))
-                            # Write the encoded data
-                            file.write(serialized_column_data)
-
-        # Serialize tail pages
-            for tail_page in page_range['tail_pages']:
-                for column_name, column_data in tail_page.items():
-                    tpage_path = os.path.join(self.path, 'Tail' + 'Column_' + column_name[7:] + '.txt')
-                    check = column_data[0]
-
-                    if column_name == "Column_8" or column_name == "Column_9":
-                        with open(tpage_path, 'w') as file:
-                            file.write(','.join(str(item) for item in column_data))
-                    else:
-                        # Encode column data for tail pages
-                        serialized_column_data = self.encode_column_data(column_data)
-                        # Write the length of the encoded data
-                        with open(tpage_path, 'wb') as file:
-                            file.write(struct.pack('<I', len(serialized_column_data)))
-                            # Write the encoded data
-                            file.write(serialized_column_data)
-
-    def encode_column_data(self, column_data):
-        encoded_data = b''
-        for item in column_data:
-            if item is None:
-                # Encode None as zero
-                encoded_data += struct.pack('<I', 0)
-            elif item < 0:
-                # Handle negative integers differently
-                encoded_data += struct.pack('<q', item)  # Encode as signed long long integer
-            else:
-                encoded_data += struct.pack('<I', item)
-        
-        return encoded_data
+    def close_table(self, table):
+        self.bufferpool.evict_table(table.name)
+        table.disk.close()
+
+    """
+    # Runs function on every item, on up to workers threads when there is more than one item
+    # Returns the results in item order
+    """
+    def parallel(self, function, items):
+        items = list(items)
+        if len(items) <= 1 or self.workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as pool:
+            return list(pool.map(function, items))
+
+    """
+    # Returns the engine's counters in one dict: per open table the operation counts and latency percentiles, recent
+    # events, merge activity and tail growth per page range, packed page ranges and lock manager conflicts, plus the shared bufferpool
+    # and the catalog and, while it runs, the sampling profiler's hottest locations
+    """
+    def stats(self):
+        stats = {'bufferpool': self.bufferpool.stats(), 'tables': {}, 'catalog': {'tables': len(self.catalog), 'open': sorted(self.tables)}}
+        if self.wal is not None:
+            stats['wal'] = dict(self.wal.stats, checkpoint_lsn=self.wal.checkpoint_lsn, last_lsn=self.wal.last_lsn(), segments=len(self.wal.segments))
+        for name, table in self.tables.items():
+            table_stats = table.metrics.stats()
+            table_stats['merge'] = table.merge_metrics()
+            table_stats['locks'] = table.lock_manager.stats()
+            table_stats['records'] = len(table.page_directory)
+            if table.disk is not None:
+                table_stats['compression'] = table.disk.packed_stats()
+            stats['tables'][name] = table_stats
+        if self.profiler is not None:
+            stats['profile'] = self.profiler.report()
+        return stats
+
+    """
+    # Turns the sampling profiler on or off at runtime, stop_profiler returns what it collected
+    """
+    def start_profiler(self, interval=0.005):
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+
+    def stop_profiler(self):
+        if self.profiler is None:
+            return None
+        self.profiler.stop()
+        report = self.profiler.report()
+        self.profiler = None
+        return report
+
+    """
+    # Fuzzy checkpoint: makes every change logged so far durable in the page and snapshot files, so the log before
+    # it can be dropped, without stopping the writers for longer than the snapshots take
+    # With the table latches held (every change is logged and applied under its table's latch) the page directory
+    # and index snapshots are written and the log begins a new segment; its last LSN is the begin LSN. The pages
+    # dirtied so far are then written out next to the running writers, and the checkpoint record is logged
+    # Returns the LSN of the checkpoint record
+    """
+    def checkpoint(self):
+        with self.checkpoint_latch:
+            start = perf_counter()
+            writebacks = self.bufferpool.writebacks
+            tables = [self.tables[name] for name in sorted(self.tables)]
+            for table in tables:
+                table.latch.acquire()
+            try:
+                self.parallel(self.write_snapshots, tables)
+                begin_lsn = self.wal.begin_checkpoint()
+            finally:
+                for table in tables:
+                    table.latch.release()
+            self.parallel(lambda table: table.flush(), tables)
+            lsn = self.wal.end_checkpoint(begin_lsn)
+            elapsed = perf_counter() - start
+            for table in tables:
+                table.metrics.observe('checkpoint', elapsed)
+                table.metrics.event('checkpoint', begin_lsn=begin_lsn, pages_written=self.bufferpool.writebacks - writebacks, seconds=round(elapsed, 6))
+            # page ranges left alone since the previous checkpoint are cold now
+            for table in tables:
+                table.compress_cold_ranges()
+            return lsn
+
+    """
+    # Background checkpoints every checkpoint_interval seconds, skipped while nothing is logged
+    """
+    def start_checkpoints(self):
+        if self.checkpoint_interval is None or self.checkpoint_thread is not None:
+            return
+        self.checkpoints_stopped.clear()
+        self.checkpoint_thread = threading.Thread(target=self.checkpoint_periodically, daemon=True)
+        self.checkpoint_thread.start()
+
+    def stop_checkpoints(self):
+        if self.checkpoint_thread is None:
+            return
+        self.checkpoints_stopped.set()
+        self.checkpoint_thread.join()
+        self.checkpoint_thread = None
+
+    def checkpoint_periodically(self):
+        checkpointed = self.wal.last_lsn()
+        while not self.checkpoints_stopped.wait(self.checkpoint_interval):
+            if self.wal.last_lsn() == checkpointed:
+                continue
+            try:
+                checkpointed = self.checkpoint()
+            except Exception as e:
+                for table in list(self.tables.values()):
+                    table.metrics.error('checkpoint', e)
+
+    """
+    # Snapshots are only rewritten when they changed, for the indexes only the changes are, see lstore/snapshot.py
+    """
+    def write_snapshots(self, table):
+        table.page_directory.write_snapshot(os.path.join(table.path, PAGE_DIRECTORY_FILE))
+        table.index.write_snapshot(os.path.join(table.path, INDEX_FILE), os.path.join(table.path, INDEX_DELTA_FILE))
+
+    def table_path(self, name):
+        return os.path.join(self.path, TABLES_DIRECTORY, name)
+
+    def read_catalog(self):
+        catalog_path = os.path.join(self.path, CATALOG_FILE)
+        if not os.path.exists(catalog_path):
+            return []
+        with open(catalog_path) as file:
+            return [line.strip() for line in file if line.strip()]
+
+    """
+    # Replaces the catalog file in one rename, so a crash leaves either the old or the new catalog
+    """
+    def write_catalog(self):
+        catalog_path = os.path.join(self.path, CATALOG_FILE)
+        with open(catalog_path + '.tmp', 'w') as file:
+            file.write(''.join(f'{name}\n' for name in self.catalog))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(catalog_path + '.tmp', catalog_path)
 
-        
     """
     # Creates a new table
     :param name: string         #Table name
@@ -147,265 +242,106 @@ class Database():
     :param key: int             #Index of table key in columns
     """
     def create_table(self, name, num_columns, key):
-        if name in self.tables:
-            raise Exception(f"Table {name} already exists")
-        self.tables[name] = Table(name, num_columns, key)
-        self.name = name
-        self.num_columns = num_columns
-        if self.path == "":
-            self.path = './ECS165'
-            global pathway
-            pathway = self.path
-        self.page_directory_file_path = os.path.join(self.path, 'page_directory.txt')
-        self.index_file_path = os.path.join(self.path, 'index.txt')
-        self.table_info_path = os.path.join(self.path, 'table_info.txt')
-
-        # Write table information to table_info.txt
-        with open(self.table_info_path, 'w') as file:
-            table_info = [name, num_columns, key]
-            file.write(','.join(map(str, table_info)))
-        '''
-        add to self.pinned_values {name : pin value}, initialize to 0
-        self.pinned_values[name] = 0
-        '''
-        return self.tables[name]
+        with self.catalog_latch:
+            if self.wal is None:
+                self.open(self.path or './ECS165')
+            if name in self.catalog:
+                raise Exception(f"Table {name} already exists")
+            if name in ('', '.', '..') or os.path.basename(name) != name:
+                raise Exception(f"Invalid table name {name}")
+            # a directory left by a drop interrupted after the catalog was written holds nothing of this table
+            shutil.rmtree(self.table_path(name), ignore_errors=True)
+            table = Table(name, num_columns, key)
+            self.attach_table(table)
+
+            # Write table information to its table_info.txt, then list the table in the catalog
+            with open(os.path.join(table.path, TABLE_INFO_FILE), 'w') as file:
+                table_info = [name, num_columns, key]
+                file.write(','.join(map(str, table_info)))
+            self.catalog.append(name)
+            self.write_catalog()
+            self.tables[name] = table
+            return table
+
+    def attach_table(self, table):
+        # every table shares the database bufferpool and the write-ahead log and persists under its own directory
+        table.path = self.table_path(table.name)
+        os.makedirs(table.path, exist_ok=True)
+        table.disk = DiskManager(table.path, table.name)
+        table.bufferpool = self.bufferpool
+        table.compression = self.compression
+        table.wal = self.wal
 
     """
-    # Deletes the specified table
+    # Deletes the specified table and its files
     """
     def drop_table(self, name):
-        if name in self.tables:
-            del self.tables[name] # delete the table from the database tables list
-
-        raise Exception(f"Table {name} doesn't exist")
+        with self.catalog_latch:
+            if name not in self.catalog:
+                raise Exception(f"Table {name} doesn't exist")
+            table = self.tables.pop(name, None)
+            with self.checkpoint_latch: # a running checkpoint may be writing the table out
+                if table is not None:
+                    table.stop_merge()
+                    self.bufferpool.drop_table(name)
+                    table.disk.close()
+                self.catalog.remove(name)
+                self.write_catalog()
+                shutil.rmtree(self.table_path(name), ignore_errors=True)
+        # the log must not replay the dropped table's changes into a later table of the same name
+        self.checkpoint()
 
     """
-    # Returns table with the passed name
+    # Returns table with the passed name, loading it on first use
     """
-    
     def get_table(self, name):
-        self.table_info_path = os.path.join(self.path, 'table_info.txt')
-        with open(self.table_info_path, 'r') as file:
-            table_info_str = file.read().strip()  # Read the content and remove leading/trailing whitespace
-            name, num_columns, key = table_info_str.split(',')  # Split the string by comma to get individual components
-            num_columns = int(num_columns)  # Convert num_columns and key to integers
-            self.num_columns = num_columns
-            key = int(key)
-        
-        if name in self.tables:
-            raise Exception(f"Table {name} already exists")
-        self.tables[name] = Table(name, num_columns, key)
-        self.name = name
-
-        self.page_directory_file_path = os.path.join(self.path, 'page_directory.txt')
-        self.index_file_path = os.path.join(self.path, 'index.txt')
+        return self.get_tables(name)[0]
 
-        try:
-            with open(self.page_directory_file_path, 'rb') as file:
-                # Deserialize and write page directory
-                self.deserialize_page_directory(file)
-
-            with open(self.index_file_path, 'rb') as file:
-                # Deserialize and write index
-                self.deserialize_index(file)
+    """
+    # Returns the tables with the passed names, those not open yet are loaded in parallel
+    """
+    def get_tables(self, *names):
+        with self.catalog_latch:
+            if self.wal is None:
+                self.open(self.path or './ECS165')
+            for name in names:
+                if name not in self.catalog:
+                    raise Exception(f"Table {name} doesn't exist")
+            self.load_tables([name for name in dict.fromkeys(names) if name not in self.tables])
+            return [self.tables[name] for name in names]
 
-            self.deserialize_base_pages()
-            self.deserialize_tail_pages()
+    """
+    # Loads tables from their directories in parallel and adds them to the open tables
+    # :param records: the write-ahead log's records if the tables have changes to recover, else None
+    """
+    def load_tables(self, names, records=None):
+        for table in self.parallel(lambda name: self.load_table(name, records), names):
+            self.tables[table.name] = table
 
-            logging.info(f"Successfully opened database and wrote changes to path: {self.path}")
-        except Exception as e:
-            logging.error(f"Error opening database at path: {self.path}: {e}")
+    def load_table(self, name, records=None):
+        with open(os.path.join(self.table_path(name), TABLE_INFO_FILE), 'r') as file:
+            table_info_str = file.read().strip()  # Read the content and remove leading/trailing whitespace
+            name, num_columns, key = table_info_str.split(',')  # Split the string by comma to get individual components
+        table = Table(name, int(num_columns), int(key))
+        self.attach_table(table)
 
-        # Return the table object
-        return self.tables[self.name]
-    
-    def deserialize_page_directory(self, file):
-        # Deserialize page directory
-        while True:
-            # Read the length of the serialized record
-            length_bytes = file.read(4)
-            if not length_bytes:
-                break  # No more data to read
-            length = struct.unpack('<I', length_bytes)[0]
-            # Read the serialized record
-            serialized_record = file.read(length)
-            # Deserialize the record
-            record = self.deserialize_record(serialized_record)
-            # Add the record to the page directory
-            self.tables[self.name].page_directory[record.rid] = record
-
-    def deserialize_record(self, serialized_record):
-        """
-        Deserialize a record from bytes.
-        Modify this function according to the structure of the Record class.
-        """
-        # Decode record attributes from bytes
-        # Assuming columns is a list of integers
-        rid, key, col1, col2, col3, col4, col5, is_valid = struct.unpack('<IIIIIII?', serialized_record)
-        columns = (col1, col2, col3, col4, col5)
-        return Record(rid, key, columns)
-    
-    def deserialize_index(self, file):
-        # Deserialize index
-        length_bytes = file.read(4)
-        if length_bytes:
-            length = struct.unpack('<I', length_bytes)[0]
-            serialized_index = file.read(length)
-            self.tables[self.name].index = pickle.loads(serialized_index)
-
-    def deserialize_base_pages(self):
-        file_paths = []
-        for i in range(0, self.num_columns + 4):
-            file_path = os.path.join(self.path, 'Base' + f'Column_{i + 1}' + '.txt')
-            file_paths.append(file_path)
-        # Deserialize pages
-        all_records = []
-        for file_path in file_paths:
-            column_number = file_paths.index(file_path) + 1
-            if column_number != self.num_columns + 3 and column_number != self.num_columns + 4:
-                with open(file_path, 'rb') as file:
-                    serialized_column_data = file.read()
-                    column_data = self.decode_column_data(serialized_column_data)
-                    all_records.append(column_data)
-            else:
-                with open(file_path, 'r') as file:
-                    column_data = file.read().strip().split(',')
-                    all_records.append(column_data)
-                
-        # Transpose the list of records to group them by index
-        grouped_records = list(zip(*all_records))
-        for i in grouped_records:
-            self.tables[self.name].Bpage_insert(i)
-    
-    def deserialize_tail_pages(self):
-        file_paths = []
-        for i in range(0, self.num_columns + 4):
-            file_path = os.path.join(self.path, 'Tail' + f'Column_{i + 1}' + '.txt')
-            file_paths.append(file_path)
-        # Deserialize pages
-        all_records = []
-        for file_path in file_paths:
-            column_number = file_paths.index(file_path) + 1
-            if column_number != self.num_columns + 3 and column_number != self.num_columns + 4:
-                with open(file_path, 'rb') as file:
-                    serialized_column_data = file.read()
-                    column_data = self.decode_column_data(serialized_column_data)
-                    all_records.append(column_data)
-            else:
-                with open(file_path, 'r') as file:
-                    column_data = file.read().strip().split(',')
-                    all_records.append(column_data)
-                
-        # Transpose the list of records to group them by index
-        grouped_records = list(zip(*all_records))
-
-    def decode_column_data(self, serialized_column_data):
-        """
-        Decode column data from bytes.
-        Modify this function according to the data types and encoding scheme used.
-        """
-        decoded_data = []
-        # Assuming all items are integers
-        num_items = len(serialized_column_data) // 4  # Assuming each item is 4 bytes
-        for i in range(num_items):
-            item = struct.unpack('<I', serialized_column_data[i * 4:(i + 1) * 4])[0]
-            decoded_data.append(item)
-        return decoded_data
-
-    def pin_page(self, table_name):
-        # Mark a page as pinned to prevent it from being evicted
-        if table_name in self.bufferpool:
-            self.pinned_pages.add(table_name)
-
-    def unpin_page(self, table_name):
-        self.pinned_pages.discard(table_name)
-
-    def mark_page_dirty(self, page_name):
-        if page_name in self.bufferpool:
-            self.dirty_pages.add(self.bufferpool[page_name])
-
-    def flush_dirty_pages(self):
-        for page_name in self.dirty_pages:
-            # Write the page back to disk
-            self.write_page_to_disk(page_name)
-        # Clear the set of dirty pages after flushing
-        self.dirty_pages.clear()
-    
-    def access_table(self, table_name):
-        if table_name not in self.bufferpool:
-            if len(self.bufferpool) >= self.bufferpool_size:
-                self.evict_page()  # Evict a page if the bufferpool is full
-            self.bufferpool.append(table_name)
-            self.dirty_pages.add(table_name)  # Mark the page as dirty
-
-    def evict_page(self):
-    # Check if there's any page to evict
-        if not self.bufferpool:
-            return  # No pages to evict
-    
-    # Randomly select a page to evict
-        evicted_page_name = random.choice(list(self.bufferpool.keys()))
-        evicted_page_content = self.bufferpool.pop(evicted_page_name)
-
-        if evicted_page_name in self.dirty_pages:
-            self.write_back_to_disk(evicted_page_content)
-            self.dirty_pages.remove(evicted_page_name)
-
-
-    def read_from_disk(self, file_path):
         try:
-        # Check if the file exists
-            if not os.path.isfile(file_path):
-                raise FileNotFoundError(f"File {file_path} not found")
-
-        # Open the file for reading
-            with open(file_path, mode='r') as file:
-                reader = csv.reader(file, delimiter='\t')
-
-            # Initialize variables to store page name and content
-                page_name = None
-                page_content = []
-
-            # Iterate through each row in the file
-                for row in reader:
-                # Check if the row contains the marker for page break
-                    if row == ['#PAGE_BREAK']:
-                    # Add the page content to the bufferpool
-                        self.bufferpool[page_name] = page_content
-
-                    # Reset variables for the next page
-                        page_name = None
-                        page_content = []
-                    else:
-                    # If not a page break marker, add the row to page content
-                        if page_name is None:
-                            page_name = row[0]  # Set the page name
-                        else:
-                            page_content.append(row)  # Add row to page content
-
-            # print("Data read from disk successfully.")
+            has_index = table.index.read_snapshot(os.path.join(table.path, INDEX_FILE), os.path.join(table.path, INDEX_DELTA_FILE))
+            table.load_pages()
+            if records is not None:
+                # the database was not closed: replay what was logged since the last checkpoint, recovery rebuilds
+                # the page directory and the indexes (of the kinds in the snapshot) from the replayed pages
+                replayed = table.recover(records)
+                table.metrics.event('recovered', records=replayed)
+            else:
+                if not has_index:
+                    table.index.rebuild()
+                if not table.page_directory.read_snapshot(os.path.join(table.path, PAGE_DIRECTORY_FILE)):
+                    table.page_directory.rebuild()
 
+            logging.info(f"Successfully opened table {name} at path: {table.path}")
         except Exception as e:
-            print(f"Error reading data from disk: {e}")
-            
-    
-    def save_table_to_disk(self, table_name):
-        if table_name in self.tables:
-            table = self.tables[table_name]
-            file_path = os.path.join(self.path, table_name + '.csv')
-            table.save_to_csv(file_path)
-
-    
-    def write_page_to_disk(self, file_path, page):
-        try:
-        # Check if the bufferpool is empty
-            self.path = os.path.join(self.path, file_path + '.csv')
-            with open(self.path, 'w', newline='') as file:
-                writer = csv.writer(file)
-                for row in page:
-                    writer.writerow(row)
-                    # Add page delimiter after each page
-                    writer.writerow(['#PAGE_BREAK'])
+            logging.error(f"Error opening table {name} at path: {table.path}: {e}")
 
-        except Exception as e:
-            print(f"Error writing data to disk: {e}")
+        # Return the table object
+        return table
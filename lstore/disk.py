@@ -0,0 +1,443 @@
+from lstore.page import Page, PAGE_SIZE, RECORDS_PER_PAGE
+from lstore import compression
+from array import array
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+"""
+Page range file format (version 2), one file per page range and kind ('base' or 'tail'):
+
+    block 0                 header: magic, format version, kind, columns per page, records per page,
+                            offset, length and crc32 of the footer
+    block 1 + p * C + c     column c of page p, PAGE_SIZE bytes of packed int64 slots (C = columns per page); the
+                            schema encoding column holds bitmasks and the time column epoch nanoseconds
+    footer                  directory written after the last page block on every flush: magic, number of pages,
+                            TPS of the range and the record count of every page
+
+New pages are appended over the old footer and a new footer is written behind them on the next flush.
+
+The base pages of a cold page range (full and no longer written, see Table.compress_cold_ranges) are moved into one
+packed file instead, every column page compressed on its own (see lstore/compression.py):
+
+    header                  PACKED_HEADER_SIZE bytes: magic, format version, columns per page, offset, length and
+                            crc32 of the footer
+    blobs                   encoded column pages, back to back
+    footer                  magic, number of pages, TPS, the record count of every page, then the offset and length
+                            of the blob of every (page, column)
+
+The file is append-only: a rewritten page is encoded again and appended, a flush appends a new footer, fsyncs and
+only then points the header at it, so the header always names a complete directory. Once the superseded blobs and
+footers outweigh the live ones the file is compacted into a fresh copy.
+"""
+MAGIC = b'LSTP'
+FOOTER_MAGIC = b'LSTF'
+FORMAT_VERSION = 2 # version 1 stored schema encodings as binary strings and times as seconds since midnight
+HEADER_FORMAT = '<4sHHIIQII'
+FOOTER_FORMAT = '<4sIQ'
+KINDS = {'base': 0, 'tail': 1}
+PACKED_MAGIC = b'LSTZ'
+PACKED_HEADER_FORMAT = '<4sHIQII'
+PACKED_HEADER_SIZE = 64
+COMPACT_BYTES = 1 << 16 # superseded bytes a packed file may gather before it is compacted
+
+
+class DiskManager:
+
+    """
+    # Page storage for one table
+    # Existing page range files are memory-mapped so pages are faulted in lazily, one 4KB copy per page touched
+    """
+    def __init__(self, path, table_name):
+        self.path = path
+        self.table_name = table_name
+        self.files = {} # (page_range, kind) -> open file descriptor
+        self.maps = {} # (page_range, kind) -> read-only shared mapping of the file
+        self.extents = {} # (page_range, kind) -> end of the furthest page block written since the file was opened
+        self.packed = {} # page_range -> directory of its packed file, None if its base pages are not packed
+        self.unsynced = set() # (page_range, kind) of the files written since the last sync
+        self.created = [] # directories that gained files since the last sync
+        self.latch = threading.RLock() # mappings are dropped and rebuilt when a footer is rewritten
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+            self.created.append(os.path.dirname(os.path.abspath(self.path)))
+
+    def file_path(self, page_range, kind):
+        return os.path.join(self.path, f'{self.table_name}_range_{page_range}.{kind}')
+
+    def get_file(self, page_range, kind, columns_per_page=0):
+        if (page_range, kind) not in self.files:
+            fd = os.open(self.file_path(page_range, kind), os.O_RDWR | os.O_CREAT, 0o644)
+            self.files[(page_range, kind)] = fd
+            if os.fstat(fd).st_size == 0:
+                self.write_header(fd, kind, columns_per_page, 0, 0, 0)
+                self.unsynced.add((page_range, kind))
+                if self.path not in self.created:
+                    self.created.append(self.path)
+            else:
+                self.check_header(page_range, kind)
+        return self.files[(page_range, kind)]
+
+    def write_header(self, fd, kind, columns_per_page, footer_offset, footer_length, footer_crc):
+        header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, KINDS[kind], columns_per_page, RECORDS_PER_PAGE, footer_offset, footer_length, footer_crc)
+        os.pwrite(fd, header.ljust(PAGE_SIZE, b'\0'), 0)
+
+    def read_header(self, page_range, kind):
+        header = os.pread(self.files[(page_range, kind)], struct.calcsize(HEADER_FORMAT), 0)
+        return struct.unpack(HEADER_FORMAT, header)
+
+    def check_header(self, page_range, kind):
+        magic, version, kind_code, columns_per_page, records_per_page = self.read_header(page_range, kind)[:5]
+        if magic != MAGIC or kind_code != KINDS[kind]:
+            raise Exception(f"{self.file_path(page_range, kind)} is not a {kind} page range file")
+        if version != FORMAT_VERSION or records_per_page != RECORDS_PER_PAGE:
+            raise Exception(f"{self.file_path(page_range, kind)} has unsupported format version {version}")
+
+    def page_offset(self, page_number, column, columns_per_page):
+        return (1 + page_number * columns_per_page + column) * PAGE_SIZE
+
+    """
+    # Writes one column page into its block, new pages always land at the end of the page blocks
+    """
+    def write_page(self, page_range, kind, page_number, column, columns_per_page, page):
+        if kind == 'base' and self.is_packed(page_range):
+            # packed ranges never go back to plain blocks, the page is encoded outside the latch
+            return self.append_blob(page_range, page_number, column, compression.encode(page.view()))
+        offset = self.page_offset(page_number, column, columns_per_page)
+        with self.latch:
+            fd = self.get_file(page_range, kind, columns_per_page)
+            os.pwrite(fd, page.data, offset)
+            self.extents[(page_range, kind)] = max(self.extents.get((page_range, kind), 0), offset + PAGE_SIZE)
+            self.unsynced.add((page_range, kind))
+
+    """
+    # Reads one column page, straight out of the file mapping when the block is mapped
+    """
+    def read_page(self, page_range, kind, page_number, column, columns_per_page, num_records):
+        offset = self.page_offset(page_number, column, columns_per_page)
+        page = Page()
+        blob = self.encoded(page_range, page_number, column) if kind == 'base' else None
+        if blob is not None:
+            values = compression.decode(blob)
+            page.data[:8 * len(values)] = values.tobytes()
+            page.num_records = num_records
+            return page
+        with self.latch:
+            mapping = self.get_map(page_range, kind)
+            if mapping is not None and offset + PAGE_SIZE <= len(mapping):
+                page.data[:] = mapping[offset:offset + PAGE_SIZE]
+            else:
+                # block written after the file was mapped
+                page.data[:] = os.pread(self.get_file(page_range, kind), PAGE_SIZE, offset).ljust(PAGE_SIZE, b'\0')
+        page.num_records = num_records
+        return page
+
+    def get_map(self, page_range, kind):
+        if (page_range, kind) not in self.maps:
+            fd = self.get_file(page_range, kind)
+            size = os.fstat(fd).st_size
+            self.maps[(page_range, kind)] = mmap.mmap(fd, size, access=mmap.ACCESS_READ) if size else None
+        return self.maps[(page_range, kind)]
+
+    """
+    # Writes the footer directory behind the last page block and points the header at it
+    # Pages added after num_records was taken may already be written (a flush running next to writers), the
+    # footer then goes behind them so it neither overwrites nor cuts them off
+    # :param num_records: record count of every page of the file, in page order
+    """
+    def write_directory(self, page_range, kind, columns_per_page, num_records, tps):
+        if kind == 'base' and self.is_packed(page_range):
+            return self.write_packed_directory(page_range, num_records, tps)
+        footer = struct.pack(FOOTER_FORMAT, FOOTER_MAGIC, len(num_records), tps) + array('I', num_records).tobytes()
+        with self.latch:
+            footer_offset = max(self.page_offset(len(num_records), 0, columns_per_page), self.extents.get((page_range, kind), 0))
+            fd = self.get_file(page_range, kind, columns_per_page)
+            # the old mapping could cover bytes the truncate below removes
+            self.drop_map(page_range, kind)
+            os.pwrite(fd, footer, footer_offset)
+            os.ftruncate(fd, footer_offset + len(footer))
+            self.write_header(fd, kind, columns_per_page, footer_offset, len(footer), zlib.crc32(footer))
+            self.unsynced.add((page_range, kind))
+
+    """
+    # Returns (record count of every page, TPS) from the footer, None if the file has no valid footer
+    """
+    def read_directory(self, page_range, kind):
+        if kind == 'base' and self.is_packed(page_range):
+            with self.latch:
+                directory = self.packed[page_range]
+                return list(directory['num_records']), directory['tps']
+        if not os.path.exists(self.file_path(page_range, kind)):
+            return None
+        with self.latch:
+            self.get_file(page_range, kind)
+            footer_offset, footer_length, footer_crc = self.read_header(page_range, kind)[5:]
+            if footer_length == 0:
+                return None
+            footer = self.get_map(page_range, kind)[footer_offset:footer_offset + footer_length]
+        if len(footer) != footer_length or zlib.crc32(footer) != footer_crc:
+            return None
+        magic, num_pages, tps = struct.unpack_from(FOOTER_FORMAT, footer)
+        if magic != FOOTER_MAGIC:
+            return None
+        num_records = array('I')
+        num_records.frombytes(footer[struct.calcsize(FOOTER_FORMAT):])
+        return num_records.tolist(), tps
+
+    """
+    # Number of pages in a file without a usable footer, counted from its size
+    """
+    def num_pages(self, page_range, kind, columns_per_page):
+        if not os.path.exists(self.file_path(page_range, kind)):
+            return 0
+        size = os.path.getsize(self.file_path(page_range, kind)) - PAGE_SIZE
+        return max(-(-size // (columns_per_page * PAGE_SIZE)), 0)
+
+    def num_page_ranges(self):
+        count = 0
+        while os.path.exists(self.file_path(count, 'base')) or os.path.exists(self.file_path(count, 'packed')):
+            count += 1
+        return count
+
+    def drop_map(self, page_range, kind):
+        mapping = self.maps.pop((page_range, kind), None)
+        if mapping is not None:
+            mapping.close()
+
+    def close(self):
+        with self.latch:
+            for key in list(self.maps):
+                self.drop_map(*key)
+            for fd in self.files.values():
+                os.close(fd)
+            self.files = {}
+            self.extents = {}
+            self.packed = {}
+
+    def is_packed(self, page_range):
+        with self.latch:
+            if page_range not in self.packed:
+                self.packed[page_range] = self.read_packed(page_range) if os.path.exists(self.file_path(page_range, 'packed')) else None
+            return self.packed[page_range] is not None
+
+    """
+    # Opens a packed file and returns its directory
+    # A base file left next to it by a crash during install_packed is superseded and removed
+    """
+    def read_packed(self, page_range):
+        path = self.file_path(page_range, 'packed')
+        fd = os.open(path, os.O_RDWR)
+        self.files[(page_range, 'packed')] = fd
+        magic, version, columns_per_page, footer_offset, footer_length, footer_crc = struct.unpack(
+            PACKED_HEADER_FORMAT, os.pread(fd, struct.calcsize(PACKED_HEADER_FORMAT), 0))
+        if magic != PACKED_MAGIC or version != FORMAT_VERSION:
+            raise Exception(f"{path} is not a packed page range file of format version {FORMAT_VERSION}")
+        footer = os.pread(fd, footer_length, footer_offset)
+        if len(footer) != footer_length or zlib.crc32(footer) != footer_crc:
+            raise Exception(f"{path} has a corrupt footer")
+        magic, num_pages, tps = struct.unpack_from(FOOTER_FORMAT, footer)
+        position = struct.calcsize(FOOTER_FORMAT)
+        num_records = array('I')
+        num_records.frombytes(footer[position:position + 4 * num_pages])
+        position += 4 * num_pages
+        num_blobs = num_pages * columns_per_page
+        offsets = array('Q')
+        offsets.frombytes(footer[position:position + 8 * num_blobs])
+        lengths = array('I')
+        lengths.frombytes(footer[position + 8 * num_blobs:position + 12 * num_blobs])
+        blobs = {}
+        for index, (offset, length) in enumerate(zip(offsets, lengths)):
+            blobs[divmod(index, columns_per_page)] = (offset, length)
+
+        base_path = self.file_path(page_range, 'base')
+        if os.path.exists(base_path):
+            self.close_file(page_range, 'base')
+            os.remove(base_path)
+        end = os.fstat(fd).st_size
+        return {'columns_per_page': columns_per_page, 'num_records': num_records.tolist(), 'tps': tps, 'blobs': blobs,
+                'footer': footer_length, 'end': end, 'live': sum(lengths) + footer_length, 'moved': False}
+
+    """
+    # Encodes the base pages of a page range into a new packed file, installed later by install_packed
+    # :param pages: per page, the written values of every column
+    # Returns (bytes of the plain page blocks, bytes of the packed file)
+    """
+    def pack_range(self, page_range, columns_per_page, pages, num_records, tps):
+        path = self.file_path(page_range, 'packed') + '.tmp'
+        blobs = [compression.encode(values) for columns in pages for values in columns]
+        offsets = array('Q')
+        lengths = array('I')
+        position = PACKED_HEADER_SIZE
+        for blob in blobs:
+            offsets.append(position)
+            lengths.append(len(blob))
+            position += len(blob)
+        footer = (struct.pack(FOOTER_FORMAT, FOOTER_MAGIC, len(num_records), tps) + array('I', num_records).tobytes()
+                  + offsets.tobytes() + lengths.tobytes())
+        header = struct.pack(PACKED_HEADER_FORMAT, PACKED_MAGIC, FORMAT_VERSION, columns_per_page, position, len(footer), zlib.crc32(footer))
+        with open(path, 'wb') as file:
+            file.write(header.ljust(PACKED_HEADER_SIZE, b'\0'))
+            for blob in blobs:
+                file.write(blob)
+            file.write(footer)
+            file.flush()
+            os.fsync(file.fileno())
+        return len(pages) * columns_per_page * PAGE_SIZE, position + len(footer)
+
+    """
+    # Makes the packed file written by pack_range the page range's base pages and removes its base file
+    """
+    def install_packed(self, page_range):
+        path = self.file_path(page_range, 'packed')
+        with self.latch:
+            os.replace(path + '.tmp', path)
+            self.sync_directory()
+            self.extents.pop((page_range, 'base'), None)
+            self.packed[page_range] = self.read_packed(page_range)
+
+    def discard_packed(self, page_range):
+        path = self.file_path(page_range, 'packed') + '.tmp'
+        if os.path.exists(path):
+            os.remove(path)
+
+    """
+    # Makes the pages, footers and headers written since the last sync durable, and the files created meanwhile
+    # Log records of those writes may only be dropped afterwards, see Database.checkpoint
+    # The files are fsynced through duplicated descriptors, outside the latch so page reads are not held up
+    """
+    def sync(self):
+        with self.latch:
+            fds = [os.dup(self.files[key]) for key in self.unsynced if key in self.files]
+            self.unsynced = set()
+            created, self.created = self.created, []
+        for fd in fds:
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for path in created:
+            self.sync_directory(path)
+
+    def sync_directory(self, path=None):
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(path or self.path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close_file(self, page_range, kind):
+        self.drop_map(page_range, kind)
+        fd = self.files.pop((page_range, kind), None)
+        if fd is not None:
+            os.close(fd)
+
+    """
+    # Returns the encoded blob of one base column page of a packed range, None if the range is not packed
+    """
+    def encoded(self, page_range, page_number, column):
+        if not self.is_packed(page_range):
+            return None
+        with self.latch:
+            offset, length = self.packed[page_range]['blobs'][(page_number, column)]
+            return os.pread(self.files[(page_range, 'packed')], length, offset)
+
+    def append_blob(self, page_range, page_number, column, blob):
+        with self.latch:
+            directory = self.packed[page_range]
+            os.pwrite(self.files[(page_range, 'packed')], blob, directory['end'])
+            old = directory['blobs'].get((page_number, column))
+            directory['live'] += len(blob) - (old[1] if old else 0)
+            directory['blobs'][(page_number, column)] = (directory['end'], len(blob))
+            directory['end'] += len(blob)
+            directory['moved'] = True
+            self.unsynced.add((page_range, 'packed'))
+
+    """
+    # Packed page ranges with pages written since their footer was, the next flush has to write their footer
+    """
+    def moved_directories(self):
+        with self.latch:
+            return [page_range for page_range, directory in self.packed.items() if directory is not None and directory['moved']]
+
+    """
+    # Appends a footer naming the current blobs and points the header at it once both are durable
+    """
+    def write_packed_directory(self, page_range, num_records, tps):
+        with self.latch:
+            directory = self.packed[page_range]
+            directory['num_records'] = list(num_records)
+            directory['tps'] = tps
+            directory['moved'] = False
+            if directory['end'] - directory['live'] > max(COMPACT_BYTES, directory['live']):
+                return self.compact(page_range)
+            fd = self.files[(page_range, 'packed')]
+            footer = self.packed_footer(directory)
+            offset = directory['end']
+            os.pwrite(fd, footer, offset)
+            os.fsync(fd)
+            header = struct.pack(PACKED_HEADER_FORMAT, PACKED_MAGIC, FORMAT_VERSION, directory['columns_per_page'], offset, len(footer), zlib.crc32(footer))
+            os.pwrite(fd, header, 0)
+            self.unsynced.add((page_range, 'packed'))
+            directory['live'] += len(footer) - directory['footer']
+            directory['footer'] = len(footer)
+            directory['end'] += len(footer)
+
+    def packed_footer(self, directory):
+        columns_per_page = directory['columns_per_page']
+        keys = [(page_number, column) for page_number in range(len(directory['num_records'])) for column in range(columns_per_page)]
+        return (struct.pack(FOOTER_FORMAT, FOOTER_MAGIC, len(directory['num_records']), directory['tps'])
+                + array('I', directory['num_records']).tobytes()
+                + array('Q', [directory['blobs'][key][0] for key in keys]).tobytes()
+                + array('I', [directory['blobs'][key][1] for key in keys]).tobytes())
+
+    """
+    # Rewrites a packed file with only its live blobs, superseded pages and footers are dropped
+    """
+    def compact(self, page_range):
+        with self.latch:
+            directory = self.packed[page_range]
+            fd = self.files[(page_range, 'packed')]
+            columns_per_page = directory['columns_per_page']
+            pages = []
+            for page_number in range(len(directory['num_records'])):
+                columns = []
+                for column in range(columns_per_page):
+                    offset, length = directory['blobs'][(page_number, column)]
+                    columns.append(os.pread(fd, length, offset))
+                pages.append(columns)
+            path = self.file_path(page_range, 'packed')
+            offsets = {}
+            position = PACKED_HEADER_SIZE
+            with open(path + '.tmp', 'wb') as file:
+                file.write(b'\0' * PACKED_HEADER_SIZE)
+                for page_number, columns in enumerate(pages):
+                    for column, blob in enumerate(columns):
+                        file.write(blob)
+                        offsets[(page_number, column)] = (position, len(blob))
+                        position += len(blob)
+                directory['blobs'] = offsets
+                footer = self.packed_footer(directory)
+                file.write(footer)
+                file.seek(0)
+                file.write(struct.pack(PACKED_HEADER_FORMAT, PACKED_MAGIC, FORMAT_VERSION, columns_per_page, position, len(footer), zlib.crc32(footer)))
+                file.flush()
+                os.fsync(file.fileno())
+            self.close_file(page_range, 'packed')
+            os.replace(path + '.tmp', path)
+            self.sync_directory()
+            self.packed[page_range] = self.read_packed(page_range)
+
+    """
+    # Packed page ranges and their size on disk
+    """
+    def packed_stats(self):
+        with self.latch:
+            directories = [directory for directory in self.packed.values() if directory is not None]
+            return {
+                'ranges': len(directories),
+                'bytes': sum(directory['end'] for directory in directories),
+                'live_bytes': sum(directory['live'] for directory in directories),
+            }
@@ -1,67 +1,572 @@
 """
 A data strucutre holding indices for various columns of a table. Key column should be indexd by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
+from lstore.snapshot import read_snapshot, write_snapshot, remove_snapshot, COMPACTION_RATIO
+from lstore.bitmap import Bitmap, BITSET_BYTES
+from bisect import bisect_left, bisect_right, insort
+from array import array
+import heapq
+import logging
+
+
+class OrderedIndex:
+
+    """
+    # Ordered map from column value to the list of RIDs holding it
+    # Keys are kept sorted in fixed-size chunks (the leaf level of a B+ tree) with a list of chunk maxima on top,
+    # so a range scan costs a bisect plus the number of matching keys, not the numeric width of the range
+    # An index reopened from a snapshot keeps its entries in flat sorted arrays (the frozen layer), a value moves
+    # into the chunks (is thawed) the first time it is modified
+    """
+    base_arrays = 3 # snapshot arrays of a base and of a delta
+    delta_arrays = 4
+
+    def __init__(self, chunk_size=512):
+        self.chunk_size = chunk_size
+        self.postings = {} # value -> list of rids
+        self.chunks = [] # sorted runs of values
+        self.maxes = [] # largest value of each chunk
+
+        self.frozen_values = array('q') # sorted distinct values
+        self.frozen_offsets = array('q', [0]) # postings of frozen_values[i] are frozen_rids[offsets[i]:offsets[i + 1]]
+        self.frozen_rids = array('q')
+        self.thawed = set() # frozen values that now live in the chunks
+        self.changed = False # modified since the last snapshot
+
+    def __contains__(self, value):
+        return bool(self.get(value))
+
+    def __len__(self):
+        return len(self.postings) + len(self.frozen_values) - len(self.thawed)
+
+    def get(self, value, default=None):
+        rids = self.postings.get(value)
+        if rids is not None:
+            return rids
+        if value in self.thawed:
+            return default
+        position = self.frozen_position(value)
+        if position is None:
+            return default
+        return self.frozen_rids[self.frozen_offsets[position]:self.frozen_offsets[position + 1]].tolist()
+
+    def bitmap_range(self, begin, end):
+        return Bitmap(rid for value, rids in self.range(begin, end) for rid in rids)
+
+    def frozen_position(self, value):
+        position = bisect_left(self.frozen_values, value)
+        if position < len(self.frozen_values) and self.frozen_values[position] == value:
+            return position
+        return None
+
+    def thaw(self, value):
+        if value in self.postings or value in self.thawed or self.frozen_position(value) is None:
+            return
+        self.postings[value] = self.get(value)
+        self.thawed.add(value)
+        self.insert_key(value)
+
+    def add(self, value, rid):
+        if value is None:
+            return # nulls are not indexed
+        self.thaw(value)
+        self.changed = True
+        rids = self.postings.get(value)
+        if rids is None:
+            self.postings[value] = [rid]
+            self.insert_key(value)
+        else:
+            rids.append(rid)
+
+    def remove(self, value, rid):
+        if value is None:
+            return
+        self.thaw(value)
+        self.changed = True
+        rids = self.postings[value]
+        rids.remove(rid)
+        if not rids:
+            del self.postings[value]
+            self.remove_key(value)
+
+    """
+    # Adds many (value, rid) entries at once: sorted first, then the new values are merged into the chunks in one pass
+    """
+    def add_many(self, values, rids):
+        entries = zip(values, rids)
+        if None in values:
+            entries = [(value, rid) for value, rid in entries if value is not None] # nulls are not indexed
+        entries = sorted(entries)
+        if not entries:
+            return
+        self.changed = True
+        postings = self.postings
+        frozen = len(self.frozen_values) > 0
+        new_values = []
+        for value, rid in entries:
+            value_rids = postings.get(value)
+            if value_rids is None:
+                value_rids = []
+                if frozen and value not in self.thawed and self.frozen_position(value) is not None:
+                    # a frozen value is thawed, it joins the chunks with the new values
+                    value_rids = self.get(value)
+                    self.thawed.add(value)
+                postings[value] = value_rids
+                new_values.append(value)
+            value_rids.append(rid)
+        self.merge_keys(new_values)
+
+    """
+    # Merges sorted values that are not in the chunks yet into them, splitting the chunks that grow too large
+    # Each chunk is visited once and only those receiving values change: a few values are inserted one by one,
+    # more are merged with the chunk in a single sort
+    """
+    def merge_keys(self, values):
+        chunks = []
+        start = 0
+        for chunk in self.chunks:
+            stop = bisect_right(values, chunk[-1], start)
+            if stop - start > 32:
+                chunk = sorted(chunk + values[start:stop]) # two sorted runs, merged in linear time
+            else:
+                for value in values[start:stop]:
+                    insort(chunk, value)
+            start = stop
+            chunks.append(chunk)
+        if start < len(values):
+            # values past the largest one indexed so far, the common case for increasing keys
+            chunks.append((chunks.pop() if chunks else []) + values[start:])
+        self.chunks = []
+        for chunk in chunks:
+            if len(chunk) > 2 * self.chunk_size:
+                self.chunks.extend(chunk[start:start + self.chunk_size] for start in range(0, len(chunk), self.chunk_size))
+            else:
+                self.chunks.append(chunk)
+        self.maxes = [chunk[-1] for chunk in self.chunks]
+
+    def insert_key(self, value):
+        if not self.chunks:
+            self.chunks.append([value])
+            self.maxes.append(value)
+            return
+        position = bisect_left(self.maxes, value)
+        if position == len(self.chunks):
+            # larger than everything indexed so far, the common case for increasing keys
+            position -= 1
+            self.chunks[position].append(value)
+            self.maxes[position] = value
+        else:
+            chunk = self.chunks[position]
+            chunk.insert(bisect_left(chunk, value), value)
+        if len(self.chunks[position]) > 2 * self.chunk_size:
+            chunk = self.chunks[position]
+            self.chunks[position:position + 1] = [chunk[:self.chunk_size], chunk[self.chunk_size:]]
+            self.maxes[position:position + 1] = [chunk[self.chunk_size - 1], chunk[-1]]
+
+    def remove_key(self, value):
+        position = bisect_left(self.maxes, value)
+        chunk = self.chunks[position]
+        del chunk[bisect_left(chunk, value)]
+        if not chunk:
+            del self.chunks[position]
+            del self.maxes[position]
+        else:
+            self.maxes[position] = chunk[-1]
+
+    """
+    # Yields (value, rids) for every indexed value between begin and end inclusive, in ascending order
+    """
+    def range(self, begin, end):
+        if len(self.frozen_values) == 0:
+            return self.chunk_range(begin, end)
+        # frozen and chunked values are disjoint, thawed values are skipped on the frozen side
+        return heapq.merge(self.chunk_range(begin, end), self.frozen_range(begin, end), key=lambda entry: entry[0])
+
+    def chunk_range(self, begin, end):
+        position = bisect_left(self.maxes, begin)
+        if position == len(self.chunks):
+            return
+        start = bisect_left(self.chunks[position], begin)
+        for chunk in self.chunks[position:]:
+            stop = bisect_right(chunk, end)
+            for value in chunk[start:stop]:
+                yield value, self.postings[value]
+            if stop < len(chunk):
+                return
+            start = 0
+
+    def frozen_range(self, begin, end):
+        start = bisect_left(self.frozen_values, begin)
+        stop = bisect_right(self.frozen_values, end)
+        offsets = self.frozen_offsets
+        for position in range(start, stop):
+            value = self.frozen_values[position]
+            if value not in self.thawed:
+                yield value, self.frozen_rids[offsets[position]:offsets[position + 1]].tolist()
+
+    def items(self):
+        if len(self) == 0:
+            return iter(())
+        low = self.chunks[0][0] if self.chunks else self.frozen_values[0]
+        high = self.maxes[-1] if self.chunks else self.frozen_values[-1]
+        if len(self.frozen_values):
+            low = min(low, self.frozen_values[0])
+            high = max(high, self.frozen_values[-1])
+        return self.range(low, high)
+
+    """
+    # Packs (value, rids) entries into the three snapshot arrays: sorted values, posting offsets and RIDs
+    """
+    def pack(self, entries):
+        values = array('q')
+        offsets = array('q', [0])
+        rids = array('q')
+        for value, value_rids in entries:
+            values.append(value)
+            rids.extend(value_rids)
+            offsets.append(len(rids))
+        return [values, offsets, rids]
+
+    """
+    # Full snapshot: every entry becomes part of a new frozen layer and the chunks are emptied
+    """
+    def compact(self):
+        arrays = self.pack(self.items())
+        self.freeze(*arrays)
+        return arrays
+
+    """
+    # Delta snapshot: the chunked entries plus the frozen values they shadow
+    """
+    def delta(self):
+        return self.pack(self.chunk_range(self.chunks[0][0], self.maxes[-1]) if self.chunks else ()) + [array('q', sorted(self.thawed))]
+
+    def base_size(self):
+        return len(self.frozen_values)
+
+    def delta_size(self):
+        return len(self.postings) + len(self.thawed)
+
+    def freeze(self, values, offsets, rids):
+        self.frozen_values, self.frozen_offsets, self.frozen_rids = values, offsets, rids
+        self.postings = {}
+        self.chunks = []
+        self.maxes = []
+        self.thawed = set()
+        self.changed = False
+
+    def load_delta(self, values, offsets, rids, thawed):
+        self.thawed = set(thawed)
+        for position, value in enumerate(values):
+            self.postings[value] = rids[offsets[position]:offsets[position + 1]].tolist()
+            self.insert_key(value)
+        self.changed = False
+
+
+class BitmapIndex:
+
+    """
+    # Map from column value to a Bitmap of the RIDs holding it, meant for columns with few distinct values
+    # Adding or removing a RID sets or clears one bit, where a RID list would have to be searched
+    # Bitmaps are small enough to be snapshotted whole, so the base and the delta hold the same five arrays
+    """
+    base_arrays = 5
+    delta_arrays = 5
+
+    def __init__(self):
+        self.bitmaps = {} # value -> Bitmap of rids
+        self.changed = False # modified since the last snapshot
+
+    def __contains__(self, value):
+        return bool(self.bitmaps.get(value))
+
+    def __len__(self):
+        return len(self.bitmaps)
+
+    def get(self, value, default=None):
+        bitmap = self.bitmaps.get(value)
+        if bitmap is None:
+            return default
+        return bitmap.tolist()
+
+    def bitmap_range(self, begin, end):
+        bitmap = Bitmap()
+        for value in self.bitmaps:
+            if begin <= value <= end:
+                bitmap = bitmap | self.bitmaps[value]
+        return bitmap
+
+    def add(self, value, rid):
+        if value is None:
+            return # nulls are not indexed
+        self.changed = True
+        bitmap = self.bitmaps.get(value)
+        if bitmap is None:
+            bitmap = self.bitmaps[value] = Bitmap()
+        bitmap.add(rid)
+
+    def remove(self, value, rid):
+        if value is None:
+            return
+        self.changed = True
+        bitmap = self.bitmaps[value]
+        bitmap.discard(rid)
+        if not bitmap:
+            del self.bitmaps[value]
+
+    def add_many(self, values, rids):
+        for value, rid in zip(values, rids):
+            self.add(value, rid)
+
+    def range(self, begin, end):
+        for value in sorted(value for value in self.bitmaps if begin <= value <= end):
+            yield value, self.bitmaps[value].tolist()
+
+    def items(self):
+        return self.range(float('-inf'), float('inf'))
+
+    """
+    # Packs every bitmap into five arrays: sorted values, the container range of each value, the high bits of each
+    # container, the payload range of each container and the payload (low bits of array containers, bitset words)
+    # A container is a bitset exactly when its payload is a full bitset long, array containers are always shorter
+    """
+    def compact(self):
+        values, value_offsets, highs, payload_offsets, payload = array('q'), array('q', [0]), array('q'), array('q', [0]), array('H')
+        for value in sorted(self.bitmaps):
+            for high, container in sorted(self.bitmaps[value].containers.items()):
+                highs.append(high)
+                if isinstance(container, array):
+                    payload.extend(container)
+                else:
+                    payload.frombytes(bytes(container))
+                payload_offsets.append(len(payload))
+            values.append(value)
+            value_offsets.append(len(highs))
+        self.changed = False
+        return [values, value_offsets, highs, payload_offsets, payload]
+
+    def delta(self):
+        return self.compact()
+
+    def base_size(self):
+        return 0
+
+    def delta_size(self):
+        return 0
+
+    def freeze(self, values, value_offsets, highs, payload_offsets, payload):
+        bitset_words = BITSET_BYTES // payload.itemsize
+        self.bitmaps = {}
+        for position, value in enumerate(values):
+            bitmap = self.bitmaps[value] = Bitmap()
+            for container in range(value_offsets[position], value_offsets[position + 1]):
+                words = payload[payload_offsets[container]:payload_offsets[container + 1]]
+                if len(words) == bitset_words:
+                    bitmap.containers[highs[container]] = bytearray(words.tobytes())
+                else:
+                    bitmap.containers[highs[container]] = words
+        self.changed = False
+
+    def load_delta(self, *arrays):
+        self.freeze(*arrays)
+
+
+INDEX_TYPES = {'ordered': OrderedIndex, 'bitmap': BitmapIndex}
+INDEX_KINDS = list(INDEX_TYPES) # position of a type is its code in snapshots
+
 
 class Index:
 
     def __init__(self, table):
         # self.indices will save the indices for each column of table
-        # This will put an empty dictionary by # of columns 
-        # If there are 3 it would be self.indices = [ {}, {} ,{}]
-        self.indices = [{} for _ in range(table.num_columns)]
+        # Only the key column is indexed by default, other columns get an OrderedIndex through create_index
+        # If there are 3 columns and the key is column 0 it would be self.indices = [ OrderedIndex(), None, None]
+        self.table = table
+        self.indices = [None] * table.num_columns
+        self.indices[table.key] = OrderedIndex()
+        self.layout_changed = False # an index was created or dropped since the last snapshot
+
+    def is_indexed(self, column):
+        return self.indices[column] is not None
 
     """
     # Returns the location of all records with the given value on column "column"
+    # Columns without an index are scanned
     """
 
     def locate(self, column, value):
+        if self.indices[column] is None:
+            return self.table.scan(column, value, value)
         return self.indices[column].get(value, [])
 
     '''
     # Adds a rid to the index of a column based on value
     '''
-    
+
     def add_to_index(self, column_number, value, rid):
-        # check if a key already exists in the index for that column
-        # if the key already exists, append the RID to the existing list associated with that key
-        if value not in self.indices[column_number]:
-            self.indices[column_number][value] = []
-        self.indices[column_number][value].append(rid)
+        # if the value is already indexed the RID is appended to its existing list
+        if self.indices[column_number] is not None:
+            self.indices[column_number].add(value, rid)
 
     '''
     # Removes a rid of the index of a column based on value
     '''
 
     def remove_from_index(self, column_number, value, rid):
-        self.indices[column_number][value].remove(rid)
-    
+        if self.indices[column_number] is not None:
+            self.indices[column_number].remove(value, rid)
+
+    """
+    # Bulk-adds the RIDs of many records to the index of a column
+    """
+
+    def add_many_to_index(self, column_number, values, rids):
+        if self.indices[column_number] is not None:
+            self.indices[column_number].add_many(values, rids)
+
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
     """
 
     def locate_range(self, begin, end, column):
         if column >= len(self.indices):
-            print("Column is out of range.")
+            self.table.metrics.event('column_out_of_range', logging.WARNING, column=column)
             return None
-        
+
+        if self.indices[column] is None:
+            return self.table.scan(column, begin, end)
         rids = []
+        for value, value_rids in self.indices[column].range(begin, end):
+            rids.extend(value_rids)
+        return rids
+
+    """
+    # Returns a Bitmap of the RIDs with values in column "column" between "begin" and "end"
+    # Bitmaps of several columns combine with & | - and complement to evaluate filters without RID lists
+    """
+
+    def locate_bitmap(self, column, begin, end=None):
+        end = begin if end is None else end
         index = self.indices[column]
+        if index is None:
+            return Bitmap(self.table.scan(column, begin, end))
+        return index.bitmap_range(begin, end)
 
-        for rid in range(begin, end + 1):
-            if rid in index:
-                rids.extend(index[rid])
-        return rids
+    """
+    # NOT of a bitmap: the live records it does not hold
+    """
+
+    def complement(self, bitmap):
+        return bitmap.complement(Bitmap.from_live(self.table.page_directory.live))
+
+    """
+    # Writes every column index as a base snapshot plus a delta of what changed since that base
+    # Only the delta is rewritten on a close, the base is rewritten once the delta outgrows COMPACTION_RATIO of it
+    # Both files start with the indexed columns and their index types, creating or dropping an index rewrites the base
+    """
+
+    def write_snapshot(self, base_path, delta_path):
+        indexed = [(column, index) for column, index in enumerate(self.indices) if index is not None]
+        if not self.layout_changed and not any(index.changed for column, index in indexed):
+            return
+        base_size = sum(index.base_size() for column, index in indexed)
+        delta_size = sum(index.delta_size() for column, index in indexed)
+        arrays = [array('q', [column for column, index in indexed]),
+                  array('q', [INDEX_KINDS.index(self.kind(column)) for column, index in indexed])]
+        if self.layout_changed or delta_size >= COMPACTION_RATIO * base_size:
+            for column, index in indexed:
+                arrays.extend(index.compact())
+            write_snapshot(base_path, arrays)
+            remove_snapshot(delta_path)
+            self.layout_changed = False
+        else:
+            for column, index in indexed:
+                arrays.extend(index.delta())
+                index.changed = False
+            write_snapshot(delta_path, arrays)
+
+    """
+    # Returns False if there is no usable snapshot, the indexes then have to be rebuilt from the pages
+    """
+
+    def read_snapshot(self, base_path, delta_path):
+        base = read_snapshot(base_path)
+        layout = self.snapshot_layout(base, 'base_arrays')
+        if layout is None:
+            return False
+        self.indices = [None] * self.table.num_columns
+        for column, index_type, start in layout:
+            self.indices[column] = index_type()
+            self.indices[column].freeze(*base[start:start + index_type.base_arrays])
+        delta = read_snapshot(delta_path)
+        delta_layout = self.snapshot_layout(delta, 'delta_arrays')
+        if delta_layout is not None and [entry[:2] for entry in delta_layout] == [entry[:2] for entry in layout]:
+            for column, index_type, start in delta_layout:
+                self.indices[column].load_delta(*delta[start:start + index_type.delta_arrays])
+        self.layout_changed = False
+        return True
+
+    """
+    # Returns (column, index type, first array) of every index in a snapshot, None if it does not fit this table
+    """
+
+    def snapshot_layout(self, arrays, arrays_per_index):
+        if arrays is None or len(arrays) < 2 or len(arrays[0]) != len(arrays[1]):
+            return None
+        layout = []
+        start = 2
+        for column, kind in zip(arrays[0], arrays[1]):
+            if not 0 <= column < self.table.num_columns or not 0 <= kind < len(INDEX_KINDS):
+                return None
+            index_type = INDEX_TYPES[INDEX_KINDS[kind]]
+            layout.append((column, index_type, start))
+            start += getattr(index_type, arrays_per_index)
+        return layout if start == len(arrays) else None
+
+    def kind(self, column):
+        return next(kind for kind, index_type in INDEX_TYPES.items() if type(self.indices[column]) is index_type)
+
+    """
+    # Rebuilds every index from the pages, used when there is no snapshot to load
+    """
+
+    def rebuild(self):
+        kinds = [(column, self.kind(column)) for column, index in enumerate(self.indices) if index is not None]
+        self.indices = [None] * self.table.num_columns
+        for column, kind in kinds:
+            self.create_index(column, kind)
 
     """
     # optional: Create index on specific column
+    # :param kind: string     #'ordered' for range lookups, 'bitmap' for columns with few distinct values
+    # The index is bulk-built from the newest values in the pages, an index of another kind is replaced
     """
 
-    def create_index(self, column_number):
-        self.indices.insert(column_number, {})
+    def create_index(self, column_number, kind='ordered'):
+        if kind not in INDEX_TYPES:
+            raise Exception(f"Unknown index type {kind}")
+        if self.indices[column_number] is not None and self.kind(column_number) == kind:
+            return
+        # writers hold the table latch, so no insert or update slips in between the build and the swap
+        with self.table.latch:
+            index = INDEX_TYPES[kind]()
+            rids = []
+            values = []
+            for rid, value in self.table.column_values(column_number):
+                rids.append(rid)
+                values.append(value)
+            index.add_many(values, rids)
+            self.indices[column_number] = index
+            self.layout_changed = True
 
     """
     # optional: Drop index of specific column
+    # The key index is needed to find records by primary key and cannot be dropped
     """
 
     def drop_index(self, column_number):
-        del self.indices[column_number]
+        if column_number == self.table.key:
+            raise Exception("The key column index cannot be dropped")
+        if self.indices[column_number] is not None:
+            self.indices[column_number] = None
+            self.layout_changed = True
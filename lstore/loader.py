@@ -0,0 +1,69 @@
+"""
+Bulk loaders for initial loads. Rows are read in batches and each batch goes to Query.insert_columns column-wise, so
+pages are filled a run at a time and the indexes are built from sorted batches instead of one entry per row.
+NumPy is only needed to load NumPy arrays.
+"""
+from array import array
+import csv
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BATCH_SIZE = 65536 # rows per insert_columns call
+
+
+"""
+# Loads every row of a CSV file of integers, empty fields become None
+# Returns the number of rows loaded
+"""
+def load_csv(query, path, header=True, delimiter=',', batch_size=BATCH_SIZE):
+    loaded = 0
+    with open(path, newline='') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        if header:
+            next(reader, None)
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                loaded += insert_batch(query, parse_columns(batch))
+                batch = []
+        if batch:
+            loaded += insert_batch(query, parse_columns(batch))
+    return loaded
+
+
+def parse_columns(rows):
+    columns = []
+    for column in zip(*rows):
+        if all(column):
+            columns.append(array('q', map(int, column)))
+        else:
+            columns.append([int(value) if value else None for value in column])
+    return columns
+
+
+"""
+# Loads a 2-D integer NumPy array with one row per record and one column per table column
+# Returns the number of rows loaded
+"""
+def load_array(query, values, batch_size=BATCH_SIZE):
+    if np is None:
+        raise Exception("load_array needs NumPy")
+    values = np.asarray(values, dtype=np.int64)
+    if values.ndim != 2:
+        raise Exception("load_array expects a 2-D array")
+    loaded = 0
+    for start in range(0, len(values), batch_size):
+        batch = values[start:start + batch_size]
+        # each column becomes an array('q') over the same bytes, which pages copy with one slice assignment
+        loaded += insert_batch(query, [array('q', np.ascontiguousarray(batch[:, i]).tobytes()) for i in range(batch.shape[1])])
+    return loaded
+
+
+def insert_batch(query, columns):
+    if not query.insert_columns(columns):
+        raise Exception("Bulk load failed")
+    return len(columns[0])
@@ -0,0 +1,131 @@
+"""
+Record locks for strict two-phase locking. Locks are shared (readers) or exclusive (writers), keyed by primary key, and
+follow a no-wait policy: a request that conflicts with another transaction's lock is refused at once, the query
+returns False and its transaction aborts, so no transaction ever blocks on a lock and deadlocks cannot happen.
+The lock table is split into stripes, each with its own latch, so threads locking different keys rarely meet.
+Every lock is held until its transaction commits or aborts and then released in one pass per stripe.
+"""
+import threading
+
+NUM_STRIPES = 64
+
+# the transaction the current thread is running, queries lock on its behalf
+context = threading.local()
+
+
+def current_transaction():
+    return getattr(context, 'transaction', None)
+
+
+def set_current_transaction(transaction):
+    context.transaction = transaction
+
+
+class LockEntry:
+
+    def __init__(self):
+        self.shared = set() # ids of transactions holding a shared lock
+        self.exclusive = None # id of the transaction holding the exclusive lock
+
+
+class Stripe:
+
+    def __init__(self):
+        self.latch = threading.Lock()
+        self.locks = {} # key -> LockEntry, only for keys that are locked
+        self.granted = 0
+        self.upgrades = 0
+        self.conflicts = 0
+
+
+class LockManager:
+
+    """
+    # :param num_stripes: int     #Number of independently latched partitions of the lock table
+    """
+    def __init__(self, num_stripes=NUM_STRIPES):
+        self.stripes = [Stripe() for _ in range(num_stripes)]
+
+    def stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    """
+    # Locks key for transaction, shared or exclusive, upgrading a shared lock the transaction already holds alone
+    # Returns False without waiting if another transaction holds a conflicting lock
+    # Without a transaction (a query run on its own) nothing is held, the call only checks for a conflicting lock
+    """
+    def acquire(self, transaction, key, exclusive=False):
+        stripe = self.stripe(key)
+        with stripe.latch:
+            entry = stripe.locks.get(key)
+            if transaction is None:
+                return entry is None or (not exclusive and entry.exclusive is None)
+
+            transaction_id = transaction.transaction_id
+            if entry is None:
+                entry = stripe.locks[key] = LockEntry()
+            elif entry.exclusive == transaction_id:
+                return True # exclusive covers both modes
+            elif entry.exclusive is not None:
+                stripe.conflicts += 1
+                return False
+
+            holds_shared = transaction_id in entry.shared
+            if not exclusive:
+                if not holds_shared:
+                    entry.shared.add(transaction_id)
+                    stripe.granted += 1
+                    transaction.locks.append((self, key))
+                return True
+
+            if len(entry.shared) - holds_shared > 0:
+                # other readers hold the record
+                stripe.conflicts += 1
+                return False
+            entry.shared.discard(transaction_id)
+            entry.exclusive = transaction_id
+            if holds_shared:
+                stripe.upgrades += 1
+            else:
+                stripe.granted += 1
+                transaction.locks.append((self, key))
+            return True
+
+    """
+    # Releases every lock in keys held by the transaction, taking each stripe latch once
+    """
+    def release_all(self, transaction, keys):
+        transaction_id = transaction.transaction_id
+        by_stripe = {}
+        for key in keys:
+            by_stripe.setdefault(hash(key) % len(self.stripes), []).append(key)
+        for stripe_number, stripe_keys in by_stripe.items():
+            stripe = self.stripes[stripe_number]
+            with stripe.latch:
+                for key in stripe_keys:
+                    entry = stripe.locks.get(key)
+                    if entry is None:
+                        continue
+                    if entry.exclusive == transaction_id:
+                        entry.exclusive = None
+                    entry.shared.discard(transaction_id)
+                    if entry.exclusive is None and not entry.shared:
+                        del stripe.locks[key]
+
+    def is_locked(self, key, exclusive_only=False):
+        stripe = self.stripe(key)
+        with stripe.latch:
+            entry = stripe.locks.get(key)
+            if entry is None:
+                return False
+            return entry.exclusive is not None or (not exclusive_only and bool(entry.shared))
+
+    def stats(self):
+        stats = {'locked_keys': 0, 'granted': 0, 'upgrades': 0, 'conflicts': 0, 'stripes': len(self.stripes)}
+        for stripe in self.stripes:
+            with stripe.latch:
+                stats['locked_keys'] += len(stripe.locks)
+                stats['granted'] += stripe.granted
+                stats['upgrades'] += stripe.upgrades
+                stats['conflicts'] += stripe.conflicts
+        return stats
@@ -0,0 +1,180 @@
+"""
+Engine instrumentation: counters, latency histograms and structured events, one Metrics object per table.
+Recording is a counter bump or a histogram bucket increment under a lock, cheap enough to stay on at all times.
+Histograms bucket latencies by powers of two microseconds, so percentiles are approximate (within a factor of 2)
+but take constant memory. Events replace prints: each one is a dict that is logged on the 'lstore' logger with the
+dict attached as record.event, and the most recent ones are kept for Database.stats().
+A sampling profiler can be started and stopped at runtime; it periodically records where every thread is.
+"""
+from collections import Counter, deque
+from time import perf_counter
+import functools
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+logger = logging.getLogger('lstore')
+
+HISTOGRAM_BUCKETS = 40 # bucket i holds latencies below 2 ** i microseconds, the last one everything longer
+RECENT_EVENTS = 100
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+IDLE_FILES = (threading.__file__, queue.__file__)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    """
+    # Upper bound in milliseconds of the bucket holding the given percentile (0-100), None if nothing was recorded
+    """
+    def percentile(self, percent):
+        if self.count == 0:
+            return None
+        rank = max(percent / 100 * self.count, 1)
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min((1 << bucket) / 1000, self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max * 1000,
+        }
+
+
+class Metrics:
+
+    def __init__(self, name=''):
+        self.name = name
+        self.latch = threading.Lock()
+        self.counters = Counter()
+        self.histograms = {}
+        self.events = deque(maxlen=RECENT_EVENTS)
+
+    def count(self, name, amount=1):
+        with self.latch:
+            self.counters[name] += amount
+
+    """
+    # Records one timed operation: its latency and whether it succeeded
+    """
+    def observe(self, name, seconds, succeeded=True):
+        with self.latch:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+            self.counters[name] += 1
+            if not succeeded:
+                self.counters[name + '_failed'] += 1
+
+    """
+    # Emits a structured event: a dict with the event name, time, table and the given fields
+    """
+    def event(self, name, level=logging.INFO, **fields):
+        event = {'event': name, 'time': time.time(), 'table': self.name}
+        event.update(fields)
+        with self.latch:
+            self.counters['event_' + name] += 1
+            self.events.append(event)
+        logger.log(level, '%s %s', name, fields, extra={'event': event})
+
+    def error(self, operation, error):
+        self.event('error', logging.ERROR, operation=operation, error=f'{type(error).__name__}: {error}')
+
+    def stats(self):
+        with self.latch:
+            return {
+                'counters': dict(self.counters),
+                'latency': {name: histogram.summary() for name, histogram in self.histograms.items()},
+                'events': list(self.events),
+            }
+
+
+"""
+# Decorator timing a Query method into its table's metrics, a return value of False counts as a failure
+"""
+def timed(operation):
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(query, *args, **kwargs):
+            start = perf_counter()
+            result = method(query, *args, **kwargs)
+            query.table.metrics.observe(operation, perf_counter() - start, result is not False)
+            return result
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+
+    """
+    # :param interval: float     #Seconds between two samples
+    # Every sample records, for each other busy thread, the innermost frame (file:line function) in the lstore package
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.num_samples = 0
+        self.running = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running.set()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.running.clear()
+        self.thread.join()
+        self.thread = None
+
+    def sample(self):
+        own = threading.get_ident()
+        while self.running.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_filename in IDLE_FILES:
+                    continue # threads blocked on a lock, condition or queue are idle, not busy
+                # attribute the sample to the innermost frame inside the engine
+                while frame is not None and PACKAGE_DIRECTORY not in frame.f_code.co_filename:
+                    frame = frame.f_back
+                if frame is not None:
+                    code = frame.f_code
+                    self.samples[f'{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}'] += 1
+            self.num_samples += 1
+            time.sleep(self.interval)
+
+    """
+    # Returns the most sampled locations with their share of the samples
+    """
+    def report(self, top=20):
+        total = sum(self.samples.values())
+        return {
+            'samples': self.num_samples,
+            'top': [{'location': location, 'count': count, 'share': round(count / total, 4)} for location, count in self.samples.most_common(top)],
+        }
@@ -1,12 +1,74 @@
+from array import array
+
+PAGE_SIZE = 4096 # bytes per physical page
+RECORD_SIZE = 8 # every cell is a packed signed 64-bit integer
+RECORDS_PER_PAGE = PAGE_SIZE // RECORD_SIZE # 512 slots per page
+NULL_VALUE = -(2 ** 63) # sentinel stored for None (e.g. untouched columns of a tail record)
+
+
 class Page:
 
     def __init__(self):
         self.num_records = 0
-        self.data = bytearray(4096)
+        self.data = bytearray(PAGE_SIZE)
+        # zero-copy view of the page as an array of int64 slots
+        self.slots = memoryview(self.data).cast('q')
 
     def has_capacity(self):
-        pass
+        return self.num_records < RECORDS_PER_PAGE
 
+    """
+    # Appends value to the next free slot
+    # Returns the offset (slot number) the value was written to
+    """
     def write(self, value):
+        if not self.has_capacity():
+            raise Exception("Page is full")
+        offset = self.num_records
+        self.slots[offset] = NULL_VALUE if value is None else value
         self.num_records += 1
-        pass
+        return offset
+
+    """
+    # Appends a run of values with one slice copy, values may be any sequence or an array('q')
+    # Returns the offset of the first value
+    """
+    def write_many(self, values):
+        if not (isinstance(values, array) and values.typecode == 'q'):
+            values = array('q', [NULL_VALUE if value is None else value for value in values])
+        if self.num_records + len(values) > RECORDS_PER_PAGE:
+            raise Exception("Page is full")
+        offset = self.num_records
+        self.slots[offset:offset + len(values)] = values
+        self.num_records += len(values)
+        return offset
+
+    """
+    # Returns the value stored at offset, None if the slot holds the null sentinel
+    """
+    def read(self, offset):
+        if offset >= self.num_records:
+            raise IndexError(f"Offset {offset} is out of range")
+        value = self.slots[offset]
+        return None if value == NULL_VALUE else value
+
+    """
+    # Replaces the value stored at an already written offset
+    """
+    def overwrite(self, offset, value):
+        if offset >= self.num_records:
+            raise IndexError(f"Offset {offset} is out of range")
+        self.slots[offset] = NULL_VALUE if value is None else value
+
+    """
+    # Returns a zero-copy memoryview over the written slots (raw int64 values)
+    """
+    def view(self):
+        return self.slots[:self.num_records]
+
+    def __len__(self):
+        return self.num_records
+
+    def __iter__(self):
+        for value in self.view():
+            yield None if value == NULL_VALUE else value
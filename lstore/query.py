@@ -1,9 +1,24 @@
-from lstore.table import Table, Record
+from lstore.table import Table, Record, timestamp, schema_encoding
 from lstore.index import Index
-from lstore.db import Database
-import pandas as pd
-import os
-import csv
+from lstore.aggregate import Aggregator, AGGREGATES
+from lstore.lock_manager import current_transaction
+from lstore.bitmap import Bitmap
+from lstore.metrics import timed
+
+
+"""
+# Returns a function telling whether a column value satisfies a select_where predicate
+"""
+def predicate_test(operator, operand):
+    if operator == '=':
+        return lambda value: value == operand
+    if operator == 'range':
+        begin, end = operand
+        return lambda value: value is not None and begin <= value <= end
+    if operator == 'in':
+        values = set(operand)
+        return lambda value: value in values
+    raise Exception(f"Unknown predicate operator {operator}")
 
 
 class Query:
@@ -15,8 +30,47 @@ class Query:
     """
     def __init__(self, table):
         self.table = table
-        self.db = Database()
-        self.path = ""
+
+    """
+    # Locks a record by primary key for the transaction running on this thread (no-wait)
+    # Returns False if another transaction holds a conflicting lock
+    """
+    def lock(self, primary_key, exclusive=False):
+        return self.table.lock_manager.acquire(current_transaction(), primary_key, exclusive)
+
+    """
+    # Records how to undo a write in the undo log of the transaction running on this thread, if any
+    """
+    def log_undo(self, undo, *args):
+        transaction = current_transaction()
+        if transaction is not None:
+            transaction.undo_log.append((undo, args))
+            self.table.log_undo(undo, args)
+
+    """
+    # Hides a version written by the transaction running on this thread from other readers until it ends
+    """
+    def track_version(self, page_range, rid):
+        transaction = current_transaction()
+        if transaction is not None:
+            self.table.uncommitted[(page_range, rid)] = transaction
+            transaction.versions.append((self.table, (page_range, rid)))
+
+    def record_key(self, rid, search_key, search_key_index):
+        if search_key_index == self.table.key:
+            return search_key
+        return self.table.latest_value(rid, self.table.key)
+
+    """
+    # Builds the result Record of a live base record, reading only the projected columns from the pages
+    """
+    def materialize(self, rid, projected_columns_index):
+        columns = [i for i in range(len(projected_columns_index)) if projected_columns_index[i]]
+        values = self.table.latest_values(rid, [self.table.key] + columns)
+        projected_columns = [None] * len(projected_columns_index)
+        for column, value in zip(columns, values[1:]):
+            projected_columns[column] = value
+        return Record(rid, values[0], projected_columns)
 
     """
     # internal Method
@@ -24,28 +78,33 @@ class Query:
     # Returns True upon succesful deletion
     # Return False if record doesn't exist or is locked due to 2PL
     """
+    @timed('delete')
     def delete(self, primary_key):
         try:
-            page_name = self.table.index.locate(0, primary_key)[0] // 513 + 1
-            self.db.pin_page(page_name)
-            if self.table.is_locked(primary_key):
-                return False
-            
-            rids = self.table.index.locate(self.table.key, primary_key)
-            if not rids:
+            if not self.lock(primary_key, exclusive=True):
                 return False
+
+            # writers to the same table are serialized
+            with self.table.latch:
+                rids = self.table.index.locate(self.table.key, primary_key)
+                if not rids:
+                    return False
             
-            for rid in rids:
-                record = self.table.page_directory.get(rid)
-                if record and isinstance(record, Record) and record.is_valid:
-                    record.invalidate()  
-                    del self.table.page_directory[rid]  # remove record
+                # rids is the index's own postings list, removing the key from the index shrinks it as we go
+                for rid in list(rids):
+                    if rid in self.table.page_directory:
+                        # the index only holds live records, as it does when rebuilt from the pages
+                        columns = self.table.latest_values(rid, range(self.table.num_columns))
+                        for i in range(0, len(columns)):
+                            self.table.index.remove_from_index(i, columns[i], rid)
+                        del self.table.page_directory[rid]  # remove record
+                        self.table.invalidate_base_record(rid)
+                        self.log_undo(self.table.rollback_delete, rid, columns)
 
-            self.db.unpin_page(page_name)
-            return True  # deletion successful
+                return True  # deletion successful
 
         except Exception as e:
-            print(f"Deletion error: {e}")
+            self.table.metrics.error('delete', e)
             return False
             
     
@@ -54,26 +113,77 @@ class Query:
     # Return True upon succesful insertion
     # Returns False if insert fails for whatever reason
     """
+    @timed('insert')
     def insert(self, *columns):
         try:
-            self.path = self.db.get_path()
-            self.table.path = self.path
-            key = columns[0]
-            rid = self.table.generate_base_rid()
-            record = Record(rid, key, columns)
-            self.table.page_directory[rid] = record # add to page directory
-            for i in range(0,len(columns)):
-                self.table.index.add_to_index(i, columns[i], rid) # add to indices
-            time = self.table.get_time()
-            columns = columns + (rid, rid, '0000', time)
-            self.table.Bpage_insert(*columns) # create base pages
-            return True
+            if not self.lock(columns[self.table.key], exclusive=True):
+                return False
+
+            # the base RID must match the slot the record is appended to
+            with self.table.latch:
+                rid = self.table.generate_base_rid()
+                self.table.page_directory.add(rid) # add to page directory
+                for i in range(0,len(columns)):
+                    self.table.index.add_to_index(i, columns[i], rid) # add to indices
+                time = self.table.get_time()
+                columns = columns + (rid, rid, 0, time)
+                self.table.Bpage_insert(*columns) # create base pages
+                self.log_undo(self.table.rollback_insert, rid, columns[:self.table.num_columns])
+                self.track_version(self.table.base_location(rid)[0], rid)
+                return True
         
         except Exception as e:
             # for debugging
-            print(f"Insertion error: {e}")
+            self.table.metrics.error('insert', e)
             return False
         
+    """
+    # Insert many records at once
+    # :param rows: iterable of records, each a sequence with one value per column
+    # Return True upon succesful insertion
+    # Returns False if insert fails for whatever reason
+    """
+    def insert_many(self, rows):
+        rows = list(rows)
+        if not rows:
+            return True
+        return self.insert_columns([list(column) for column in zip(*rows)])
+
+    """
+    # Insert many records given column-wise
+    # :param columns: one sequence of values per column (lists or array('q')), all of the same length
+    # Pages are filled a run at a time and the indexes are built from the sorted batch
+    # Return True upon succesful insertion
+    # Returns False if insert fails for whatever reason
+    """
+    @timed('insert_columns')
+    def insert_columns(self, columns):
+        try:
+            if len(columns) != self.table.num_columns:
+                return False
+            count = len(columns[0])
+            transaction = current_transaction()
+            if transaction is not None:
+                for key in columns[self.table.key]:
+                    if not self.lock(key, exclusive=True):
+                        return False
+
+            with self.table.latch:
+                first_rid = self.table.Bpage_insert_many(columns)
+                self.table.page_directory.add_range(first_rid, count)
+                rids = range(first_rid, first_rid + count)
+                for i in range(0, len(columns)):
+                    self.table.index.add_many_to_index(i, columns[i], rids)
+                if transaction is not None:
+                    for offset, rid in enumerate(rids):
+                        self.log_undo(self.table.rollback_insert, rid, tuple(column[offset] for column in columns))
+                        self.track_version(self.table.base_location(rid)[0], rid)
+            return True
+
+        except Exception as e:
+            self.table.metrics.error('insert_columns', e)
+            return False
+
     """
     # Read matching record with specified search key
     # :param search_key: the value you want to search based on
@@ -83,35 +193,93 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
+    @timed('select')
     def select(self, search_key, search_key_index, projected_columns_index):
         try:        
-            page_name = self.table.index.locate(0, search_key)[0] // 513 + 1
-            self.db.pin_page(page_name)
-            
             rids = self.table.index.locate(search_key_index, search_key)
             records = []
 
-            # pull rid and corresponding values from page directory
+            # read the projected columns of every live record from the pages
             for rid in rids:
-                full_record = self.table.page_directory.get(rid) 
-                if full_record:
-                    projected_columns = []
-                    for i in range(len(projected_columns_index)):
-                        if projected_columns_index[i]:
-                            projected_columns.append(full_record.columns[i])
-                        else:
-                            projected_columns.append(None)
-
-                    # append projected record to records
-                    projected_record = Record(full_record.rid, full_record.key, projected_columns)
-                    records.append(projected_record)
-
-            self.db.unpin_page(page_name)
+                if rid not in self.table.page_directory:
+                    continue
+                if not self.lock(self.record_key(rid, search_key, search_key_index)):
+                    return False
+                # check again under the lock, a writer may have finished in between
+                if rid in self.table.page_directory:
+                    records.append(self.materialize(rid, projected_columns_index))
+
             return records
         except Exception as e:
-            print(f"Select error: {e}")
+            self.table.metrics.error('select', e)
             return False
 
+    """
+    # Read the records matching every predicate
+    # :param predicates: list of (column, operator, operand), operator is one of
+    #     '='      operand is a value
+    #     'range'  operand is a (begin, end) pair, both inclusive
+    #     'in'     operand is a collection of values
+    # :param projected_columns_index: what columns to return. array of 1 or 0 values.
+    # Indexed predicates are answered by intersecting bitmaps, the rest are checked against the pages reading only
+    # the predicate columns, and only the projected columns of the matches are read
+    # Returns a list of Record objects upon success
+    # Returns False if a matching record is locked by TPL
+    """
+    @timed('select_where')
+    def select_where(self, predicates, projected_columns_index):
+        try:
+            records = []
+            for rid in self.filter(predicates):
+                if not self.lock(self.table.latest_value(rid, self.table.key)):
+                    return False
+                if rid in self.table.page_directory:
+                    records.append(self.materialize(rid, projected_columns_index))
+            return records
+        except Exception as e:
+            self.table.metrics.error('select_where', e)
+            return False
+
+    """
+    # Returns the base RIDs of the live records matching every predicate
+    """
+    def filter(self, predicates):
+        indexed = [predicate for predicate in predicates if self.table.index.is_indexed(predicate[0])]
+        remaining = [predicate for predicate in predicates if not self.table.index.is_indexed(predicate[0])]
+        columns = sorted(set(column for column, operator, operand in remaining))
+        tests = [(columns.index(column), predicate_test(operator, operand)) for column, operator, operand in remaining]
+
+        if not indexed:
+            # no index applies, stream through the predicate columns of every base page
+            return [rid for rid, values in self.table.scan_columns(columns)
+                    if all(test(values[position]) for position, test in tests)]
+
+        matches = None
+        for column, operator, operand in indexed:
+            bitmap = self.predicate_bitmap(column, operator, operand)
+            matches = bitmap if matches is None else matches & bitmap
+        rids = []
+        for rid in matches:
+            if rid not in self.table.page_directory:
+                continue
+            values = self.table.latest_values(rid, columns) if tests else ()
+            if all(test(values[position]) for position, test in tests):
+                rids.append(rid)
+        return rids
+
+    def predicate_bitmap(self, column, operator, operand):
+        index = self.table.index
+        if operator == '=':
+            return index.locate_bitmap(column, operand)
+        if operator == 'range':
+            return index.locate_bitmap(column, operand[0], operand[1])
+        if operator == 'in':
+            bitmap = Bitmap()
+            for value in set(operand):
+                bitmap = bitmap | index.locate_bitmap(column, value)
+            return bitmap
+        raise Exception(f"Unknown predicate operator {operator}")
+
     """
     # Read matching record with specified search key
     # :param search_key: the value you want to search based on
@@ -122,66 +290,102 @@ class Query:
     # Returns False if record locked by TPL
     # Assume that select will never be called on a key that doesn't exist
     """
+    @timed('select_version')
     def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
-        pass
+        try:
+            return self.read_versions(search_key, search_key_index, projected_columns_index, relative_version, None)
+        except Exception as e:
+            self.table.metrics.error('select_version', e)
+            return False
+
+    """
+    # Read matching records as they were at a point in time, without taking record locks
+    # :param timestamp: time to read as of in epoch nanoseconds, by default the start of the running transaction (or now)
+    # Returns a list of Record objects upon success
+    """
+    @timed('select_snapshot')
+    def select_snapshot(self, search_key, search_key_index, projected_columns_index, timestamp=None):
+        try:
+            return self.read_versions(search_key, search_key_index, projected_columns_index, 0, self.snapshot_time(timestamp))
+        except Exception as e:
+            self.table.metrics.error('select_snapshot', e)
+            return False
+
+    def snapshot_time(self, as_of):
+        if as_of is not None:
+            return as_of
+        transaction = current_transaction()
+        return transaction.start_time if transaction is not None else timestamp()
+
+    def read_versions(self, search_key, search_key_index, projected_columns_index, relative_version, as_of):
+        transaction = current_transaction()
+        transaction_id = transaction.transaction_id if transaction is not None else None
+        columns = [i for i in range(len(projected_columns_index)) if projected_columns_index[i]]
+        records = []
+        for rid in self.table.index.locate(search_key_index, search_key):
+            values = self.table.read_version(rid, relative_version, as_of, transaction_id, [self.table.key] + columns)
+            if values is None:
+                continue
+            projected_columns = [None] * len(projected_columns_index)
+            for column, value in zip(columns, values[1:]):
+                projected_columns[column] = value
+            records.append(Record(rid, values[0], projected_columns))
+        return records
 
     """
     # Update a record with specified key and columns
     # Returns True if update is succesful
     # Returns False if no records exist with given key or if the target record cannot be accessed due to 2PL locking
     """
+    @timed('update')
     def update(self, primary_key, *columns):
         try:
-            page_name = self.table.index.locate(0, primary_key)[0] // 513 + 1
-            self.db.mark_page_dirty(page_name)
-            self.db.pin_page(page_name)
-            
-            # time, schema
-            time = self.table.get_time()
-            schema_encoding = ''.join(['1' if value is not None else '0' for value in columns[1:]])
-            
-            # create rids and BaseID for each tail page range
-            baseid = self.table.index.locate(0, primary_key)[0]
-            page_range = (baseid - 1) // 8192
+            if not self.lock(primary_key, exclusive=True):
+                return False
+
+            # the tail RID must match the slot the tail record is appended to
+            with self.table.latch:
+                # time, schema
+                time = self.table.get_time()
+                schema = schema_encoding(columns, self.table.key)
             
-            current_tail_page = len(self.table.page_ranges[page_range]['tail_pages']) - 1
-            if len(self.table.page_ranges[page_range]['tail_pages'][current_tail_page]['Column_6']) == 0:
-                rid = -1
-            else:
-                rid = -(len(self.table.page_ranges[page_range]['tail_pages'][len(self.table.page_ranges[page_range]['tail_pages']) - 1]['Column_6'])+1)
-
-            # indirection
-            indirection = self.table.get_indirection(current_tail_page, page_range, primary_key)
-
-
-            # update indices and page directory
-            new_columns = []
-            for i in range(0, len(columns)):
-                if columns[i] is not None:
-                    self.table.index.remove_from_index(i, self.table.page_directory[baseid].columns[i], baseid)
-                    self.table.index.add_to_index(i, columns[i], baseid)
-                    new_columns.append(columns[i])
-                else:
-                    new_columns.append(self.table.page_directory[baseid].columns[i])
-            del self.table.page_directory[baseid]
+                # create rids and BaseID for each tail page range
+                live = [rid for rid in self.table.index.locate(self.table.key, primary_key) if rid in self.table.page_directory]
+                if not live:
+                    return False
+                baseid = live[0]
+                page_range = (baseid - 1) // self.table.records_per_range
             
-            record = Record(baseid, primary_key, new_columns)
-            self.table.page_directory[baseid] = record # add to page directory
+                # indirection: the new tail record points at the version it replaces
+                indirection = self.table.get_indirection(baseid)
+                if indirection == baseid:
+                    # first update, keep the original version in the tail
+                    original = self.table.latest_values(baseid, range(self.table.num_columns))
+                    indirection = self.table.snapshot_base_record(baseid, original)
+                    if (page_range, baseid) in self.table.uncommitted:
+                        # the copy of a record inserted by a running transaction commits with it
+                        self.track_version(page_range, indirection)
 
-            # update disk
-            self.path = self.db.get_path()
-            file_path = os.path.join(self.path, self.table.name + '.csv')
-            df = pd.read_csv(file_path)
-            df.loc[baseid-1, [f'Column_{i + 1}' for i in range(self.table.num_columns)]] = new_columns
-            df.to_csv(file_path, index=False)
+                rid = self.table.generate_tail_rid(page_range)
 
-            
-            # pack columns and insert to tail pages
-            columns = columns + (rid, indirection, schema_encoding, time, baseid)
-            self.table.Tpage_insert(primary_key, page_range, *columns) # insert into tail pages
-            self.db.unpin_page(page_name)
+                # update indices, only the updated columns are read back from the pages, the primary key never changes
+                updated = [i for i in range(0, len(columns)) if columns[i] is not None and i != self.table.key]
+                changes = {}
+                for i, old_value in zip(updated, self.table.latest_values(baseid, updated)):
+                    if old_value != columns[i]:
+                        self.table.index.remove_from_index(i, old_value, baseid)
+                        self.table.index.add_to_index(i, columns[i], baseid)
+                        changes[i] = (old_value, columns[i])
+
+                # pack columns and insert to tail pages, the tail append is what persists the update
+                columns = columns + (rid, indirection, schema, time, baseid)
+                self.table.Tpage_insert(primary_key, page_range, *columns) # insert into tail pages
+                self.log_undo(self.table.rollback_update, baseid, primary_key, changes, rid, indirection)
+                self.track_version(page_range, rid)
+            self.table.wait_for_merges()
+            return True
         except Exception as e:
-            print(f"Select error: {e}")
+            self.table.metrics.error('update', e)
             return False
 
     
@@ -191,22 +395,34 @@ class Query:
     :param aggregate_columns: int  # Index of desired column to aggregate
     # this function is only called on the primary key.
     # Returns the summation of the given range upon success
-    # Returns False if no record exists in the given range
+    # Returns False if no record exists in the given range (or every value in it is None)
     """
+    @timed('sum')
     def sum(self, start_range, end_range, aggregate_column_index):
         try:
-            
-            total_sum = 0
-            for key in range(start_range, end_range + 1):  # iterate over keys in the specified range
-                records = self.select(key, self.table.key, [1] * self.table.num_columns)
-                for record in records:
-                    if record:  
-                        total_sum += record.columns[aggregate_column_index]
-            return total_sum
+            results = self.aggregate(start_range, end_range, aggregate_column_index, ('sum', 'count'))
+            return False if results is None or results['count'] == 0 else results['sum']
         except Exception as e:
-            print(f"Sum error: {e}")
+            self.table.metrics.error('sum', e)
             return False
 
+    """
+    :param start_range: int         # Start of the key range to aggregate
+    :param end_range: int           # End of the key range to aggregate
+    :param aggregate_columns: int  # Index of desired column to aggregate
+    :param aggregates: tuple       # Any of 'sum', 'count', 'min', 'max', 'avg'
+    # Computes every requested aggregate in one batched pass over the column pages
+    # Returns a dict of aggregate name to value
+    # Returns None if a record in the range is locked by another transaction
+    """
+    def aggregate(self, start_range, end_range, aggregate_column_index, aggregates=AGGREGATES):
+        rids = []
+        for key, key_rids in self.table.index.indices[self.table.key].range(start_range, end_range):
+            if not self.lock(key):
+                return None
+            rids.extend(key_rids)
+        return Aggregator(self.table).aggregate(rids, aggregate_column_index, aggregates)
+
     
     """
     :param start_range: int         # Start of the key range to aggregate 
@@ -217,19 +433,36 @@ class Query:
     # Returns the summation of the given range upon success
     # Returns False if no record exists in the given range
     """
+    @timed('sum_version')
     def sum_version(self, start_range, end_range, aggregate_column_index, relative_version):
         try:
-            
-            total_sum = 0
-            for key in range(start_range, end_range + 1):  
-                records = self.select_version(key, self.table.key, [1] * self.table.num_columns, relative_version)
-                for record in records:
-                    if record:  
-                        total_sum += record.columns[aggregate_column_index]
-            return total_sum
+            return self.sum_versions(start_range, end_range, aggregate_column_index, relative_version, None)
+        except Exception as e:
+            self.table.metrics.error('sum_version', e)
+            return False
+
+    """
+    # Summation over a key range as it was at a point in time, without taking record locks
+    # :param timestamp: time to read as of in epoch nanoseconds, by default the start of the running transaction (or now)
+    """
+    @timed('sum_snapshot')
+    def sum_snapshot(self, start_range, end_range, aggregate_column_index, timestamp=None):
+        try:
+            return self.sum_versions(start_range, end_range, aggregate_column_index, 0, self.snapshot_time(timestamp))
         except Exception as e:
-            print(f"Sum error: {e}")
+            self.table.metrics.error('sum_snapshot', e)
             return False
+
+    def sum_versions(self, start_range, end_range, aggregate_column_index, relative_version, as_of):
+        transaction = current_transaction()
+        transaction_id = transaction.transaction_id if transaction is not None else None
+        total_sum = 0
+        for key, rids in self.table.index.indices[self.table.key].range(start_range, end_range):
+            for rid in rids:
+                values = self.table.read_version(rid, relative_version, as_of, transaction_id, [aggregate_column_index])
+                if values is not None:
+                    total_sum += values[0]
+        return total_sum
     
     
     """
@@ -240,16 +473,18 @@ class Query:
     # Returns True is increment is successful
     # Returns False if no record matches key or if target record is locked by 2PL.
     """
+    @timed('increment')
     def increment(self, key, column):
-        r = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
-        if r is not False:
+        records = self.select(key, self.table.key, [1] * self.table.num_columns)
+        if records:
             updated_columns = [None] * self.table.num_columns
-            updated_columns[column] = r[column] + 1
+            updated_columns[column] = records[0].columns[column] + 1
             u = self.update(key, *updated_columns)
             return u
         return False
 
 
+    @timed('select_distinct')
     def select_distinct(self, search_key, search_key_index, projected_columns_index):
         try:                
             
@@ -258,98 +493,80 @@ class Query:
             seen_keys = set()
 
             for rid in rids:
-                full_record = self.table.page_directory.get(rid)
-                if full_record and full_record.key not in seen_keys:
-                    projected_columns = []
-                    for i in range(len(projected_columns_index)):
-                        if projected_columns_index[i]:
-                            projected_columns.append(full_record.columns[i])
-                        else:
-                            projected_columns.append(None)
-                
-                    projected_record = Record(full_record.rid, full_record.key, projected_columns)
-                    records.append(projected_record)
-                    seen_keys.add(full_record.key)
+                if rid not in self.table.page_directory:
+                    continue
+                key = self.record_key(rid, search_key, search_key_index)
+                if key not in seen_keys:
+                    if not self.lock(key):
+                        return False
+                    records.append(self.materialize(rid, projected_columns_index))
+                    seen_keys.add(key)
 
             return records
         except Exception as e:
-            print(f"Select DISTINCT error: {e}")
+            self.table.metrics.error('select_distinct', e)
             return False
 
+    """
+    :param start_range: int         # Start of the key range to aggregate
+    :param end_range: int           # End of the key range to aggregate
+    :param aggregate_columns: int  # Index of desired column to aggregate
+    # Returns the average of the non-None values in the given range upon success
+    # Returns False if no record exists in the given range (or every value in it is None)
+    """
+    @timed('avg')
     def avg(self, start_range, end_range, aggregate_column_index):
         try:
-            total_sum = 0
-            count = 0
-            for key in range(start_range, end_range + 1):  # Iterate over keys in the specified range
-                records = self.select(key, self.table.key, [1] * self.table.num_columns)
-                for record in records:
-                    if record:  
-                        count += 1
-                        total_sum += record.columns[aggregate_column_index]
-            return total_sum/count
+            results = self.aggregate(start_range, end_range, aggregate_column_index, ('avg',))
+            if results is None:
+                return False
+            return False if results['avg'] is None else results['avg']
         except Exception as e:
-            print(f"Avg error: {e}")
+            self.table.metrics.error('avg', e)
             return False
     
+    @timed('min')
     def min(self, start_range, end_range, aggregate_column_index):
         try:
-            min = 0
-            count = 0
-            for key in range(start_range, end_range + 1):  # Iterate over keys in the specified range
-                records = self.select(key, self.table.key, [1] * self.table.num_columns)
-                for record in records:
-                    if record and record.columns[aggregate_column_index] is not None: 
-                        if (count == 0):
-                            min = record.columns[aggregate_column_index]
-                        count += 1
-                        
-                        if (min > record.columns[aggregate_column_index]): 
-                            min = record.columns[aggregate_column_index]
-            return min
+            results = self.aggregate(start_range, end_range, aggregate_column_index, ('min',))
+            if results is None:
+                return False
+            return 0 if results['min'] is None else results['min']
         except Exception as e:
-            print(f"Min error: {e}")
+            self.table.metrics.error('min', e)
             return False
     
+    @timed('max')
     def max(self, start_range, end_range, aggregate_column_index):
         try:
-            max = 0
-            count = 0
-            for key in range(start_range, end_range + 1):  # Iterate over keys in the specified range
-                records = self.select(key, self.table.key, [1] * self.table.num_columns)
-                for record in records:
-                    if record: 
-                        if (count == 0):
-                            max = record.columns[aggregate_column_index]
-                        count += 1
-                        
-                        if (max < record.columns[aggregate_column_index]): 
-                            max = record.columns[aggregate_column_index]
-            return max
+            results = self.aggregate(start_range, end_range, aggregate_column_index, ('max',))
+            if results is None:
+                return False
+            return 0 if results['max'] is None else results['max']
         except Exception as e:
-            print(f"Max error: {e}")
+            self.table.metrics.error('max', e)
             return False
     
+    @timed('count')
     def count(self, start_range, end_range, aggregate_column_index):
         try:
-            count = 0
-            for key in range(start_range, end_range + 1):  # Iterate over keys in the specified range
-                records = self.select(key, self.table.key, [1] * self.table.num_columns)
-                for record in records:
-                    if record: 
-                        count += 1
-            return count
+            results = self.aggregate(start_range, end_range, aggregate_column_index, ('count',))
+            return False if results is None else results['count']
         except Exception as e:
-            print(f"Count error: {e}")
+            self.table.metrics.error('count', e)
             return False
+
+    @timed('order_by')
     def order_by(self, column_index, ascending=True):
         try:
             # Get all records from the table
-            records = list(self.table.page_directory.values())
+            projected_columns_index = [1] * self.table.num_columns
+            records = [self.materialize(rid, projected_columns_index) for rid in self.table.page_directory.keys()]
 
             # Sort the records based on the specified column index
             records.sort(key=lambda record: record.columns[column_index], reverse=not ascending)
 
             return records
         except Exception as e:
-            print(f"ORDER BY error: {e}")
+            self.table.metrics.error('order_by', e)
             return None
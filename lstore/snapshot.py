@@ -0,0 +1,79 @@
+"""
+Snapshot files hold a handful of flat typed arrays (sorted keys, RID postings, packed columns ...):
+
+    header      magic, format version, number of arrays
+    directory   typecode and item count of every array
+    payload     the raw array bytes back to back
+
+Loading is a single read plus one array.frombytes per array, so it costs O(bytes) and builds no per-entry objects.
+Structures snapshot themselves as a full base file plus a delta file holding only what changed since the base was
+written; the base is rewritten (compacted) once the delta grows past COMPACTION_RATIO of it.
+"""
+from array import array
+import os
+import struct
+
+MAGIC = b'LSTS'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<4sHI'
+ENTRY_FORMAT = '<cQ'
+COMPACTION_RATIO = 0.25
+
+
+"""
+# Atomically and durably replaces the file at path with the given arrays
+# The file is fsynced before the rename and the directory after it, so a crash leaves the old or the new snapshot
+"""
+def write_snapshot(path, arrays):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, len(arrays)))
+        for values in arrays:
+            file.write(struct.pack(ENTRY_FORMAT, values.typecode.encode(), len(values)))
+        for values in arrays:
+            file.write(values.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+    sync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def sync_directory(path):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+"""
+# Returns the list of arrays stored at path, None if there is no snapshot
+"""
+def read_snapshot(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        data = memoryview(file.read())
+    magic, version, count = struct.unpack_from(HEADER_FORMAT, data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise Exception(f"{path} is not a version {FORMAT_VERSION} snapshot")
+    offset = struct.calcsize(HEADER_FORMAT)
+    entries = []
+    for _ in range(count):
+        typecode, length = struct.unpack_from(ENTRY_FORMAT, data, offset)
+        entries.append((typecode.decode(), length))
+        offset += struct.calcsize(ENTRY_FORMAT)
+    arrays = []
+    for typecode, length in entries:
+        values = array(typecode)
+        size = length * values.itemsize
+        values.frombytes(data[offset:offset + size])
+        arrays.append(values)
+        offset += size
+    return arrays
+
+
+def remove_snapshot(path):
+    if os.path.exists(path):
+        os.remove(path)
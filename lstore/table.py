@@ -1,21 +1,54 @@
 from lstore.index import Index
-from lstore.time import time
-from datetime import datetime
+from lstore.page import Page, RECORDS_PER_PAGE, NULL_VALUE
+from lstore.bufferpool import BufferPool
+from lstore.lock_manager import LockManager, current_transaction
+from lstore.snapshot import read_snapshot, write_snapshot
+from lstore.metrics import Metrics
+from lstore.wal import checkpoint_lsn
+from array import array
+from time import perf_counter, time_ns
 import threading
-import os
-import pandas as pd
+import queue
+
+
+"""
+# Current time as stored in the time column: nanoseconds since the epoch, comparable across days
+"""
+def timestamp():
+    return time_ns()
+
+
+"""
+# Schema encoding of a record: bit i is set when data column i holds a value, the key column's bit is never set
+"""
+def schema_encoding(columns, key):
+    mask = 0
+    for column in range(len(columns)):
+        if column != key and columns[column] is not None:
+            mask |= 1 << column
+    return mask
+
+
+"""
+# Data columns whose bit is set in a schema encoding, lowest first
+"""
+def schema_columns(mask):
+    columns = []
+    while mask:
+        lowest = mask & -mask
+        columns.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return columns
 
 
 class Record:
 
+    __slots__ = ('rid', 'key', 'columns')
+
     def __init__(self, rid, key, columns):
         self.rid = rid
         self.key = key
         self.columns = columns
-        self.is_valid = True
-
-    def invalidate(self):
-        self.is_valid = False
 
     def __repr__(self):
         return f"Record(rid={self.rid}, key={self.key}, columns={self.columns})"
@@ -23,6 +56,98 @@ class Record:
     def __str__(self):
         return f"RID: {self.rid}, Key: {self.key}, Columns: {self.columns}"
 
+class PageDirectory:
+
+    """
+    # Maps base RIDs to the (page range, page, offset) location of their record
+    # Base RIDs are handed out in order and each one fills the next base slot, so the location is computed from the
+    # RID and the directory only keeps one live byte per RID; column values are read from the pages on demand
+    """
+    def __init__(self, table):
+        self.table = table
+        self.live = array('B', [0]) # live[rid] is 1 while the record exists, RIDs start at 1
+        self.count = 0
+        self.changed = False # modified since the last snapshot
+
+    def get(self, rid, default=None):
+        if 0 < rid < len(self.live) and self.live[rid]:
+            return self.table.base_location(rid)
+        return default
+
+    def __getitem__(self, rid):
+        location = self.get(rid)
+        if location is None:
+            raise KeyError(rid)
+        return location
+
+    def __contains__(self, rid):
+        return 0 < rid < len(self.live) and self.live[rid] == 1
+
+    def __len__(self):
+        return self.count
+
+    def add(self, rid):
+        if rid >= len(self.live):
+            self.live.extend(bytes(rid + 1 - len(self.live)))
+        if not self.live[rid]:
+            self.live[rid] = 1
+            self.count += 1
+            self.changed = True
+
+    def add_range(self, first_rid, count):
+        if first_rid == len(self.live):
+            self.live.extend(b'\x01' * count)
+            self.count += count
+            self.changed = True
+            return
+        for rid in range(first_rid, first_rid + count):
+            self.add(rid)
+
+    def __delitem__(self, rid):
+        if rid not in self:
+            raise KeyError(rid)
+        self.live[rid] = 0
+        self.count -= 1
+        self.changed = True
+
+    def keys(self):
+        return (rid for rid in range(1, len(self.live)) if self.live[rid])
+
+    def items(self):
+        return ((rid, self.table.base_location(rid)) for rid in self.keys())
+
+    """
+    # The snapshot is the live array itself, one byte per RID
+    """
+    def write_snapshot(self, path):
+        if self.changed:
+            write_snapshot(path, [self.live])
+            self.changed = False
+
+    def read_snapshot(self, path):
+        arrays = read_snapshot(path)
+        if arrays is None or len(arrays) != 1 or arrays[0].typecode != 'B':
+            return False
+        self.live = arrays[0]
+        self.count = self.live.count(1)
+        self.changed = False
+        return True
+
+    """
+    # Rebuilds the directory from the RID column of the base pages, deleted records have their RID cleared
+    """
+    def rebuild(self):
+        table = self.table
+        self.live = array('B', [0])
+        self.count = 0
+        for page_range, state in enumerate(table.page_ranges):
+            for page_number, page_set in enumerate(state['base_pages']):
+                for rid in table.read_column(page_range, 'base', page_number, table.num_columns)[:page_set['num_records']]:
+                    if rid != NULL_VALUE:
+                        self.add(rid)
+        self.changed = True
+
+
 class Table:
 
     """
@@ -34,104 +159,250 @@ class Table:
         self.name = name
         self.key = key
         self.num_columns = num_columns
-        self.page_directory = {}
+        self.page_directory = PageDirectory(self)
         self.index = Index(self)
         self.next_base_rid = 1  # base positive
-        self.next_tail_rid = -1 # tail negative
-        self.lock_table = {}
+        self.lock_manager = LockManager() # record locks for strict 2PL, keyed by primary key
+        self.metrics = Metrics(name) # operation counts and latencies, merge timings and events, see Database.stats
+        self.uncommitted = {} # (page_range, rid) of versions written by running transactions -> the transaction
         self.page_ranges = []
         
         self.path = ""
-        self.Bpages = {f'Column_{i + 1}': [] for i in range(self.num_columns + 4)}
-        self.Tpages = {f'Column_{i + 1}': [] for i in range(self.num_columns + 5)}
-        self.max_records_per_page = 512 # max records per base page
+        self.disk = None # DiskManager the page ranges are persisted to, set by the Database
+        self.wal = None # WriteAheadLog page changes are logged to before they can reach the disk, set by the Database
+        self.bufferpool = BufferPool() # replaced by the Database's shared bufferpool
+        self.dirty_directories = set() # (page_range, 'base' or 'tail') whose page range file footer is out of date
+        self.compression = True # pack the base pages of cold page ranges, see compress_cold_ranges
+        self.max_records_per_page = RECORDS_PER_PAGE # max records per base page (4096 byte page / 8 byte slots)
+        self.records_per_range = 16 * self.max_records_per_page # 16 base pages per page range
         self.records_inserted = 0
         self.current_page_range = 0 # current page range
         self.current_base_page = 0 # current base page
-        self.merge_counter = 0 # merge every n updates
+        self.latch = threading.RLock() # serializes base page appends with merge swaps
 
-        self.TPS = 0
+        # background merge: page ranges are queued once they gather merge_threshold full, unmerged tail pages
+        self.merge_threshold = 1
+        self.merge_queue = queue.Queue(maxsize=16) # writers block on a full queue (backpressure)
+        self.pending_merges = queue.Queue() # page ranges waiting for room in merge_queue
+        self.merge_stats = {'merges': 0, 'records_merged': 0, 'merge_time': 0.0, 'last_merge_time': 0.0, 'backpressure_waits': 0}
         self.merge_thread = threading.Thread(target=self.__background_merge)
         self.merge_thread.daemon = True
 
-    def lock_record(self, primary_key, transaction_id):
-        if primary_key in self.lock_table:
-            # Record is already locked
-            return False
-        else:
-            self.lock_table[primary_key] = transaction_id
-            return True
-        
-    def unlock_record(self, primary_key):
-        if primary_key in self.lock_table:
-            del self.lock_table[primary_key]
-
     def is_locked(self, primary_key):
-        return primary_key in self.lock_table
+        return self.lock_manager.is_locked(primary_key)
     
-    def add_record(self, columns):
-        try:      
-            key = columns[0]
-            rid = self.generate_base_rid()
-            record = Record(rid, key, columns)
-            self.page_directory[rid] = record # add to page directory
-            for i in range(0,len(columns)):
-                self.index.add_to_index(i, columns[i], rid) # add to indices
-            return True
-        
-        except Exception as e:
-            # for debugging
-            print(f"Insertion error: {e}")
-            return False
-        
     def generate_base_rid(self):
         current_rid = self.next_base_rid
         self.next_base_rid += 1
         return current_rid
 
-    def generate_tail_rid(self):
-        current_rid = self.next_tail_rid
-        self.next_tail_rid -= 1 
-        return current_rid
+    def generate_tail_rid(self, page_range):
+        # tail RIDs are negative and count down per page range, -rid - 1 is the record's position in the range's tail
+        tail_pages = self.page_ranges[page_range]['tail_pages']
+        return -((len(tail_pages) - 1) * self.max_records_per_page + tail_pages[-1]['num_records'] + 1)
+
+    """
+    # Returns (page_range, page_number, offset) of a base record, base RIDs are assigned sequentially
+    """
+    def base_location(self, rid):
+        position = rid - 1
+        return position // self.records_per_range, position % self.records_per_range // self.max_records_per_page, position % self.max_records_per_page
+
+    """
+    # Returns (page_number, offset) of a tail record within its page range
+    """
+    def tail_location(self, rid):
+        position = -rid - 1
+        return position // self.max_records_per_page, position % self.max_records_per_page
 
     def get_time(self):
-        return datetime.now().strftime("%H:%M:%S")
+        return timestamp()
+
+    def new_base_page(self):
+        # The page set keeps the record count, every column (data, RID, indirection, schema encoding, time) is a
+        # packed 64-bit Page that lives in the bufferpool
+        return {'num_records': 0}
+
+    def new_tail_page(self):
+        # Same layout as a base page plus the BaseID column
+        return self.new_base_page()
+
+    def new_page_range(self):
+        # TPS: number of tail records of this range already merged into its base pages
+        # base_writes counts changes to the base pages, full ranges whose count stops moving are packed, see compress_cold_ranges
+        return {'base_pages': [], 'tail_pages': [], 'TPS': 0, 'merge_queued': False, 'rollbacks': 0,
+                'base_writes': 0, 'checkpointed_writes': None, 'packed': False}
+
+    def columns_per_page(self, kind):
+        return self.num_columns + 4 if kind == 'base' else self.num_columns + 5
+
+    """
+    # Adds a new, empty base or tail page to a page range and returns its page number
+    """
+    def add_page(self, page_range, kind):
+        page_number = len(self.page_ranges[page_range][kind + '_pages'])
+        self.page_ranges[page_range][kind + '_pages'].append(self.new_base_page())
+        self.metrics.count(kind + '_pages_allocated')
+        for column in range(self.columns_per_page(kind)):
+            self.bufferpool.new_page(self, self.page_key(page_range, kind, page_number, column), Page())
+        return page_number
+
+    def page_key(self, page_range, kind, page_number, column):
+        return (self.name, page_range, kind, page_number, column)
+
+    """
+    # Bufferpool callbacks to fault a page in from and write it back to the page range files
+    # The bufferpool keeps the write-ahead rule: it syncs the log up to a page's LSN before writing the page back
+    """
+    def load_page(self, page_range, kind, page_number, column):
+        num_records = self.page_ranges[page_range][kind + '_pages'][page_number]['num_records']
+        return self.disk.read_page(page_range, kind, page_number, column, self.columns_per_page(kind), num_records)
+
+    def write_page(self, page_range, kind, page_number, column, page):
+        if self.disk is not None:
+            self.disk.write_page(page_range, kind, page_number, column, self.columns_per_page(kind), page)
+
+    def read_cell(self, page_range, kind, page_number, column, offset):
+        return self.bufferpool.read_slot(self, [self.page_key(page_range, kind, page_number, column)], offset)[0]
+
+    """
+    # Reads several page columns of one record
+    """
+    def read_cells(self, page_range, kind, page_number, columns, offset):
+        keys = [self.page_key(page_range, kind, page_number, column) for column in columns]
+        return self.bufferpool.read_slot(self, keys, offset)
+
+    def overwrite_cell(self, page_range, kind, page_number, column, offset, value):
+        lsn = 0
+        if self.wal is not None:
+            old_value = self.read_cell(page_range, kind, page_number, column, offset)
+            lsn = self.log({'op': 'cell', 'k': kind, 'r': page_range, 'p': page_number, 'c': column, 'o': offset, 'v': value, 'old': old_value})
+        if kind == 'base':
+            self.page_ranges[page_range]['base_writes'] += 1
+        key = self.page_key(page_range, kind, page_number, column)
+        page = self.bufferpool.pin(self, key)
+        try:
+            page.overwrite(offset, value)
+        finally:
+            self.bufferpool.unpin(key, dirty=True, lsn=lsn)
+
+    """
+    # Pins one column page and returns it, must be matched by unpin_column
+    """
+    def pin_column(self, page_range, kind, page_number, column):
+        return self.bufferpool.pin(self, self.page_key(page_range, kind, page_number, column))
+
+    def unpin_column(self, page_range, kind, page_number, column):
+        self.bufferpool.unpin(self.page_key(page_range, kind, page_number, column))
+
+    """
+    # Returns a copy of the written values of one column page
+    """
+    def read_column(self, page_range, kind, page_number, column):
+        page = self.pin_column(page_range, kind, page_number, column)
+        try:
+            return page.view().tolist()
+        finally:
+            self.unpin_column(page_range, kind, page_number, column)
+
+    """
+    # Appends one record to a base or tail page, returns the offset it was written to
+    """
+    def append_record(self, page_range, kind, page_number, columns):
+        page_set = self.page_ranges[page_range][kind + '_pages'][page_number]
+        lsn = 0
+        if self.wal is not None:
+            lsn = self.log({'op': 'append', 'k': kind, 'r': page_range, 'p': page_number, 'o': page_set['num_records'], 'v': list(columns)})
+        for column, value in enumerate(columns):
+            key = self.page_key(page_range, kind, page_number, column)
+            page = self.bufferpool.pin(self, key)
+            try:
+                page.write(value)
+            finally:
+                self.bufferpool.unpin(key, dirty=True, lsn=lsn)
+        offset = page_set['num_records']
+        page_set['num_records'] += 1
+        if kind == 'base':
+            self.page_ranges[page_range]['base_writes'] += 1
+        self.dirty_directories.add((page_range, kind))
+        return offset
 
     def Bpage_insert(self, *columns):
         if len(columns) != (self.num_columns + 4):
             return
 
+        page_range, page_number = self.next_base_slot()
+
+        # Insert records into the base pages
+        with self.latch:
+            self.append_record(page_range, 'base', page_number, columns)
+
+        # Add to disk, a base page is appended to its page range file once it fills up
+        if self.page_ranges[page_range]['base_pages'][page_number]['num_records'] >= self.max_records_per_page:
+            self.persist_page(page_range, 'base', page_number)
+
+    """
+    # Returns (page_range, page_number) of the base page the next record goes to, adding pages and ranges as they fill
+    """
+    def next_base_slot(self):
         # Initialize first page range
         if len(self.page_ranges) == 0:
-            self.page_ranges.append({'base_pages': [{f'Column_{i + 1}': [] for i in range(self.num_columns + 4)}], 'tail_pages': [{f'Column_{i + 1}': [] for i in range(self.num_columns + 5)}]})
+            self.page_ranges.append(self.new_page_range())
+            self.add_page(0, 'base')
+            self.add_page(0, 'tail')
         
         # Create page range if previous was full, and the last base page is full
         if len(self.page_ranges[self.current_page_range]['base_pages']) >= 16:
-            if len(self.page_ranges[self.current_page_range]['base_pages'][self.current_base_page]['Column_1']) >= self.max_records_per_page:
-                self.page_ranges.append({'base_pages': [{f'Column_{i + 1}': [] for i in range(self.num_columns + 4)}], 'tail_pages': [{f'Column_{i + 1}': [] for i in range(self.num_columns + 5)}]})
+            if self.page_ranges[self.current_page_range]['base_pages'][self.current_base_page]['num_records'] >= self.max_records_per_page:
+                self.page_ranges.append(self.new_page_range())
                 self.current_page_range += 1
-                self.current_base_page = 0
+                self.current_base_page = self.add_page(self.current_page_range, 'base')
+                self.add_page(self.current_page_range, 'tail')
 
         # Create base page if previous was full
-        # The first column is always the primary key, the last 4 pages are always RID, indirection, schema_encoding, and time
-        if len(self.page_ranges[self.current_page_range]['base_pages'][self.current_base_page]['Column_1']) >= self.max_records_per_page:
-            self.page_ranges[self.current_page_range]['base_pages'].append({f'Column_{i + 1}': [] for i in range(self.num_columns + 4)})
-            self.current_base_page += 1
+        # The first column is always the primary key, the last 4 pages are always RID, indirection, schema encoding, and time
+        if self.page_ranges[self.current_page_range]['base_pages'][self.current_base_page]['num_records'] >= self.max_records_per_page:
+            self.current_base_page = self.add_page(self.current_page_range, 'base')
+        return self.current_page_range, self.current_base_page
+
+    """
+    # Appends many records at once, columns holds one sequence of values per data column
+    # RIDs are allocated as one contiguous range and every page receives its run of values as a single slice copy
+    # Returns the RID of the first record, the others follow it in order
+    """
+    def Bpage_insert_many(self, columns):
+        count = len(columns[0])
+        time = self.get_time()
+        with self.latch:
+            first_rid = self.next_base_rid
+            self.next_base_rid += count
+            done = 0
+            while done < count:
+                page_range, page_number = self.next_base_slot()
+                page_set = self.page_ranges[page_range]['base_pages'][page_number]
+                run = min(self.max_records_per_page - page_set['num_records'], count - done)
+                rids = array('q', range(first_rid + done, first_rid + done + run))
+                lsn = 0
+                if self.wal is not None:
+                    lsn = self.log({'op': 'append_many', 'r': page_range, 'p': page_number, 'o': page_set['num_records'], 'rid': first_rid + done,
+                              'v': [list(values[done:done + run]) for values in columns], 'time': time})
+                # data columns, then RID and indirection: a new record points at itself, no column is updated yet
+                metadata = [rids, rids, array('q', [0]) * run, array('q', [time]) * run]
+                for column, values in enumerate([values[done:done + run] for values in columns] + metadata):
+                    key = self.page_key(page_range, 'base', page_number, column)
+                    page = self.bufferpool.pin(self, key)
+                    try:
+                        page.write_many(values)
+                    finally:
+                        self.bufferpool.unpin(key, dirty=True, lsn=lsn)
+                page_set['num_records'] += run
+                self.page_ranges[page_range]['base_writes'] += 1
+                self.dirty_directories.add((page_range, 'base'))
+                if page_set['num_records'] >= self.max_records_per_page:
+                    self.persist_page(page_range, 'base', page_number)
+                done += run
+        return first_rid
 
-        try:
-            # Add to disk
-            file_path = os.path.join(self.path, self.name + '.csv')
-            df = pd.read_csv(file_path)
-            df.loc[len(df)] = list(columns[0:self.num_columns])
-            df.to_csv(file_path, index=False)
-        except:
-            pass
-        
-        # Insert records into the base pages
-        for i, value in enumerate(columns):
-            column_name = f'Column_{i + 1}'
-            self.page_ranges[self.current_page_range]['base_pages'][self.current_base_page][column_name].append(value)
-        
     def Tpage_insert(self, primary_key, page_range, *columns):
         # insert records into tail pages based on page_range
         current_tail_page = len(self.page_ranges[page_range]['tail_pages']) - 1
@@ -139,87 +410,701 @@ class Table:
             return
 
         # Create tail page if previous was full
-        # The first column is always the primary key, the last 5 pages are always RID, indirection, schema_encoding, time, and BaseID
-        if len(self.page_ranges[page_range]['tail_pages'][current_tail_page]['Column_1']) >= self.max_records_per_page:
-            self.page_ranges[page_range]['tail_pages'].append({f'Column_{i + 1}': [] for i in range(self.num_columns + 5)})
-            current_tail_page = len(self.page_ranges[page_range]['tail_pages']) - 1
+        # The key column always holds the primary key, the last 5 pages are always RID, indirection, schema encoding, time, and BaseID
+        if self.page_ranges[page_range]['tail_pages'][current_tail_page]['num_records'] >= self.max_records_per_page:
+            current_tail_page = self.add_page(page_range, 'tail')
       
         # insert update records into the tail pages
-        self.page_ranges[page_range]['tail_pages'][current_tail_page]['Column_1'].append(primary_key)
-        for i, value in enumerate(columns[1:10]):
-            column_name = f'Column_{i + 2}'
-            self.page_ranges[page_range]['tail_pages'][current_tail_page][column_name].append(value)
-        # increment merge counter and merge at specified number
-        
-        self.merge_counter += 1
-        if self.merge_counter == 100:
-            self.__merge()
-            self.merge_counter = 0
-            print("Merged")
-
-            
-            
-    def get_indirection(self, current_tail_page, page_range, primary_key):
-        # first check if indirection is in tail pages
-        # if not, return rid of the record in the base pages
-        for i in range(0, len(self.page_ranges[page_range]['tail_pages'])):
-            for j in reversed(self.page_ranges[page_range]['tail_pages'][i]['Column_1']):
-                if j == primary_key:
-                    primary_key_index = self.page_ranges[page_range]['tail_pages'][i]['Column_1'].index(primary_key)
-                    return self.page_ranges[page_range]['tail_pages'][i]['Column_6'][primary_key_index]
-        return self.index.locate(0, primary_key)[0]
-
-    def insert_page_directory(self, columns, rid):
-        # insert new page_directory record during merge
-        key = columns[0]
-        rid = rid
-        record = Record(rid, key, columns)
-        self.page_directory[rid] = record
+        self.append_record(page_range, 'tail', current_tail_page, columns[:self.key] + (primary_key,) + columns[self.key + 1:])
 
-    
-    def __background_merge(self):
+        # point the base record at its newest version
+        base_range, base_page, base_offset = self.base_location(columns[-1])
+        self.overwrite_cell(base_range, 'base', base_page, self.num_columns + 1, base_offset, columns[self.num_columns])
+
+        # updates reach the disk as tail page appends, a full tail page may also make the range due for a merge
+        if self.page_ranges[page_range]['tail_pages'][current_tail_page]['num_records'] >= self.max_records_per_page:
+            self.persist_page(page_range, 'tail', current_tail_page)
+            self.request_merge(page_range)
+
+    """
+    # Writes every column of one base or tail page to its page range file
+    """
+    def persist_page(self, page_range, kind, page_number):
+        if self.disk is None:
+            return
+        for column in range(self.columns_per_page(kind)):
+            self.bufferpool.flush_page(self.page_key(page_range, kind, page_number, column))
+
+    """
+    # Writes out every page modified since it was last persisted, then the footers of the files that grew, and
+    # fsyncs every file written
+    # Writers may keep going meanwhile (a checkpoint runs next to them): pages they dirty again are written by the
+    # next flush, and a footer never counts fewer records than were written before the flush started. Merges are
+    # not logged, so a footer only claims the TPS of merges whose base pages were installed before the flush began
+    """
+    def flush(self):
+        with self.latch:
+            merged = [state['TPS'] for state in self.page_ranges]
+        self.bufferpool.flush(self.name)
+        if self.disk is None:
+            return
+        with self.latch:
+            # pages written to a packed file move it, so its footer is due even if no record count changed
+            directories = sorted(self.dirty_directories | {(page_range, 'base') for page_range in self.disk.moved_directories()})
+            footers = []
+            for page_range, kind in directories:
+                state = self.page_ranges[page_range]
+                tps = merged[page_range] if page_range < len(merged) else 0
+                if kind == 'tail' or tps == state['TPS']:
+                    self.dirty_directories.discard((page_range, kind)) # else a merge finished meanwhile, its footer is due next flush
+                footers.append((page_range, kind, [page_set['num_records'] for page_set in state[kind + '_pages']], tps))
+        for page_range, kind, num_records, tps in footers:
+            self.disk.write_directory(page_range, kind, self.columns_per_page(kind), num_records, tps)
+        # the checkpoint that called this drops the log records of these pages next
+        self.disk.sync()
+
+    def is_full(self, page_range):
+        base_pages = self.page_ranges[page_range]['base_pages']
+        return len(base_pages) == 16 and base_pages[-1]['num_records'] >= self.max_records_per_page
+
+    """
+    # Packs the base pages of cold page ranges: full ones (no insert lands there again) whose base pages did not
+    # change since the previous call, which the Database makes after every checkpoint
+    # :param idle: bool     #Pack every full range, the caller knows no more writes are coming (e.g. after a bulk load)
+    # Returns the number of page ranges packed
+    """
+    def compress_cold_ranges(self, idle=False):
+        if not self.compression or self.disk is None:
+            return 0
+        packed = 0
+        for page_range in range(len(self.page_ranges)):
+            state = self.page_ranges[page_range]
+            if state['packed'] or not self.is_full(page_range):
+                continue
+            quiet = state['base_writes'] == state['checkpointed_writes']
+            state['checkpointed_writes'] = state['base_writes']
+            if (quiet or idle) and self.compress_range(page_range):
+                packed += 1
+        return packed
+
+    """
+    # Moves the base pages of one page range into a packed file, each column page compressed on its own
+    # The pages are copied under the table latch but encoded outside it; if a write reached the base pages
+    # meanwhile the packed file is thrown away and the range stays as it is
+    """
+    def compress_range(self, page_range):
+        start = perf_counter()
+        state = self.page_ranges[page_range]
+        columns_per_page = self.columns_per_page('base')
+        with self.latch:
+            writes = state['base_writes']
+            tps = state['TPS']
+            num_records = [page_set['num_records'] for page_set in state['base_pages']]
+            pages = [[self.read_column(page_range, 'base', page_number, column) for column in range(columns_per_page)]
+                     for page_number in range(len(num_records))]
+            lsn = max(self.bufferpool.page_lsn(self.page_key(page_range, 'base', page_number, column))
+                      for page_number in range(len(num_records)) for column in range(columns_per_page))
+        if self.wal is not None:
+            self.wal.sync(lsn) # write-ahead rule, the copies may hold changes not synced yet
+        raw_bytes, packed_bytes = self.disk.pack_range(page_range, columns_per_page, pages, num_records, tps)
+        with self.latch:
+            if state['base_writes'] != writes:
+                self.disk.discard_packed(page_range)
+                return False
+            self.disk.install_packed(page_range)
+            state['packed'] = True
+            self.dirty_directories.discard((page_range, 'base')) # the packed file's footer is current
+        elapsed = perf_counter() - start
+        self.metrics.count('ranges_compressed')
+        self.metrics.event('compress', page_range=page_range, raw_bytes=raw_bytes, packed_bytes=packed_bytes, seconds=round(elapsed, 6))
+        return True
+
+    """
+    # Returns the encoded blob of a base column page of a packed range, None if the range is not packed or the
+    # bufferpool holds a newer version of the page than the blob
+    """
+    def encoded_column(self, page_range, page_number, column):
+        if not self.page_ranges[page_range]['packed'] or self.bufferpool.is_dirty(self.page_key(page_range, 'base', page_number, column)):
+            return None
+        return self.disk.encoded(page_range, page_number, column)
+
+    """
+    # Rebuilds the page range layout from the footers of the page range files
+    # No page is read here, the bufferpool faults data pages in and metadata columns are decoded on first use
+    """
+    def load_pages(self):
+        if self.disk is None:
+            return
+        self.page_ranges = []
+        for page_range in range(self.disk.num_page_ranges()):
+            self.page_ranges.append(self.new_page_range())
+            for kind in ('base', 'tail'):
+                directory = self.disk.read_directory(page_range, kind)
+                if directory is None:
+                    directory = (self.scan_directory(page_range, kind), 0)
+                    self.dirty_directories.add((page_range, kind))
+                num_records, tps = directory
+                if kind == 'base':
+                    self.page_ranges[page_range]['TPS'] = tps
+                    self.page_ranges[page_range]['packed'] = self.disk.is_packed(page_range)
+                for count in num_records:
+                    self.page_ranges[page_range][kind + '_pages'].append({'num_records': count})
+            if len(self.page_ranges[page_range]['tail_pages']) == 0:
+                self.add_page(page_range, 'tail')
+
+        self.reset_cursors()
+
+    """
+    # Points the next base insert after the last base record
+    """
+    def reset_cursors(self):
+        if self.page_ranges:
+            self.current_page_range = len(self.page_ranges) - 1
+            self.current_base_page = len(self.page_ranges[-1]['base_pages']) - 1
+            base_records = sum(page_set['num_records'] for page_range in self.page_ranges for page_set in page_range['base_pages'])
+            self.next_base_rid = base_records + 1
+
+    """
+    # Write-ahead logging: page changes are logged as redo records tagged with the writing transaction (0 outside one)
+    """
+    def log(self, record):
+        transaction = current_transaction()
+        record['t'] = self.name
+        record['x'] = transaction.transaction_id if transaction is not None else 0
+        return self.wal.append(record)
+
+    """
+    # Logs how to undo a transaction's write, recovery undoes the writes of transactions that never finished
+    """
+    def log_undo(self, undo, args):
+        if self.wal is not None:
+            self.log({'op': 'undo', 'action': undo.__name__, 'args': args})
+
+    """
+    # Replays the log of this table on top of the pages loaded from disk
+    # Redo repeats every page change logged after the last checkpoint in order; a change is a write of known
+    # values to a known slot, so repeating one that already reached the disk is harmless. Then the transactions
+    # that neither committed nor aborted are rolled back: first their changes logged after their last undo record
+    # (a write cut short by the crash) are reverted slot by slot, then their undo records run newest first, updates
+    # always compensated with a new tail record since their tail records may already be merged into base pages
+    # Returns the number of records replayed
+    """
+    def recover(self, records):
+        wal, self.wal = self.wal, None # nothing is logged while replaying
+        finished = set()
+        changes = {} # transaction id -> [(record, is an undo record)]
+        replayed = 0
+        redo_from = checkpoint_lsn(records)
+        for record in records:
+            operation = record['op']
+            if operation == 'checkpoint' or record.get('t') not in (None, self.name):
+                continue
+            transaction_id = record['x']
+            if operation in ('commit', 'abort'):
+                finished.add(transaction_id)
+                continue
+            if transaction_id:
+                changes.setdefault(transaction_id, []).append(record)
+            if record['lsn'] <= redo_from:
+                continue # already in the page files, only kept for the undo of its transaction
+            replayed += 1
+            if operation == 'append':
+                self.redo_append(record['k'], record['r'], record['p'], record['o'], record['v'])
+            elif operation == 'append_many':
+                for position in range(len(record['v'][0])):
+                    rid = record['rid'] + position
+                    columns = [values[position] for values in record['v']] + [rid, rid, 0, record['time']]
+                    self.redo_append('base', record['r'], record['p'], record['o'] + position, columns)
+            elif operation == 'cell':
+                self.redo_cell(record['k'], record['r'], record['p'], record['c'], record['o'], record['v'])
+
+        for state in self.page_ranges:
+            if not state['tail_pages']:
+                self.add_page(self.page_ranges.index(state), 'tail')
+        self.reset_cursors()
+        self.page_directory.rebuild()
+        self.index.rebuild()
+
+        losers = [records for transaction_id, records in changes.items() if transaction_id not in finished]
+        for transaction_records in losers:
+            undos = [record for record in transaction_records if record['op'] == 'undo']
+            last_undo = transaction_records.index(undos[-1]) if undos else -1
+            for record in reversed(transaction_records[last_undo + 1:]):
+                self.revert_change(record)
+            for record in reversed(undos):
+                args = record['args']
+                if record['action'] == 'rollback_update':
+                    self.rollback_update(*args, compensate=True)
+                else:
+                    getattr(self, record['action'])(*args)
+        if losers:
+            # rolled back deletes make records live again that the index built above left out
+            self.index.rebuild()
+        self.wal = wal
+        return replayed
+
+    def ensure_page(self, kind, page_range, page_number):
+        while len(self.page_ranges) <= page_range:
+            self.page_ranges.append(self.new_page_range())
+        while len(self.page_ranges[page_range][kind + '_pages']) <= page_number:
+            self.add_page(page_range, kind)
+        return self.page_ranges[page_range][kind + '_pages'][page_number]
+
+    def redo_append(self, kind, page_range, page_number, offset, columns):
+        page_set = self.ensure_page(kind, page_range, page_number)
+        if offset == page_set['num_records']:
+            self.append_record(page_range, kind, page_number, columns)
+        elif offset < page_set['num_records']:
+            for column, value in enumerate(columns):
+                self.overwrite_cell(page_range, kind, page_number, column, offset, value)
+        else:
+            raise Exception(f"Log is missing records before slot {offset} of {kind} page {page_number} of range {page_range}")
+
+    def redo_cell(self, kind, page_range, page_number, column, offset, value):
+        self.ensure_page(kind, page_range, page_number)
+        self.overwrite_cell(page_range, kind, page_number, column, offset, value)
+
+    """
+    # Undoes one logged change of an unfinished transaction: appended records are marked dead, cells get their old value
+    """
+    def revert_change(self, record):
+        if record['op'] == 'append':
+            self.overwrite_cell(record['r'], record['k'], record['p'], self.num_columns, record['o'], None)
+            rid = record['v'][self.num_columns]
+            if record['k'] == 'base' and rid in self.page_directory:
+                del self.page_directory[rid]
+        elif record['op'] == 'append_many':
+            for position in range(len(record['v'][0])):
+                self.overwrite_cell(record['r'], 'base', record['p'], self.num_columns, record['o'] + position, None)
+                if record['rid'] + position in self.page_directory:
+                    del self.page_directory[record['rid'] + position]
+        elif record['op'] == 'cell':
+            self.overwrite_cell(record['r'], record['k'], record['p'], record['c'], record['o'], record['old'])
+
+    """
+    # Recovers the record counts of a file whose footer is missing or torn (e.g. a crash before close)
+    # RIDs are never 0, so the RID column tells how many slots of a page are in use
+    """
+    def scan_directory(self, page_range, kind):
+        columns_per_page = self.columns_per_page(kind)
+        num_records = []
+        for page_number in range(self.disk.num_pages(page_range, kind, columns_per_page)):
+            rids = self.disk.read_page(page_range, kind, page_number, self.num_columns, columns_per_page, RECORDS_PER_PAGE)
+            count = next((i for i, rid in enumerate(rids.view()) if rid == 0), RECORDS_PER_PAGE)
+            if count == 0:
+                break
+            num_records.append(count)
+        return num_records
+
+    """
+    # Returns the RID of the newest version of a base record, the base RID itself if it was never updated
+    """
+    def get_indirection(self, base_rid):
+        page_range, page_number, offset = self.base_location(base_rid)
+        return self.read_cell(page_range, 'base', page_number, self.num_columns + 1, offset)
+
+    """
+    # Follows one hop down the version chain: returns the RID of the version older than rid
+    # Tail records point at the version they replaced, the chain ends at the base RID
+    """
+    def is_merged(self, page_range, rid, tps=None):
+        # a tail record is merged once its position falls below the range's TPS
+        if tps is None:
+            tps = self.page_ranges[page_range]['TPS']
+        return rid < 0 and -rid - 1 < tps
+
+    def get_previous_version(self, base_rid, rid):
+        if rid > 0:
+            return None
+        page_range = self.base_location(base_rid)[0]
+        page_number, offset = self.tail_location(rid)
+        return self.read_cell(page_range, 'tail', page_number, self.num_columns + 1, offset)
+
+    """
+    # Returns the newest value of one data column of a base record
+    # Tail records only hold the columns they updated, so walk back until one of them has it
+    """
+    def latest_value(self, base_rid, column):
+        page_range = self.base_location(base_rid)[0]
+        rid = self.get_indirection(base_rid)
+        # once the newest version is merged the base page already holds every column's newest value
+        while rid < 0 and not self.is_merged(page_range, rid):
+            page_number, offset = self.tail_location(rid)
+            value = self.read_cell(page_range, 'tail', page_number, column, offset)
+            if value is not None:
+                return value
+            rid = self.read_cell(page_range, 'tail', page_number, self.num_columns + 1, offset)
+        page_range, page_number, offset = self.base_location(base_rid)
+        return self.read_cell(page_range, 'base', page_number, column, offset)
+
+    """
+    # Returns the newest values of several data columns of a base record, walking its version chain once
+    """
+    def latest_values(self, base_rid, columns):
+        page_range, page_number, offset = self.base_location(base_rid)
+        columns = list(columns)
+        # take the TPS before reading the base: a merge installs its pages before it advances the TPS, so the base
+        # cells read below hold at least every tail record under it, a merge finishing later is not trusted
+        tps = self.page_ranges[page_range]['TPS']
+        # read the base columns together with the indirection, records that were never updated need nothing else
+        rid, *base_values = self.read_cells(page_range, 'base', page_number, [self.num_columns + 1] + columns, offset)
+        if rid == base_rid or self.is_merged(page_range, rid, tps):
+            return base_values
+        values = {}
+        missing = list(columns)
+        while missing and rid < 0 and not self.is_merged(page_range, rid, tps):
+            tail_page, tail_offset = self.tail_location(rid)
+            *tail_values, rid = self.read_cells(page_range, 'tail', tail_page, missing + [self.num_columns + 1], tail_offset)
+            for column, value in zip(list(missing), tail_values):
+                if value is not None:
+                    values[column] = value
+                    missing.remove(column)
+        for column, value in zip(columns, base_values):
+            values.setdefault(column, value)
+        return [values[column] for column in columns]
+
+    """
+    # Yields (base RID, newest values of columns) for every live record, page by page
+    # Only the RID and indirection columns and the requested columns are read, each as a whole page; records
+    # updated since the last merge are the only ones that walk their version chain
+    """
+    def scan_columns(self, columns):
+        columns = list(columns)
+        for page_range, state in enumerate(self.page_ranges):
+            for page_number in range(len(state['base_pages'])):
+                page_values = []
+                with self.latch:
+                    count = state['base_pages'][page_number]['num_records']
+                    pages = [self.read_column(page_range, 'base', page_number, column)[:count]
+                             for column in [self.num_columns, self.num_columns + 1] + columns]
+                    for rid, indirection, *values in zip(*pages):
+                        if rid == NULL_VALUE:
+                            continue # deleted
+                        if indirection != rid and not self.is_merged(page_range, indirection):
+                            values = self.latest_values(rid, columns)
+                        else:
+                            values = [None if value == NULL_VALUE else value for value in values]
+                        page_values.append((rid, values))
+                yield from page_values
+
+    def column_values(self, column):
+        for rid, values in self.scan_columns([column]):
+            yield rid, values[0]
+
+    """
+    # Returns the base RIDs of the records whose newest value of column is between begin and end inclusive
+    # Used to answer lookups on columns without an index
+    """
+    def scan(self, column, begin, end):
+        return [rid for rid, value in self.column_values(column) if value is not None and begin <= value <= end]
+
+    """
+    # Marks a base record deleted by clearing its RID slot
+    """
+    def invalidate_base_record(self, rid):
+        page_range, page_number, offset = self.base_location(rid)
+        self.overwrite_cell(page_range, 'base', page_number, self.num_columns, offset, None)
+
+    """
+    # Version chains run base indirection -> newest tail record -> ... -> snapshot record -> base RID
+    # The first update of a record appends a snapshot tail record with its original values and insert time, so every
+    # version can be rebuilt from the tail records even after merges have overwritten the base pages
+    # Returns the RID of the snapshot record
+    """
+    def snapshot_base_record(self, base_rid, columns):
+        page_range, page_number, offset = self.base_location(base_rid)
+        rid = self.generate_tail_rid(page_range)
+        time = self.read_cell(page_range, 'base', page_number, self.num_columns + 3, offset)
+        self.Tpage_insert(columns[self.key], page_range, *(tuple(columns) + (rid, base_rid, schema_encoding(columns, self.key), time, base_rid)))
+        return rid
+
+    """
+    # A version is visible as of a timestamp once it was committed at or before it, a version of a running
+    # transaction only to that transaction. The time column of a version holds its commit time, set by commit_version
+    # while the writer still hides it, so a version never turns visible to a read as of a time already past
+    """
+    def is_visible(self, page_range, kind, page_number, offset, rid, as_of, transaction_id):
+        writer = self.uncommitted.get((page_range, rid))
+        if writer is not None:
+            if writer.transaction_id == transaction_id:
+                return True
+            if writer.commit_time is None:
+                return False
+            return as_of is None or writer.commit_time <= as_of
+        if as_of is None:
+            return True
+        return self.read_cell(page_range, kind, page_number, self.num_columns + 3, offset) <= as_of
+
+    """
+    # Stamps a version written by a committing transaction with its commit time
+    """
+    def commit_version(self, version, commit_time):
+        page_range, rid = version
+        if rid > 0:
+            page_number, offset = self.base_location(rid)[1:]
+            kind = 'base'
+        else:
+            page_number, offset = self.tail_location(rid)
+            kind = 'tail'
+        with self.latch:
+            self.overwrite_cell(page_range, kind, page_number, self.num_columns + 3, offset, commit_time)
+
+    """
+    # Returns data columns of one version of a base record, None if the record is deleted or not visible
+    # Reads take no record locks, uncommitted versions of other transactions are skipped instead
+    # :param relative_version: 0 for the newest visible version, -1 for the one before it and so on,
+    #                          asking past the oldest version returns the oldest version
+    # :param as_of: only versions written at or before this timestamp are visible
+    # :param transaction_id: the reading transaction, which sees its own uncommitted writes
+    # :param columns: data columns to read, all of them by default
+    """
+    def read_version(self, base_rid, relative_version=0, as_of=None, transaction_id=None, columns=None):
+        page_range, page_number, offset = self.base_location(base_rid)
+        if self.read_cell(page_range, 'base', page_number, self.num_columns, offset) is None:
+            return None # deleted
+        if not self.is_visible(page_range, 'base', page_number, offset, base_rid, as_of, transaction_id):
+            return None
+        versions_to_skip = -relative_version
+        version = None
+        rid = self.get_indirection(base_rid)
+        while rid < 0:
+            tail_page, tail_offset = self.tail_location(rid)
+            if self.is_visible(page_range, 'tail', tail_page, tail_offset, rid, as_of, transaction_id):
+                version = rid
+                if versions_to_skip == 0:
+                    break
+                versions_to_skip -= 1
+            rid = self.read_cell(page_range, 'tail', tail_page, self.num_columns + 1, tail_offset)
+        if columns is None:
+            columns = range(self.num_columns)
+        return self.version_values(base_rid, version, columns)
+
+    """
+    # Values of columns as of the version rid, walking the version chain once
+    # Tail records only hold the columns they updated: the schema encoding of each one is matched against the
+    # columns still missing, and only the columns it holds are read
+    """
+    def version_values(self, base_rid, rid, columns):
+        page_range = self.base_location(base_rid)[0]
+        values = {}
+        missing = 0
+        for column in columns:
+            if column != self.key: # the key column is never updated, see schema_encoding
+                missing |= 1 << column
+        while missing and rid is not None and rid < 0:
+            tail_page, tail_offset = self.tail_location(rid)
+            schema, previous_rid = self.read_cells(page_range, 'tail', tail_page, [self.num_columns + 2, self.num_columns + 1], tail_offset)
+            found = schema_columns(schema & missing)
+            if found:
+                values.update(zip(found, self.read_cells(page_range, 'tail', tail_page, found, tail_offset)))
+                missing &= ~schema
+            rid = previous_rid
+        rest = [column for column in columns if column not in values]
+        if rest:
+            page_range, page_number, offset = self.base_location(base_rid)
+            values.update(zip(rest, self.read_cells(page_range, 'base', page_number, rest, offset)))
+        return [values[column] for column in columns]
+
+    """
+    # Undo log actions, each reverses one write of an aborted transaction
+    # Base and tail pages are append-only: rolled back inserts leave a deleted slot and rolled back updates a dead
+    # tail record that the version chain skips and the merge ignores
+    """
+    def rollback_insert(self, rid, columns):
+        with self.latch:
+            del self.page_directory[rid]
+            for i in range(0, len(columns)):
+                self.index.remove_from_index(i, columns[i], rid)
+            self.invalidate_base_record(rid)
+
+    def rollback_delete(self, rid, columns):
+        with self.latch:
+            self.page_directory.add(rid)
+            for i in range(0, len(columns)):
+                self.index.add_to_index(i, columns[i], rid)
+            page_range, page_number, offset = self.base_location(rid)
+            self.overwrite_cell(page_range, 'base', page_number, self.num_columns, offset, rid)
+
+    """
+    # :param changes: dict of column to (old value, new value) for every column the update changed
+    # :param compensate: always undo with a new tail record holding the old values, even if the update is not merged
+    """
+    def rollback_update(self, base_rid, primary_key, changes, tail_rid, previous_rid, compensate=False):
+        with self.latch:
+            changed = [None] * self.num_columns
+            for i, (old_value, new_value) in changes.items():
+                self.index.remove_from_index(i, new_value, base_rid)
+                self.index.add_to_index(i, old_value, base_rid)
+                changed[i] = old_value
+
+            page_range = self.base_location(base_rid)[0]
+            if not compensate and not self.is_merged(page_range, tail_rid):
+                # unlink the tail record and mark it dead so a later merge skips it
+                page_number, offset = self.tail_location(tail_rid)
+                self.overwrite_cell(page_range, 'tail', page_number, self.num_columns, offset, None)
+                base_range, base_page, base_offset = self.base_location(base_rid)
+                self.overwrite_cell(base_range, 'base', base_page, self.num_columns + 1, base_offset, previous_rid)
+                # a merge already running may have read the tail record before it was marked
+                self.page_ranges[page_range]['rollbacks'] += 1
+                return
+
+            # the update is already merged into the base pages, write the old values back as a new tail record
+            rid = self.generate_tail_rid(page_range)
+            columns = tuple(changed) + (rid, previous_rid, schema_encoding(changed, self.key), self.get_time(), base_rid)
+            self.Tpage_insert(primary_key, page_range, *columns)
+        self.wait_for_merges()
+
+    """
+    # Queues a page range for the background merge once it has merge_threshold full tail pages that are not merged yet
+    """
+    def request_merge(self, page_range):
+        state = self.page_ranges[page_range]
+        full_records = self.full_tail_records(page_range)
+        if state['merge_queued'] or full_records - state['TPS'] < self.merge_threshold * self.max_records_per_page:
+            return
+        state['merge_queued'] = True
+        with self.latch:
+            if not self.merge_thread.is_alive():
+                self.merge_thread.start()
         try:
-            self.__merge()
-        except Exception as e:
-            print(f"Merge error: {e}")
-    
-    def __merge(self):
-        
-        # Retaining the original data
-        original_base_pages = [self.page_ranges[i]['base_pages'] for i in range(0, len(self.page_ranges))]
-        # iterate through records from last TPS
-        for k in range(self.TPS, self.TPS + 100):
+            self.merge_queue.put_nowait(page_range)
+        except queue.Full:
+            # merges are falling behind, the writer waits in wait_for_merges once it has released the table latch
+            self.merge_stats['backpressure_waits'] += 1
+            self.metrics.count('merge_backpressure_waits')
+            self.pending_merges.put(page_range)
+
+    """
+    # Holds the calling writer until every merge it could not queue is queued (backpressure)
+    # Must be called without holding the table latch, the merge worker needs it to install merged pages
+    """
+    def wait_for_merges(self):
+        while not self.pending_merges.empty():
             try:
-                if k >= 512:
-                    k = k % 512
-                # get page range and page number
-                page_range = self.TPS // 8192
-                page = self.TPS // 512
-                if page > 15: 
-                    page = page % 16
-                # check if the TPS actually corresponds with a record
-                try:
-                    base_id = self.page_ranges[page_range]['tail_pages'][page]['Column_10'][k]
-                except:
-                    return False
-                # get base id and the page range the base id is in
-                base_page = base_id // 512
-                if base_id % 512 == 0:
-                    base_page = base_id // 513
-                base_page_range = base_page // 16
-                if base_page > 15: 
-                    base_page = base_page % 16
-                # get the index of the base id
-                rid_index = self.page_ranges[base_page_range]['base_pages'][base_page]['Column_6'].index(base_id)
-                # get the schema
-                schema = self.page_ranges[page_range]['tail_pages'][page]['Column_8'][k]
-                # merge with copied pages
-                for element in schema:
-                    if element == '1':
-                        column_name = 'Column_' + str(schema.index('1') + 2)
-                        self.page_ranges[base_page_range]['base_pages'][base_page][column_name][rid_index] = self.page_ranges[page_range]['tail_pages'][page][column_name][k] 
-                        
+                page_range = self.pending_merges.get_nowait()
+            except queue.Empty:
+                return
+            self.merge_queue.put(page_range)
+
+    """
+    # Waits until every queued or pending merge, and the one running, has finished
+    # Must be called without holding the table latch
+    """
+    def drain_merges(self):
+        while True:
+            self.wait_for_merges()
+            self.merge_queue.join()
+            if self.pending_merges.empty():
+                return
+
+    def full_tail_records(self, page_range):
+        tail_pages = self.page_ranges[page_range]['tail_pages']
+        full_pages = len(tail_pages) if tail_pages[-1]['num_records'] >= self.max_records_per_page else len(tail_pages) - 1
+        return full_pages * self.max_records_per_page
+
+    """
+    # Waits for queued merges to finish and stops the merge worker
+    """
+    def stop_merge(self):
+        if self.merge_thread.is_alive():
+            self.wait_for_merges()
+            self.merge_queue.put(None)
+            self.merge_thread.join()
+
+    def merge_metrics(self):
+        metrics = dict(self.merge_stats)
+        metrics['queued'] = self.merge_queue.qsize()
+        metrics['threshold'] = self.merge_threshold
+        metrics['page_ranges'] = [
+            {'TPS': state['TPS'], 'tail_pages': len(state['tail_pages']),
+             'tail_records': self.full_tail_records(page_range) + state['tail_pages'][-1]['num_records'] % self.max_records_per_page}
+            for page_range, state in enumerate(self.page_ranges)
+        ]
+        return metrics
+
+    def __background_merge(self):
+        while True:
+            page_range = self.merge_queue.get()
+            if page_range is None:
+                self.merge_queue.task_done()
+                break
+            try:
+                self.__merge(page_range)
             except Exception as e:
-                print(f"Merge error: {e}")
-            
-            self.TPS = self.TPS + 1
+                self.metrics.error('merge', e)
+            finally:
+                self.page_ranges[page_range]['merge_queued'] = False
+            # more tail pages may have filled while this merge ran, queue them before marking this merge done
+            self.request_merge(page_range)
+            self.merge_queue.task_done()
+
+    """
+    # Merges the full tail pages of one page range into copies of its base pages, then swaps the copies in
+    # Readers keep using the pages they pinned, updates only append to tail pages, so neither waits on the merge
+    """
+    def __merge(self, page_range):
+        start = perf_counter()
+        state = self.page_ranges[page_range]
+        first = state['TPS']
+        last = self.full_tail_records(page_range)
+        if last <= first:
+            return
+
+        rollbacks = state['rollbacks']
+        copies = {} # (base page, column) -> consolidated copy of the base page
+        base_id_column = self.num_columns + 4
+        for tail_page in range(first // self.max_records_per_page, last // self.max_records_per_page):
+            schemas = self.read_column(page_range, 'tail', tail_page, self.num_columns + 2)
+            base_ids = self.read_column(page_range, 'tail', tail_page, base_id_column)
+            tail_rids = self.read_column(page_range, 'tail', tail_page, self.num_columns)
+            data = {}
+            for offset in range(max(first - tail_page * self.max_records_per_page, 0), self.max_records_per_page):
+                if tail_rids[offset] == NULL_VALUE:
+                    continue # rolled back update
+                base_page, base_offset = self.base_location(base_ids[offset])[1:]
+                # apply tail records oldest first so the newest value of each column wins
+                for column in schema_columns(schemas[offset]):
+                    if column not in data:
+                        data[column] = self.read_column(page_range, 'tail', tail_page, column)
+                    if (base_page, column) not in copies:
+                        copies[(base_page, column)] = self.copy_page(page_range, 'base', base_page, column)
+                    copies[(base_page, column)].overwrite(base_offset, data[column][offset])
+
+        # swap the consolidated pages in, catching up on records inserted while the merge ran
+        with self.latch:
+            lsn = self.wal.last_lsn() if self.wal is not None else 0
+            retry = state['rollbacks'] != rollbacks
+            if not retry:
+                for (base_page, column), merged in copies.items():
+                    live = self.pin_column(page_range, 'base', base_page, column)
+                    try:
+                        merged.slots[merged.num_records:live.num_records] = live.slots[merged.num_records:live.num_records]
+                        merged.num_records = live.num_records
+                        # merges are not logged, the merged page may only reach the disk after the tail records it holds
+                        self.bufferpool.replace_page(self, self.page_key(page_range, 'base', base_page, column), merged, lsn)
+                    finally:
+                        self.unpin_column(page_range, 'base', base_page, column)
+                state['TPS'] = last
+                state['base_writes'] += 1
+                self.dirty_directories.add((page_range, 'base'))
+        if retry:
+            # an update in this merge was rolled back after its tail record was read, start over without it
+            return self.__merge(page_range)
+
+        elapsed = perf_counter() - start
+        self.merge_stats['merges'] += 1
+        self.merge_stats['records_merged'] += last - first
+        self.merge_stats['merge_time'] += elapsed
+        self.merge_stats['last_merge_time'] = elapsed
+        self.metrics.observe('merge', elapsed)
+        self.metrics.event('merge', page_range=page_range, records=last - first, seconds=round(elapsed, 6))
+
+    def copy_page(self, page_range, kind, page_number, column):
+        page = self.pin_column(page_range, kind, page_number, column)
+        try:
+            copy = Page()
+            copy.data[:] = page.data
+            copy.num_records = page.num_records
+            return copy
+        finally:
+            self.unpin_column(page_range, kind, page_number, column)
@@ -1,5 +1,10 @@
-rom lstore.table import Table, Record
+from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.table import timestamp
+from lstore.lock_manager import set_current_transaction
+import itertools
+
+transaction_ids = itertools.count(1)
 
 class Transaction:
 
@@ -8,7 +13,13 @@ class Transaction:
     """
     def __init__(self):
         self.queries = []
-        pass
+        self.transaction_id = next(transaction_ids)
+        self.locks = [] # (lock manager, key) of every lock taken, released together on commit or abort
+        self.undo_log = [] # (undo action, args) of every write, in the order the writes happened
+        self.versions = [] # (table, version key) of every version written, hidden from other readers until the end
+        self.start_time = None # snapshot reads without an explicit timestamp read as of this time
+        self.commit_time = None # set on commit, the versions written become visible to reads as of this time
+        self.tables = [] # tables the queries run on, their metrics count commits and aborts
 
     """
     # Adds the given query to this transaction
@@ -20,23 +31,78 @@ class Transaction:
     def add_query(self, query, table, *args):
         self.queries.append((query, args))
         # use grades_table for aborting
+        if table is not None and table not in self.tables:
+            self.tables.append(table)
 
         
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
     def run(self):
-        for query, args in self.queries:
-            result = query(*args)
-            # If the query has failed the transaction should abort
-            if result == False:
-                return self.abort()
-        return self.commit()
+        # queries run on this thread lock records on behalf of this transaction
+        set_current_transaction(self)
+        self.start_time = timestamp()
+        try:
+            for query, args in self.queries:
+                result = query(*args)
+                # If the query has failed the transaction should abort
+                if result == False:
+                    return self.abort()
+            return self.commit()
+        finally:
+            set_current_transaction(None)
 
     
+    """
+    # Rolls back by undoing this transaction's own writes newest first, the locks it still holds keep them private
+    """
     def abort(self):
-        #TODO: do roll-back and any other necessary operations
+        for undo, args in reversed(self.undo_log):
+            undo(*args)
+        self.undo_log = []
+        for log in self.logs():
+            log.abort(self.transaction_id)
+        self.publish_versions()
+        self.release_locks()
+        for table in self.tables:
+            table.metrics.count('transaction_aborts')
         return False
 
     
+    """
+    # The versions written are stamped with the commit time, then the commit record is logged, and made durable as
+    # the log's sync policy says, before the locks are released
+    """
     def commit(self):
-        # TODO: commit to database
+        self.undo_log = []
+        self.commit_time = timestamp()
+        for table, version in self.versions:
+            table.commit_version(version, self.commit_time)
+        for log in self.logs():
+            log.commit(self.transaction_id)
+        self.publish_versions()
+        self.release_locks()
+        for table in self.tables:
+            table.metrics.count('transaction_commits')
         return True
+
+    def logs(self):
+        logs = []
+        for table in self.tables:
+            if table.wal is not None and table.wal not in logs:
+                logs.append(table.wal)
+        return logs
+
+    def publish_versions(self):
+        for table, version in self.versions:
+            table.uncommitted.pop(version, None)
+        self.versions = []
+
+    """
+    # Strict 2PL: every lock is held until the transaction ends, then released in bulk per lock manager
+    """
+    def release_locks(self):
+        by_manager = {}
+        for lock_manager, key in self.locks:
+            by_manager.setdefault(lock_manager, []).append(key)
+        for lock_manager, keys in by_manager.items():
+            lock_manager.release_all(self, keys)
+        self.locks = []
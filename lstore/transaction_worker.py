@@ -1,16 +1,39 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import math
+import threading
+
+
+"""
+# Returns the given percentile (0-100) of a list of samples, nearest-rank, None for no samples
+"""
+def percentile(samples, percent):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
+    # :param transactions: list     #Transactions to run, copied so workers never share a list
+    # :param num_threads: int       #Size of the pool the transactions are spread over, 1 runs them in order on one thread
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = None, num_threads = 1):
         self.stats = []
-        self.transactions = transactions
+        self.transactions = list(transactions) if transactions is not None else []
+        self.num_threads = num_threads
         self.result = 0
-        pass
+        self.thread = None
+
+        self.latencies = [] # seconds per transaction, in completion order
+        self.elapsed = 0.0 # wall-clock seconds of the whole run
+        self.latch = threading.Lock() # pool threads append to stats and latencies
 
     
     """
@@ -24,20 +47,55 @@ class TransactionWorker:
     Runs all transaction as a thread
     """
     def run(self):
-        pass
-        # here you need to create a thread and call __run
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.start()
     
 
     """
     Waits for the worker to finish
     """
     def join(self):
-        pass
+        if self.thread is not None:
+            self.thread.join()
 
 
     def __run(self):
-        for transaction in self.transactions:
-            # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+        start = perf_counter()
+        if self.num_threads > 1:
+            with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+                list(pool.map(self.__run_transaction, self.transactions))
+        else:
+            for transaction in self.transactions:
+                self.__run_transaction(transaction)
+        self.elapsed = perf_counter() - start
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
+
+    def __run_transaction(self, transaction):
+        start = perf_counter()
+        # each transaction returns True if committed or False if aborted
+        committed = transaction.run()
+        latency = perf_counter() - start
+        with self.latch:
+            self.stats.append(committed)
+            self.latencies.append(latency)
+
+    """
+    # Commits, aborts, throughput (committed transactions per second) and latency percentiles in milliseconds
+    """
+    def summary(self):
+        with self.latch:
+            latencies = [latency * 1000 for latency in self.latencies]
+            commits = len(list(filter(lambda x: x, self.stats)))
+            aborts = len(self.stats) - commits
+        return {
+            'transactions': commits + aborts,
+            'commits': commits,
+            'aborts': aborts,
+            'elapsed': self.elapsed,
+            'throughput': commits / self.elapsed if self.elapsed else 0.0,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+            'latency_max': max(latencies) if latencies else None,
+        }
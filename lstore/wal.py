@@ -0,0 +1,311 @@
+"""
+Write-ahead log shared by the tables of a database. Every change to a base or tail page is appended as a redo
+record before the page can reach the disk, together with the undo actions of running transactions and their
+commit and abort markers, so the pages can be brought back to the last logged state after a crash.
+
+    segment     a file of the log directory named after the LSN of its first frame, frames back to back
+    frame       payload length, crc32 of the payload, LSN, then the payload (one pickled record dict)
+
+Records are buffered in memory and written in batches. A committing transaction waits until the log is durable
+up to its commit record; while one thread writes and fsyncs the buffer the others queue up behind it and are
+covered by the next fsync together (group commit). The sync policy trades durability for throughput:
+
+    'commit'    commit returns once its commit record is fsynced
+    'interval'  a background thread fsyncs every sync_interval seconds, a crash loses at most that window
+    'none'      commit writes the buffer to the operating system without an fsync, survives a process crash only
+
+Queries run outside a transaction become durable with the next sync, whichever triggers it.
+A checkpoint (Database.checkpoint) starts a new segment, writes the dirty pages out and logs a checkpoint record
+holding its begin LSN: every change logged up to that LSN is in the page files, so redo starts after it and the
+segments before it are deleted, except those still holding records of a running transaction, which recovery may
+have to undo. Every record names its table; Database.open loads the tables with records to redo or undo and replays
+the log into each of them, see Table.recover.
+"""
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+FRAME_FORMAT = '<IIQ'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)
+SYNC_POLICIES = ('commit', 'interval', 'none')
+BUFFER_LIMIT = 1 << 20 # bytes buffered before they are written out even if nobody commits
+SEGMENT_SUFFIX = '.log'
+
+
+class WriteAheadLog:
+
+    """
+    # :param path: string            #Log directory
+    # :param sync_policy: string     #One of SYNC_POLICIES
+    # :param sync_interval: float    #Seconds between two fsyncs under the 'interval' policy
+    """
+    def __init__(self, path, sync_policy='commit', sync_interval=0.01):
+        if sync_policy not in SYNC_POLICIES:
+            raise Exception(f"Unknown sync policy {sync_policy}")
+        self.path = path
+        self.sync_policy = sync_policy
+        self.sync_interval = sync_interval
+        os.makedirs(path, exist_ok=True)
+        self.latch = threading.Lock()
+        self.synced = threading.Condition(self.latch)
+        self.buffer = [] # encoded frames not written yet
+        self.buffered_bytes = 0
+        self.syncing = False # a thread is writing the buffer out
+        self.written_lsn = 0 # last LSN handed to the operating system
+        self.durable_lsn = 0 # last LSN fsynced
+        self.checkpoint_lsn = 0 # begin LSN of the last checkpoint
+        self.active = {} # transaction id -> LSN of its first record, until it commits or aborts
+        self.stats = {'records': 0, 'syncs': 0, 'fsyncs': 0, 'bytes': 0, 'checkpoints': 0, 'segments_deleted': 0}
+
+        # continue the LSNs of a log that was not checkpointed, its records are all written and synced
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+        last_lsn, valid_size = self.scan()
+        if self.segments:
+            os.truncate(self.segment_path(self.segments[-1]), valid_size) # drop a torn frame left by a crash
+        self.next_lsn = last_lsn + 1
+        self.written_lsn = self.durable_lsn = last_lsn
+        if not self.segments:
+            self.segments.append(self.next_lsn)
+        self.fd = self.open_segment(self.segments[-1])
+
+        self.stopped = threading.Event()
+        self.sync_thread = None
+        if sync_policy == 'interval':
+            self.sync_thread = threading.Thread(target=self.sync_periodically, daemon=True)
+            self.sync_thread.start()
+
+    def segment_path(self, first_lsn):
+        return os.path.join(self.path, f'{first_lsn:020}{SEGMENT_SUFFIX}')
+
+    def open_segment(self, first_lsn):
+        return os.open(self.segment_path(first_lsn), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    """
+    # Returns (last LSN, byte size of the valid frames of the last segment) of the log
+    """
+    def scan(self):
+        last_lsn = 0
+        size = 0
+        for first_lsn, lsn, record, end in self.frames():
+            last_lsn = lsn
+            size = end if first_lsn == self.segments[-1] else 0
+        return last_lsn, size
+
+    """
+    # Yields (segment, LSN, record, end offset in the segment) of every frame, up to the first torn one
+    """
+    def frames(self):
+        for first_lsn in list(self.segments):
+            with open(self.segment_path(first_lsn), 'rb') as file:
+                data = file.read()
+            offset = 0
+            while offset + FRAME_SIZE <= len(data):
+                length, crc, lsn = struct.unpack_from(FRAME_FORMAT, data, offset)
+                payload = data[offset + FRAME_SIZE:offset + FRAME_SIZE + length]
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    return # torn write, the log ends here
+                offset += FRAME_SIZE + length
+                yield first_lsn, lsn, pickle.loads(payload), offset
+
+    """
+    # Returns every record of the log in order, each one a dict with its 'lsn'
+    """
+    def records(self):
+        records = []
+        for first_lsn, lsn, record, end in self.frames():
+            record['lsn'] = lsn
+            records.append(record)
+        return records
+
+    """
+    # Buffers one record and returns its LSN
+    """
+    def append(self, record):
+        payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        transaction_id = record.get('x')
+        with self.latch:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self.buffer.append(struct.pack(FRAME_FORMAT, len(payload), zlib.crc32(payload), lsn) + payload)
+            self.buffered_bytes += len(payload) + FRAME_SIZE
+            self.stats['records'] += 1
+            if transaction_id and transaction_id not in self.active:
+                self.active[transaction_id] = lsn
+            full = self.buffered_bytes >= BUFFER_LIMIT
+        if full:
+            self.sync(fsync=False)
+        return lsn
+
+    def last_lsn(self):
+        with self.latch:
+            return self.next_lsn - 1
+
+    """
+    # Makes the log written (and fsynced, unless fsync is False) up to lsn, by default up to the last record
+    # The first caller writes the whole buffer, callers arriving meanwhile wait and are covered by the next round
+    """
+    def sync(self, lsn=None, fsync=True):
+        with self.latch:
+            lsn = self.next_lsn - 1 if lsn is None else lsn
+            while True:
+                done = self.durable_lsn if fsync else self.written_lsn
+                if done >= lsn:
+                    return
+                if not self.syncing:
+                    break
+                self.synced.wait()
+            self.syncing = True
+            frames = self.buffer
+            last_lsn = self.next_lsn - 1
+            self.buffer = []
+            self.buffered_bytes = 0
+        try:
+            if frames:
+                data = b''.join(frames)
+                os.write(self.fd, data)
+                self.stats['bytes'] += len(data)
+            if fsync:
+                os.fsync(self.fd)
+        finally:
+            with self.latch:
+                self.written_lsn = last_lsn
+                if fsync:
+                    self.durable_lsn = last_lsn
+                    self.stats['fsyncs'] += 1
+                self.stats['syncs'] += 1
+                self.syncing = False
+                self.synced.notify_all()
+
+    def is_durable(self, lsn):
+        return lsn <= self.durable_lsn
+
+    def sync_periodically(self):
+        while not self.stopped.wait(self.sync_interval):
+            self.sync()
+
+    """
+    # Logs the end of a transaction, a commit waits for durability as the sync policy says
+    """
+    def commit(self, transaction_id):
+        lsn = self.append({'op': 'commit', 'x': transaction_id})
+        with self.latch:
+            self.active.pop(transaction_id, None)
+        if self.sync_policy == 'commit':
+            self.sync(lsn)
+        elif self.sync_policy == 'none':
+            self.sync(lsn, fsync=False)
+        return lsn
+
+    def abort(self, transaction_id):
+        lsn = self.append({'op': 'abort', 'x': transaction_id})
+        with self.latch:
+            self.active.pop(transaction_id, None)
+        return lsn
+
+    """
+    # Writes out and fsyncs the current segment and continues the log in a new one
+    # Must be called with the latch held and no sync running
+    """
+    def start_segment(self):
+        if self.buffer:
+            data = b''.join(self.buffer)
+            os.write(self.fd, data)
+            self.stats['bytes'] += len(data)
+            self.buffer = []
+            self.buffered_bytes = 0
+        os.fsync(self.fd)
+        os.close(self.fd)
+        self.written_lsn = self.durable_lsn = self.next_lsn - 1
+        if self.segments[-1] != self.next_lsn:
+            self.segments.append(self.next_lsn)
+        self.fd = self.open_segment(self.segments[-1])
+
+    """
+    # First half of a checkpoint: closes the current segment, so the pages can be written out behind it
+    # Returns the begin LSN, the caller makes sure every change logged up to it is applied to its page
+    """
+    def begin_checkpoint(self):
+        with self.latch:
+            while self.syncing:
+                self.synced.wait()
+            self.start_segment()
+            return self.next_lsn - 1
+
+    """
+    # Second half of a checkpoint, once the pages are written out: logs the checkpoint record and deletes the
+    # segments no longer needed, those ending before the begin LSN and before the first record of every
+    # running transaction
+    """
+    def end_checkpoint(self, begin_lsn):
+        lsn = self.append({'op': 'checkpoint', 'begin': begin_lsn})
+        self.sync(lsn)
+        with self.latch:
+            self.checkpoint_lsn = begin_lsn
+            self.stats['checkpoints'] += 1
+            keep = min([begin_lsn + 1] + list(self.active.values()))
+            while len(self.segments) > 1 and self.segments[1] <= keep:
+                os.remove(self.segment_path(self.segments.pop(0)))
+                self.stats['segments_deleted'] += 1
+        return lsn
+
+    """
+    # Empties the log once every logged change is durable in the page files and no transaction is running
+    """
+    def truncate(self):
+        with self.latch:
+            while self.syncing:
+                self.synced.wait()
+            self.buffer = []
+            self.buffered_bytes = 0
+            os.close(self.fd)
+            for first_lsn in self.segments:
+                os.remove(self.segment_path(first_lsn))
+            self.segments = [self.next_lsn]
+            self.written_lsn = self.durable_lsn = self.next_lsn - 1
+            self.active = {}
+            self.fd = self.open_segment(self.next_lsn)
+
+    def close(self):
+        self.stopped.set()
+        if self.sync_thread is not None:
+            self.sync_thread.join()
+        self.sync()
+        os.close(self.fd)
+
+
+"""
+# Begin LSN of the last checkpoint record in records, every change logged up to it is in the page files
+"""
+def checkpoint_lsn(records):
+    begin_lsn = 0
+    for record in records:
+        if record['op'] == 'checkpoint':
+            begin_lsn = record['begin']
+    return begin_lsn
+
+
+"""
+# Names of the tables records hold changes of to recover: changes logged after the last checkpoint and changes of
+# transactions that never finished
+"""
+def recovery_tables(records):
+    redo_from = checkpoint_lsn(records)
+    tables = set()
+    started = {} # transaction id -> tables it changed
+    finished = set()
+    for record in records:
+        if record['op'] == 'checkpoint':
+            continue
+        if record['op'] in ('commit', 'abort'):
+            finished.add(record['x'])
+            continue
+        if record['lsn'] > redo_from:
+            tables.add(record['t'])
+        if record['x']:
+            started.setdefault(record['x'], set()).add(record['t'])
+    for transaction_id, names in started.items():
+        if transaction_id not in finished:
+            tables |= names
+    return tables
@@ -0,0 +1,24 @@
+from lstore.db import Database
+from lstore.lock_manager import set_current_transaction
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database()
+    db.open(str(tmp_path))
+    yield db
+    db.close()
+
+
+"""
+# Runs one query of transaction outside a TransactionWorker: registers it with the transaction, then runs it as that
+# transaction so its locks and undo entries are the transaction's
+"""
+def write(transaction, table, query, *args):
+    transaction.add_query(query, table, *args)
+    set_current_transaction(transaction)
+    try:
+        assert query(*args)
+    finally:
+        set_current_transaction(None)
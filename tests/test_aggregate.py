@@ -0,0 +1,77 @@
+from lstore import aggregate
+from lstore.query import Query
+import pytest
+
+
+"""
+# Runs every test once on the NumPy reductions and once on the builtin ones
+"""
+@pytest.fixture(params=['numpy', 'builtins'])
+def reducer(request, monkeypatch):
+    if request.param == 'numpy':
+        monkeypatch.setattr(aggregate, 'np', pytest.importorskip('numpy'))
+    else:
+        monkeypatch.setattr(aggregate, 'np', None)
+    return request.param
+
+
+"""
+# None cells are left out of every aggregate instead of being read as the int64 sentinel they are stored as
+"""
+def test_aggregates_skip_none_cells(db, reducer):
+    query = Query(db.create_table('A', 3, 0))
+    assert query.insert_many([(1, 2, 3), (2, None, 5), (3, 4, 6)])
+    assert query.sum(0, 10, 1) == 6
+    assert query.avg(0, 10, 1) == 3
+    assert query.min(0, 10, 1) == 2
+    assert query.max(0, 10, 1) == 4
+    assert query.count(0, 10, 1) == 2
+    assert query.count(0, 10, 2) == 3
+
+    # an update of another column makes record 2 stale, its column 1 is then read from the version chain
+    assert query.update(2, None, None, 50)
+    assert query.sum(0, 10, 1) == 6
+    assert query.min(0, 10, 1) == 2
+    assert query.count(0, 10, 1) == 2
+    assert query.sum(0, 10, 2) == 59
+
+
+"""
+# A range of an updated record and of records never updated mixes the page slices with the version chain
+"""
+def test_aggregates_read_updated_values(db, reducer):
+    query = Query(db.create_table('U', 2, 0))
+    assert query.insert_many([(key, key) for key in range(100)])
+    assert query.update(10, None, 1000)
+    assert query.delete(20)
+    assert query.sum(0, 99, 1) == sum(range(100)) - 10 + 1000 - 20
+    assert query.max(0, 99, 1) == 1000
+    assert query.count(0, 99, 1) == 99
+
+
+"""
+# The RLE runs of a packed page range are reduced without decoding them, runs of None cells included
+"""
+def test_packed_runs_skip_none_cells(db, reducer):
+    table = db.create_table('P', 2, 0)
+    query = Query(table)
+    records = table.records_per_range
+    assert query.insert_many([(key, None if key < 100 else 1) for key in range(records)])
+    assert table.compress_cold_ranges(idle=True) == 1
+    assert query.sum(0, records - 1, 1) == records - 100
+    assert query.min(0, records - 1, 1) == 1
+    assert query.count(0, records - 1, 1) == records - 100
+    assert query.avg(50, 149, 1) == 1
+
+
+"""
+# sum and avg return False for a range without records, count returns 0
+"""
+def test_empty_range(db, reducer):
+    query = Query(db.create_table('E', 2, 0))
+    assert query.insert_many([(1, None), (2, 5)])
+    assert query.sum(10, 20, 1) is False
+    assert query.avg(10, 20, 1) is False
+    assert query.count(10, 20, 1) == 0
+    assert query.sum(1, 1, 1) is False
+    assert query.sum(1, 2, 1) == 5
@@ -0,0 +1,78 @@
+from array import array
+from lstore.bitmap import Bitmap, ARRAY_LIMIT, CONTAINER_SIZE
+from lstore.index import BitmapIndex
+import pytest
+import random
+
+
+"""
+# RID sets covering sparse (array) and dense (bitset) containers, and containers only one side has
+"""
+def rid_sets():
+    generator = random.Random(17)
+    sparse = set(generator.sample(range(3 * CONTAINER_SIZE), 500))
+    dense = set(generator.sample(range(CONTAINER_SIZE, 2 * CONTAINER_SIZE), 3 * ARRAY_LIMIT))
+    full = set(range(CONTAINER_SIZE, 2 * CONTAINER_SIZE))
+    far = {5 * CONTAINER_SIZE + 1, 7 * CONTAINER_SIZE}
+    return [set(), sparse, dense, full, far, sparse | dense, dense | far]
+
+
+RID_SETS = rid_sets()
+BITMAPS = [Bitmap(rids) for rids in RID_SETS]
+
+
+@pytest.mark.parametrize('left', range(len(RID_SETS)))
+@pytest.mark.parametrize('right', range(len(RID_SETS)))
+def test_combinators_match_set_operations(left, right):
+    a, b = BITMAPS[left].copy(), BITMAPS[right].copy()
+    left, right = RID_SETS[left], RID_SETS[right]
+    assert (a & b).tolist() == sorted(left & right)
+    assert (a | b).tolist() == sorted(left | right)
+    assert (a - b).tolist() == sorted(left - right)
+    assert len(a | b) == len(left | right)
+    assert a.complement(b).tolist() == sorted(right - left)
+    # the operands are left as they were
+    assert a.tolist() == sorted(left) and b.tolist() == sorted(right)
+
+
+def test_containers_switch_between_array_and_bitset():
+    bitmap = Bitmap(range(ARRAY_LIMIT - 1))
+    assert isinstance(bitmap.containers[0], array)
+    bitmap.add(ARRAY_LIMIT)
+    assert not isinstance(bitmap.containers[0], array)
+    assert len(bitmap) == ARRAY_LIMIT
+    # results of an operation are rebuilt into the smallest container
+    assert isinstance((bitmap & Bitmap([1, 2])).containers[0], array)
+
+
+def test_add_discard_contains():
+    bitmap = Bitmap()
+    for rid in (3, 3, CONTAINER_SIZE + 9):
+        bitmap.add(rid)
+    assert 3 in bitmap and CONTAINER_SIZE + 9 in bitmap and 4 not in bitmap
+    bitmap.discard(3)
+    bitmap.discard(1000) # not in the bitmap
+    assert bitmap.tolist() == [CONTAINER_SIZE + 9]
+    bitmap.discard(CONTAINER_SIZE + 9)
+    assert not bitmap and len(bitmap) == 0
+
+    dense = Bitmap(range(2 * ARRAY_LIMIT))
+    for rid in range(2 * ARRAY_LIMIT):
+        dense.discard(rid)
+    assert not dense and dense == Bitmap()
+
+
+def test_from_live():
+    live = array('B', [0, 1, 1, 0, 1]) + array('B', [1]) * CONTAINER_SIZE
+    assert Bitmap.from_live(live).tolist() == [rid for rid, flag in enumerate(live) if flag]
+
+
+def test_bitmap_index():
+    index = BitmapIndex()
+    index.add_many([1, 2, 1, None, 3], [10, 11, 12, 13, 14])
+    assert index.get(1) == [10, 12]
+    assert index.get(None) is None # nulls are not indexed
+    assert index.bitmap_range(1, 2).tolist() == [10, 11, 12]
+    assert list(index.range(2, 3)) == [(2, [11]), (3, [14])]
+    index.remove(2, 11)
+    assert 2 not in index and len(index) == 2
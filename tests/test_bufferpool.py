@@ -0,0 +1,73 @@
+from lstore.bufferpool import BufferPool
+from lstore.page import Page
+
+
+class Log:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.durable_lsn = 0
+        self.syncs = []
+
+    def is_durable(self, lsn):
+        return lsn <= self.durable_lsn
+
+    def sync(self, lsn):
+        assert not self.pool.latch.locked() # other threads keep using the pool meanwhile
+        self.syncs.append(lsn)
+        self.durable_lsn = max(self.durable_lsn, lsn)
+
+
+class Table:
+
+    def __init__(self, pool):
+        self.wal = Log(pool)
+        self.written = [] # (key, durable LSN when written)
+
+    def load_page(self, *key):
+        return Page()
+
+    def write_page(self, *args):
+        self.written.append((args[:-1], self.wal.durable_lsn))
+
+
+def key(page):
+    return ('T', 0, 'base', page, 0)
+
+
+def test_write_back_waits_for_the_log_up_to_the_page_lsn():
+    pool = BufferPool(size=2)
+    table = Table(pool)
+    for page, lsn in ((0, 5), (1, 9)):
+        pool.pin(table, key(page))
+        pool.unpin(key(page), dirty=True, lsn=lsn)
+    pool.pin(table, key(2)) # evicts a dirty page, whose log records have to be synced first
+    pool.unpin(key(2))
+    assert table.wal.syncs == [5]
+    assert table.written == [(key(0)[1:], 5)]
+
+
+def test_clean_and_durable_frames_are_evicted_without_syncing():
+    pool = BufferPool(size=2)
+    table = Table(pool)
+    table.wal.durable_lsn = 10
+    pool.pin(table, key(0))
+    pool.unpin(key(0), dirty=True, lsn=7)
+    pool.pin(table, key(1))
+    pool.unpin(key(1))
+    for page in range(2, 6):
+        pool.pin(table, key(page))
+        pool.unpin(key(page))
+    assert table.wal.syncs == []
+    assert table.written == [(key(0)[1:], 10)]
+
+
+def test_flush_page_syncs_the_log_outside_the_latch():
+    pool = BufferPool()
+    table = Table(pool)
+    pool.pin(table, key(0))
+    pool.unpin(key(0), dirty=True, lsn=3)
+    pool.flush_page(key(0))
+    assert table.wal.syncs == [3]
+    assert table.written == [(key(0)[1:], 3)]
+    assert not pool.is_dirty(key(0))
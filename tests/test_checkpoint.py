@@ -0,0 +1,35 @@
+from lstore.db import Database
+from lstore.query import Query
+import os
+
+
+"""
+# Log records are dropped only once the pages and footers they describe are durable
+"""
+def test_checkpoint_syncs_page_files_before_dropping_log(tmp_path, monkeypatch):
+    db = Database(checkpoint_interval=None)
+    db.open(str(tmp_path))
+    table = db.create_table('C', 3, 0)
+    query = Query(table)
+    for key in range(600):
+        assert query.insert(key, key, key)
+
+    synced = set()
+    fsync = os.fsync
+    def record_fsync(fd):
+        synced.add(os.path.realpath(f'/proc/self/fd/{fd}'))
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', record_fsync)
+    unsynced_at_end = []
+    end_checkpoint = db.wal.end_checkpoint
+    def check_end_checkpoint(begin_lsn):
+        unsynced_at_end.append(set(table.disk.unsynced))
+        return end_checkpoint(begin_lsn)
+    monkeypatch.setattr(db.wal, 'end_checkpoint', check_end_checkpoint)
+
+    db.checkpoint()
+    assert unsynced_at_end == [set()]
+    for kind in ('base', 'tail'):
+        assert os.path.realpath(table.disk.file_path(0, kind)) in synced
+    assert os.path.realpath(table.disk.path) in synced # the directory the range files were created in
+    db.close()
@@ -0,0 +1,77 @@
+from lstore import compression
+from lstore.compression import RAW, FOR, DELTA, RLE, INT64_MIN, INT64_MAX
+from lstore.db import Database
+from lstore.page import RECORDS_PER_PAGE
+from lstore.query import Query
+import pytest
+import random
+
+generator = random.Random(3)
+PAGES = {
+    'raw': (RAW, [generator.randrange(INT64_MIN, INT64_MAX) for _ in range(RECORDS_PER_PAGE)]),
+    'extremes': (RAW, [INT64_MIN, INT64_MAX] * 7 + [0, -1]),
+    'for': (FOR, [generator.randrange(-1000, 1000) for _ in range(RECORDS_PER_PAGE)]),
+    'for_bits': (FOR, [generator.randrange(2) for _ in range(37)]), # sub-byte width, partial last byte
+    'for_nibbles': (FOR, [generator.randrange(-8, 8) for _ in range(301)]),
+    'for_negative': (FOR, [generator.randrange(INT64_MIN, INT64_MIN + 50000) for _ in range(200)]),
+    'delta': (DELTA, list(range(1000, 1000 + RECORDS_PER_PAGE))),
+    'delta_negative': (DELTA, list(range(-5, -5 - 3 * 200, -3))),
+    'delta_jitter': (DELTA, [10 * position + generator.randrange(3) for position in range(RECORDS_PER_PAGE)]),
+    'delta_to_max': (DELTA, list(range(INT64_MAX - 99, INT64_MAX + 1))),
+    'rle': (RLE, [7] * 300 + [INT64_MIN] * 200 + [-2] * 12),
+    'one_slot': (RAW, [INT64_MIN]), # nothing beats 8 bytes for one value
+    'one_slot_max': (RAW, [INT64_MAX]),
+    'single_value': (FOR, [-42] * RECORDS_PER_PAGE), # zero-width offsets
+    'single_value_min': (FOR, [INT64_MIN] * 5),
+}
+
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+def test_round_trip(name):
+    codec, values = PAGES[name]
+    blob = compression.encode(values)
+    assert compression.codec(blob) == codec
+    assert compression.decode(blob).tolist() == values
+    assert len(blob) <= 8 * len(values) + compression.HEADER_SIZE
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 7, 9, 255, RECORDS_PER_PAGE - 1])
+def test_partial_pages(count):
+    for codec, values in PAGES.values():
+        values = values[:count]
+        assert compression.decode(compression.encode(values)).tolist() == values
+
+
+def test_sequences_and_runs():
+    assert compression.sequence(compression.encode(range(5, 5 + 100))) == (5, 1)
+    assert compression.sequence(compression.encode(PAGES['delta_jitter'][1])) is None
+    assert compression.sequence(compression.encode(PAGES['rle'][1])) is None
+    assert compression.runs(compression.encode(PAGES['rle'][1])) == [(7, 300), (INT64_MIN, 200), (-2, 12)]
+    assert compression.runs(compression.encode(PAGES['delta'][1])) is None
+
+
+"""
+# A packed page range reads back the same after a reopen, including pages written to it after it was packed
+"""
+def test_packed_range_after_reopen(tmp_path):
+    db = Database(checkpoint_interval=None)
+    db.open(str(tmp_path))
+    table = db.create_table('P', 3, 0)
+    query = Query(table)
+    records = table.records_per_range + 100
+    assert query.insert_many([[key, key % 5, -key] for key in range(records)])
+    assert table.compress_cold_ranges(idle=True) == 1
+    assert query.update(7, None, 100, None)
+    assert query.delete(8)
+    db.close()
+
+    db.open(str(tmp_path))
+    table = db.get_table('P')
+    query = Query(table)
+    assert table.disk.is_packed(0) and not table.disk.is_packed(1)
+    assert query.select(7, 0, [1, 1, 1])[0].columns == [7, 100, -7]
+    assert query.select(8, 0, [1, 1, 1]) == []
+    assert query.select(9, 0, [1, 1, 1])[0].columns == [9, 4, -9]
+    assert query.sum(0, records - 1, 2) == -sum(range(records)) + 8
+    assert query.sum(0, records - 1, 1) == sum(key % 5 for key in range(records)) - 3 + 98
+    db.close()
@@ -0,0 +1,116 @@
+from lstore.db import Database
+from lstore.index import OrderedIndex
+from lstore.query import Query
+import random
+
+
+def entries(index, begin=float('-inf'), end=float('inf')):
+    return [(value, sorted(rids)) for value, rids in index.range(begin, end)]
+
+
+def expected_entries(model, begin=float('-inf'), end=float('inf')):
+    return [(value, sorted(rids)) for value, rids in sorted(model.items()) if begin <= value <= end and rids]
+
+
+"""
+# Random adds and removes across many chunk splits agree with a dict of value -> RIDs
+"""
+def test_ordered_index_matches_a_model():
+    generator = random.Random(5)
+    index = OrderedIndex(chunk_size=4)
+    model = {}
+    for rid in range(2000):
+        value = generator.randrange(-300, 300)
+        index.add(value, rid)
+        model.setdefault(value, []).append(rid)
+        if rid % 3 == 0:
+            value = generator.choice([value for value in model if model[value]])
+            removed = model[value].pop()
+            index.remove(value, removed)
+    assert entries(index) == expected_entries(model)
+    assert entries(index, -50, 75) == expected_entries(model, -50, 75)
+    assert len(index) == len([value for value in model if model[value]])
+    assert all(len(chunk) <= 8 for chunk in index.chunks)
+    assert index.maxes == [chunk[-1] for chunk in index.chunks]
+    assert index.get(1000) is None and 1000 not in index
+
+
+def test_null_values_are_not_indexed():
+    index = OrderedIndex()
+    index.add(None, 1)
+    index.remove(None, 1)
+    index.add_many([None, 4], [2, 3])
+    assert entries(index) == [(4, [3])]
+
+
+"""
+# After a snapshot the entries live in the frozen arrays, modified values move back into the chunks
+"""
+def test_frozen_layer_and_delta():
+    index = OrderedIndex(chunk_size=4)
+    index.add_many(range(100), range(1000, 1100))
+    base = index.compact()
+    assert index.chunks == [] and index.get(10) == [1010]
+    index.add(10, 5)
+    index.remove(20, 1020)
+    index.add(500, 6)
+    model = {value: [1000 + value] for value in range(100)}
+    model[10].append(5)
+    model[20] = []
+    model[500] = [6]
+    assert entries(index) == expected_entries(model)
+    assert entries(index, 5, 25) == expected_entries(model, 5, 25)
+
+    reopened = OrderedIndex(chunk_size=4)
+    reopened.freeze(*base)
+    reopened.load_delta(*index.delta())
+    assert entries(reopened) == expected_entries(model)
+    assert 20 not in reopened
+
+
+def test_indexes_survive_reopen(tmp_path):
+    db = Database(checkpoint_interval=None)
+    db.open(str(tmp_path))
+    table = db.create_table('I', 3, 0)
+    query = Query(table)
+    for key in range(1000):
+        assert query.insert(key, key % 10, key % 3)
+    table.index.create_index(1)
+    table.index.create_index(2, 'bitmap')
+    assert query.update(4, None, 99, 2)
+    db.close()
+
+    db.open(str(tmp_path))
+    table = db.get_table('I')
+    assert table.index.kind(1) == 'ordered' and table.index.kind(2) == 'bitmap'
+    assert sorted(table.index.locate(1, 99)) == [5]
+    assert len(table.index.locate(1, 4)) == 99
+    assert sorted(table.index.locate_range(998, 1000, 0)) == [999, 1000]
+    assert len(table.index.locate(2, 2)) == 334
+    db.close()
+
+
+"""
+# Batches merged into an index that already holds chunked and frozen values agree with adding one by one
+"""
+def test_add_many_merges_into_a_filled_index():
+    generator = random.Random(9)
+    index = OrderedIndex(chunk_size=8)
+    model = {}
+    index.add_many([0, 50, 100], [1, 2, 3])
+    model.update({0: [1], 50: [2], 100: [3]})
+    index.compact()
+    rid = 10
+    for batch_size in (1, 5, 40, 300, 1000):
+        values = [generator.choice([None, generator.randrange(-200, 400)]) for _ in range(batch_size)]
+        index.add_many(values, range(rid, rid + batch_size))
+        for value in values:
+            if value is not None:
+                model.setdefault(value, []).append(rid)
+            rid += 1
+        assert entries(index) == expected_entries(model)
+        assert all(len(chunk) <= 16 for chunk in index.chunks)
+        assert index.maxes == [chunk[-1] for chunk in index.chunks]
+        assert sum(len(chunk) for chunk in index.chunks) == len(index.postings)
+    index.add_many(range(1000, 1100), range(100)) # past every indexed value
+    assert entries(index, 1000, 2000) == [(value, [value - 1000]) for value in range(1000, 1100)]
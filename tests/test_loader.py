@@ -0,0 +1,86 @@
+from array import array
+from lstore import loader
+from lstore.query import Query
+import pytest
+
+
+def rows_of(query, keys, num_columns):
+    return [record.columns for key in keys for record in query.select(key, 0, [1] * num_columns)]
+
+
+"""
+# Records inserted in bulk read back, aggregate, update and survive a reopen like records inserted one at a time
+"""
+def test_insert_many_round_trip(db, tmp_path):
+    table = db.create_table('B', 3, 0)
+    query = Query(table)
+    rows = [[key, key % 7, None if key % 5 == 0 else -key] for key in range(1200)]
+    assert query.insert_many(rows)
+    assert query.insert_many([]) is True
+    assert rows_of(query, range(1200), 3) == rows
+    assert query.sum(0, 1199, 1) == sum(row[1] for row in rows)
+    assert query.update(600, None, 100, None)
+    rows[600][1] = 100
+
+    db.close()
+    db.open(str(tmp_path))
+    query = Query(db.get_table('B'))
+    assert rows_of(query, range(1200), 3) == rows
+    assert query.insert(1200, 1, 2)
+    assert query.select(1200, 0, [1, 1, 1])[0].columns == [1200, 1, 2]
+
+
+def test_insert_columns(db):
+    table = db.create_table('C', 3, 0)
+    query = Query(table)
+    keys = array('q', range(10, 0, -1))
+    assert query.insert_columns([keys, array('q', [2] * 10), [None] * 10])
+    assert rows_of(query, range(1, 11), 3) == [[key, 2, None] for key in range(1, 11)]
+    assert [key for key, rids in table.index.indices[0].range(0, 100)] == list(range(1, 11))
+    assert query.insert_columns([[11], [2]]) is False
+    assert query.count(0, 100, 1) == 10
+
+
+"""
+# A CSV load skips the header, parses empty fields as None and splits the file into insert_columns batches
+"""
+def test_load_csv(db, tmp_path):
+    path = tmp_path / 'grades.csv'
+    path.write_text('id;a;b\n' + ''.join(f"{key};{key * 2};{'' if key % 3 == 0 else key}\n" for key in range(25)))
+    query = Query(db.create_table('G', 3, 0))
+    assert loader.load_csv(query, str(path), delimiter=';', batch_size=10) == 25
+    assert rows_of(query, range(25), 3) == [[key, key * 2, None if key % 3 == 0 else key] for key in range(25)]
+    assert query.sum(0, 24, 2) == sum(key for key in range(25) if key % 3)
+
+
+def test_load_csv_without_header(db, tmp_path):
+    path = tmp_path / 'grades.csv'
+    path.write_text('1,2\n3,4\n')
+    query = Query(db.create_table('G', 2, 0))
+    assert loader.load_csv(query, str(path), header=False) == 2
+    assert rows_of(query, [1, 3], 2) == [[1, 2], [3, 4]]
+
+
+def test_load_csv_rejects_a_bad_row(db, tmp_path):
+    path = tmp_path / 'grades.csv'
+    path.write_text('id,a\n1,2\n2\n')
+    query = Query(db.create_table('G', 2, 0))
+    with pytest.raises(Exception):
+        loader.load_csv(query, str(path))
+
+
+def test_load_array(db):
+    np = pytest.importorskip('numpy')
+    values = np.arange(3000, dtype=np.int64).reshape(1000, 3)
+    query = Query(db.create_table('N', 3, 0))
+    assert loader.load_array(query, values, batch_size=256) == 1000
+    assert rows_of(query, [0, 297, 2997], 3) == [[0, 1, 2], [297, 298, 299], [2997, 2998, 2999]]
+    assert query.sum(0, 2999, 1) == int(values[:, 1].sum())
+    with pytest.raises(Exception):
+        loader.load_array(query, np.arange(3))
+
+
+def test_load_array_needs_numpy(db, monkeypatch):
+    monkeypatch.setattr(loader, 'np', None)
+    with pytest.raises(Exception):
+        loader.load_array(Query(db.create_table('N', 2, 0)), [[1, 2]])
@@ -0,0 +1,70 @@
+from lstore.lock_manager import LockManager
+from lstore.transaction import Transaction
+import threading
+
+
+def test_shared_locks_are_compatible():
+    locks = LockManager()
+    first, second = Transaction(), Transaction()
+    assert locks.acquire(first, 1)
+    assert locks.acquire(second, 1)
+    assert locks.acquire(None, 1) # a query outside a transaction may read
+    assert not locks.acquire(None, 1, exclusive=True)
+    assert not locks.acquire(first, 1, exclusive=True)
+    assert locks.stats()['conflicts'] == 1
+
+
+def test_exclusive_lock_refuses_others_without_waiting():
+    locks = LockManager()
+    writer, reader = Transaction(), Transaction()
+    assert locks.acquire(writer, 1, exclusive=True)
+    assert locks.acquire(writer, 1) # exclusive covers shared
+    assert not locks.acquire(reader, 1)
+    assert not locks.acquire(reader, 1, exclusive=True)
+    assert not locks.acquire(None, 1)
+    assert locks.acquire(reader, 2, exclusive=True) # other keys are not affected
+
+
+def test_upgrade_of_a_lone_shared_lock():
+    locks = LockManager()
+    transaction = Transaction()
+    assert locks.acquire(transaction, 1)
+    assert locks.acquire(transaction, 1, exclusive=True)
+    assert locks.stats()['upgrades'] == 1
+    assert len(transaction.locks) == 1 # released once
+    transaction.release_locks()
+    assert not locks.is_locked(1)
+
+
+def test_release_frees_every_key():
+    locks = LockManager(num_stripes=4)
+    transaction, other = Transaction(), Transaction()
+    for key in range(20):
+        assert locks.acquire(transaction, key, exclusive=key % 2 == 0)
+    assert locks.acquire(other, 1)
+    transaction.release_locks()
+    assert locks.is_locked(1) # still shared by the other transaction
+    assert not locks.is_locked(1, exclusive_only=True)
+    assert locks.stats()['locked_keys'] == 1
+    for key in range(20):
+        assert locks.acquire(other, key, exclusive=True)
+
+
+"""
+# Concurrent writers on one key: exactly one gets the lock, the rest are refused instead of blocking
+"""
+def test_one_writer_wins_under_contention():
+    locks = LockManager()
+    transactions = [Transaction() for _ in range(16)]
+    results = [None] * len(transactions)
+    barrier = threading.Barrier(len(transactions))
+    def lock(position):
+        barrier.wait()
+        results[position] = locks.acquire(transactions[position], 'hot', exclusive=True)
+    threads = [threading.Thread(target=lock, args=(position,)) for position in range(len(transactions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert locks.stats()['conflicts'] == len(transactions) - 1
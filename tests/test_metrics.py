@@ -0,0 +1,59 @@
+from lstore.query import Query
+from time import perf_counter
+
+
+"""
+# Database.stats reports the bufferpool, the catalog, the log and, per open table, timed queries, failures,
+# merges, locks, record count and compression
+"""
+def test_stats_after_queries(db):
+    table = db.create_table('S', 2, 0)
+    query = Query(table)
+    for key in range(10):
+        assert query.insert(key, key)
+    assert query.update(3, None, 30)
+    assert query.select(3, 0, [1, 1])[0].columns == [3, 30]
+    assert query.update(100, None, 1) is False
+    assert query.sum(0, 9, 1) == sum(range(10)) + 27
+
+    stats = db.stats()
+    assert {'bufferpool', 'tables', 'catalog', 'wal'} <= set(stats)
+    assert 'profile' not in stats
+    assert stats['catalog'] == {'tables': 1, 'open': ['S']}
+    assert stats['bufferpool']['frames'] > 0
+    assert stats['wal']['last_lsn'] >= stats['wal']['checkpoint_lsn']
+
+    table_stats = stats['tables']['S']
+    assert {'counters', 'latency', 'events', 'merge', 'locks', 'records', 'compression'} <= set(table_stats)
+    assert table_stats['records'] == 10
+    counters = table_stats['counters']
+    assert counters['insert'] == 10
+    assert counters['update'] == 2 and counters['update_failed'] == 1
+    assert counters['select'] == 1 and counters['sum'] == 1
+    latency = table_stats['latency']['insert']
+    assert latency['count'] == 10
+    assert 0 <= latency['p50_ms'] <= latency['p99_ms'] <= latency['max_ms']
+    assert table_stats['merge']['merges'] == 0
+
+
+"""
+# A start/stop cycle of the profiler samples the thread running queries and reports where it spent its time
+"""
+def test_profiler_cycle(db):
+    assert db.stop_profiler() is None
+    query = Query(db.create_table('P', 2, 0))
+    for key in range(200):
+        assert query.insert(key, key)
+
+    db.start_profiler(interval=0.001)
+    assert 'profile' in db.stats()
+    deadline = perf_counter() + 5
+    while perf_counter() < deadline and not db.profiler.report()['top']:
+        for key in range(200):
+            query.select(key, 0, [1, 1])
+    report = db.stop_profiler()
+    assert report['samples'] > 0
+    assert report['top']
+    assert all(entry['count'] > 0 and 0 < entry['share'] <= 1 for entry in report['top'])
+    assert sum(entry['share'] for entry in report['top']) <= 1.0001
+    assert db.profiler is None and 'profile' not in db.stats()
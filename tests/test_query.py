@@ -0,0 +1,102 @@
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+
+def reopen(db, path):
+    db.close()
+    db.open(path)
+    return db
+
+
+"""
+# Tables whose primary key is not the first column keep the key in its own column of every tail record
+"""
+def test_update_with_key_not_first_column(db):
+    query = Query(db.create_table('K', 4, 1))
+    assert query.insert(100, 1, 7, 8)
+    assert query.update(1, None, None, 70, None)
+    assert query.select(1, 1, [1, 1, 1, 1])[0].columns == [100, 1, 70, 8]
+    assert query.update(1, 5, None, None, None)
+    assert query.select(1, 1, [1, 1, 1, 1])[0].columns == [5, 1, 70, 8]
+    assert query.sum(1, 1, 0) == 5
+    assert query.select_version(1, 1, [1, 1, 1, 1], -1)[0].columns == [100, 1, 70, 8]
+    assert query.select_version(1, 1, [1, 1, 1, 1], -2)[0].columns == [100, 1, 7, 8]
+
+
+def test_merge_with_key_not_first_column(db, tmp_path):
+    table = db.create_table('K', 3, 2)
+    query = Query(table)
+    for key in range(10):
+        assert query.insert(key, -key, key)
+    # enough updates to fill tail pages and merge them into the base pages
+    for value in range(1, 1200):
+        assert query.update(value % 10, value, None, None)
+    expected = {key: [max(value for value in range(1, 1200) if value % 10 == key), -key, key] for key in range(10)}
+
+    db = reopen(db, str(tmp_path))
+    query = Query(db.get_table('K'))
+    for key in range(10):
+        assert query.select(key, 2, [1, 1, 1])[0].columns == expected[key]
+    assert query.sum(0, 9, 0) == sum(columns[0] for columns in expected.values())
+    assert query.sum(0, 9, 1) == -45
+
+
+def test_delete_removes_index_entries(db):
+    table = db.create_table('D', 3, 0)
+    query = Query(table)
+    assert query.insert(1, 10, 100)
+    assert query.delete(1)
+    assert table.index.locate(0, 1) == []
+    assert query.update(1, None, 11, None) is False
+    assert query.increment(1, 1) is False
+
+    # a reinserted key gets a new RID, updates go to it and not to the deleted record
+    assert query.insert(1, 20, 200)
+    assert query.update(1, None, 21, None)
+    assert query.increment(1, 2)
+    assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 21, 201]
+    assert query.sum(1, 1, 1) == 21
+
+
+"""
+# Deleting a key that several records share deletes all of them
+"""
+def test_delete_duplicate_key(db):
+    table = db.create_table('D', 2, 0)
+    query = Query(table)
+    for value in (10, 20, 30):
+        assert query.insert(1, value)
+    assert query.insert(2, 40)
+    assert query.delete(1)
+    assert table.index.locate(0, 1) == []
+    assert query.select(1, 0, [1, 1]) == []
+    assert [record.columns for record in query.select(2, 0, [1, 1])] == [[2, 40]]
+    assert query.sum(0, 10, 1) == 40
+
+
+def test_deleted_records_stay_out_of_the_index_after_reopen(db, tmp_path):
+    table = db.create_table('D', 2, 0)
+    query = Query(table)
+    for key in range(5):
+        assert query.insert(key, key)
+    assert query.delete(3)
+
+    db = reopen(db, str(tmp_path))
+    table = db.get_table('D')
+    query = Query(table)
+    assert table.index.locate(0, 3) == []
+    assert query.select(3, 0, [1, 1]) == []
+    assert query.sum(0, 4, 1) == 7
+
+
+def test_aborted_delete_restores_index_entries(db):
+    table = db.create_table('D', 2, 0)
+    query = Query(table)
+    assert query.insert(1, 10)
+    transaction = Transaction()
+    transaction.add_query(query.delete, table, 1)
+    transaction.add_query(query.update, table, 2, None, 0) # no record with key 2, aborts
+    assert transaction.run() is False
+    assert query.select(1, 0, [1, 1])[0].columns == [1, 10]
+    assert query.update(1, None, 11)
+    assert query.sum(1, 1, 1) == 11
@@ -0,0 +1,138 @@
+from lstore.db import Database
+from lstore.query import Query
+import os
+import pytest
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHILD = '''
+import os, sys
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from tests.conftest import write
+
+db = Database(sync_policy=sys.argv[2], checkpoint_interval=None)
+db.open(sys.argv[1])
+'''
+
+
+"""
+# Runs body in a new process against the database at path, the process dies without closing the database
+"""
+def crash(path, body, sync_policy='commit'):
+    script = CHILD + textwrap.dedent(body) + '\nos._exit(0)\n'
+    subprocess.run([sys.executable, '-c', script, path, sync_policy], cwd=ROOT, check=True, timeout=120)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'db')
+
+
+"""
+# Opens the database at path (recovering it), checks it, then checks it again after a clean close and reopen
+"""
+def check(path, name, expected, sync_policy='commit'):
+    for _ in range(2):
+        db = Database(sync_policy=sync_policy, checkpoint_interval=None)
+        db.open(path)
+        query = Query(db.get_table(name))
+        for key, columns in expected.items():
+            records = query.select(key, 0, [1] * 3)
+            assert [record.columns for record in records] == ([columns] if columns is not None else []), key
+        live = [columns for columns in expected.values() if columns is not None]
+        assert query.sum(min(expected), max(expected), 1) == sum(columns[1] for columns in live)
+        db.close()
+
+
+def test_redo_after_checkpoint(path):
+    crash(path, """
+        table = db.create_table('R', 3, 0)
+        query = Query(table)
+        for key in range(1000):
+            assert query.insert(key, key, 0)
+        db.checkpoint()
+        for key in range(0, 1000, 10):
+            assert query.update(key, None, key + 1000, None)
+        assert query.delete(5)
+        for key in range(1000, 1100):
+            assert query.insert(key, key, 1)
+        transaction = Transaction()
+        transaction.add_query(query.update, table, 7, None, None, 77)
+        assert transaction.run()
+    """)
+    expected = {key: [key, key, 0] for key in range(1000)}
+    for key in range(0, 1000, 10):
+        expected[key][1] = key + 1000
+    expected[5] = None
+    expected.update({key: [key, key, 1] for key in range(1000, 1100)})
+    expected[7][2] = 77
+    check(path, 'R', expected)
+
+
+def test_losers_are_undone(path):
+    crash(path, """
+        table = db.create_table('L', 3, 0)
+        query = Query(table)
+        for key in range(10):
+            assert query.insert(key, key, 0)
+        committed = Transaction()
+        committed.add_query(query.update, table, 1, None, 100, None)
+        assert committed.run()
+        loser = Transaction()
+        write(loser, table, query.update, 2, None, -1, -1)
+        write(loser, table, query.insert, 50, 50, 50)
+        write(loser, table, query.delete, 3)
+        write(loser, table, query.update, 1, None, -1, None)
+        db.wal.sync()
+    """)
+    expected = {key: [key, key, 0] for key in range(10)}
+    expected[1][1] = 100
+    expected[50] = None
+    check(path, 'L', expected)
+
+
+"""
+# A transaction still running at a checkpoint has changes in the page files that recovery has to undo
+"""
+def test_loser_spanning_a_checkpoint(path):
+    crash(path, """
+        table = db.create_table('S', 3, 0)
+        query = Query(table)
+        for key in range(600):
+            assert query.insert(key, key, 0)
+        loser = Transaction()
+        write(loser, table, query.update, 4, None, -4, None)
+        write(loser, table, query.delete, 8)
+        db.checkpoint()
+        write(loser, table, query.update, 6, None, -6, None)
+        write(loser, table, query.insert, 1000, 1000, 1000)
+        for key in range(500, 600):
+            assert query.update(key, None, None, 1)
+        db.checkpoint()
+        write(loser, table, query.update, 4, None, None, -44)
+        db.wal.sync()
+    """)
+    expected = {key: [key, key, 1 if key >= 500 else 0] for key in range(600)}
+    expected[1000] = None
+    check(path, 'S', expected)
+
+
+def test_none_policy_survives_a_process_crash(path):
+    crash(path, """
+        table = db.create_table('N', 3, 0)
+        query = Query(table)
+        transaction = Transaction()
+        for key in range(20):
+            transaction.add_query(query.insert, table, key, key, key)
+        assert transaction.run()
+        transaction = Transaction()
+        transaction.add_query(query.update, table, 3, None, 33, None)
+        assert transaction.run()
+    """, sync_policy='none')
+    expected = {key: [key, key, key] for key in range(20)}
+    expected[3][1] = 33
+    check(path, 'N', expected, sync_policy='none')
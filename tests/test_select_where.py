@@ -0,0 +1,93 @@
+from lstore.query import Query
+import pytest
+
+PREDICATES = [
+    [(1, '=', 2)],
+    [(2, 'range', (40, 120))],
+    [(3, 'in', [0, 7])],
+    [(1, '=', 0), (3, 'in', {1})],
+    [(1, 'in', [1, 2]), (2, 'range', (0, 90)), (3, '=', 0)],
+    [(1, 'range', (5, 9))],
+]
+
+
+"""
+# A table of 20 records with a few of them updated and deleted, and the live rows it should hold
+"""
+@pytest.fixture
+def table(db):
+    table = db.create_table('W', 4, 0)
+    query = Query(table)
+    rows = {key: [key, key % 3, key * 10, key % 2] for key in range(20)}
+    assert query.insert_many(list(rows.values()))
+    for key in (4, 11):
+        assert query.update(key, None, 2, None, 7)
+        rows[key][1] = 2
+        rows[key][3] = 7
+    for key in (6, 13):
+        assert query.delete(key)
+        del rows[key]
+    table.rows = rows
+    return table
+
+
+def matching(rows, predicates):
+    tests = {
+        '=': lambda value, operand: value == operand,
+        'range': lambda value, operand: operand[0] <= value <= operand[1],
+        'in': lambda value, operand: value in operand,
+    }
+    return sorted(key for key, row in rows.items()
+                  if all(tests[operator](row[column], operand) for column, operator, operand in predicates))
+
+
+def selected_keys(query, predicates):
+    records = query.select_where(predicates, [1, 1, 1, 1])
+    assert records is not False
+    return sorted(record.columns[0] for record in records)
+
+
+"""
+# The scan path (no index on a predicate column) and the bitmap path (every predicate column indexed) agree
+"""
+@pytest.mark.parametrize('indexes', [{}, {1: 'bitmap', 2: 'ordered', 3: 'bitmap'}])
+@pytest.mark.parametrize('predicates', PREDICATES)
+def test_select_where(table, predicates, indexes):
+    for column, kind in indexes.items():
+        table.index.create_index(column, kind)
+    query = Query(table)
+    assert selected_keys(query, predicates) == matching(table.rows, predicates)
+    assert sorted(query.filter(predicates)) == sorted(query.filter(list(reversed(predicates))))
+
+
+"""
+# Indexed predicates narrow the candidates with bitmaps, the unindexed ones are checked against the pages
+"""
+@pytest.mark.parametrize('predicates', PREDICATES)
+def test_select_where_mixed_indexes(table, predicates):
+    table.index.create_index(1, 'bitmap')
+    query = Query(table)
+    assert selected_keys(query, predicates) == matching(table.rows, predicates)
+
+
+def test_select_where_without_predicates_returns_every_live_record(table):
+    assert selected_keys(Query(table), []) == sorted(table.rows)
+
+
+def test_select_where_projection(table):
+    records = Query(table).select_where([(1, '=', 2)], [0, 1, 0, 1])
+    assert sorted(record.key for record in records) == matching(table.rows, [(1, '=', 2)])
+    for record in records:
+        row = table.rows[record.key]
+        assert record.columns == [None, row[1], None, row[3]]
+
+
+def test_predicate_bitmap(table):
+    table.index.create_index(1, 'bitmap')
+    query = Query(table)
+    live = [rid for rid in query.predicate_bitmap(1, '=', 2) if rid in table.page_directory]
+    assert len(live) == len(matching(table.rows, [(1, '=', 2)]))
+    assert sorted(query.predicate_bitmap(1, 'in', [0, 1])) == sorted(query.predicate_bitmap(1, 'range', (0, 1)))
+    with pytest.raises(Exception):
+        query.predicate_bitmap(1, '<', 2)
+    assert query.select_where([(2, '<', 2)], [1, 1, 1, 1]) is False
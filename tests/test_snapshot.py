@@ -0,0 +1,31 @@
+from array import array
+from lstore import snapshot
+import os
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'snapshot')
+    arrays = [array('q', [1, -2, 3]), array('B', [0, 1]), array('I')]
+    snapshot.write_snapshot(path, arrays)
+    assert snapshot.read_snapshot(path) == arrays
+    assert snapshot.read_snapshot(str(tmp_path / 'missing')) is None
+
+
+"""
+# The new file is durable before it replaces the old one, and the rename is durable before write_snapshot returns
+"""
+def test_write_snapshot_syncs_file_then_directory(tmp_path, monkeypatch):
+    path = str(tmp_path / 'snapshot')
+    events = []
+    fsync = os.fsync
+    replace = os.replace
+    def record_fsync(fd):
+        events.append(('fsync', os.path.realpath(f'/proc/self/fd/{fd}')))
+        fsync(fd)
+    def record_replace(source, destination):
+        events.append(('replace', destination))
+        replace(source, destination)
+    monkeypatch.setattr(os, 'fsync', record_fsync)
+    monkeypatch.setattr(os, 'replace', record_replace)
+    snapshot.write_snapshot(path, [array('q', [7])])
+    assert events == [('fsync', os.path.realpath(path + '.tmp')), ('replace', path), ('fsync', os.path.realpath(str(tmp_path)))]
@@ -0,0 +1,37 @@
+from lstore.query import Query
+
+
+"""
+# A merge that finishes between reading the base cells and walking the version chain must not hide the tail records
+# the base cells read do not hold yet
+"""
+def test_latest_values_ignores_merge_finishing_after_base_read(db, monkeypatch):
+    table = db.create_table('M', 3, 0)
+    query = Query(table)
+    assert query.insert(1, 10, 100)
+    assert query.update(1, None, 11, None)
+
+    read_cells = table.read_cells
+    def read_then_merge(page_range, kind, *args):
+        values = read_cells(page_range, kind, *args)
+        if kind == 'base':
+            # what a merge finishing right now would leave behind: a TPS past every tail record of the range
+            table.page_ranges[page_range]['TPS'] = table.max_records_per_page
+        return values
+    monkeypatch.setattr(table, 'read_cells', read_then_merge)
+    assert table.latest_values(1, [0, 1, 2]) == [1, 11, 100]
+
+
+"""
+# drain_merges returns only once the merge a full tail page triggered has run, not when it is merely dequeued
+"""
+def test_drain_merges_waits_for_running_merge(db):
+    table = db.create_table('D', 3, 0)
+    query = Query(table)
+    assert query.insert(1, 10, 100)
+    for value in range(table.max_records_per_page):
+        assert query.update(1, None, value, None)
+    table.drain_merges()
+    assert table.merge_metrics()['merges'] == 1
+    assert table.page_ranges[0]['TPS'] == table.max_records_per_page
+    assert table.merge_metrics()['queued'] == 0
@@ -0,0 +1,53 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.table import timestamp
+from lstore.transaction import Transaction
+from tests.conftest import write
+import pytest
+
+
+@pytest.fixture
+def table(tmp_path):
+    db = Database(checkpoint_interval=None)
+    db.open(str(tmp_path))
+    yield db.create_table('S', 2, 0)
+    db.close()
+
+
+"""
+# A snapshot read returns the same version before and after a writer that was running at the read time commits
+"""
+def test_snapshot_reads_are_repeatable(table):
+    query = Query(table)
+    assert query.insert(1, 10)
+    writer = Transaction()
+    write(writer, table, query.update, 1, None, 99)
+
+    as_of = timestamp()
+    assert query.select_snapshot(1, 0, [1, 1], as_of)[0].columns == [1, 10]
+    assert writer.commit()
+    assert query.select_snapshot(1, 0, [1, 1], as_of)[0].columns == [1, 10]
+    assert query.sum_snapshot(1, 1, 1, as_of) == 10
+    assert query.select_snapshot(1, 0, [1, 1], timestamp())[0].columns == [1, 99]
+
+
+def test_inserts_become_visible_at_commit(table):
+    query = Query(table)
+    writer = Transaction()
+    write(writer, table, query.insert, 2, 20)
+    write(writer, table, query.update, 2, None, 21)
+    as_of = timestamp()
+    assert query.select_snapshot(2, 0, [1, 1], as_of) == []
+    assert writer.commit()
+    assert query.select_snapshot(2, 0, [1, 1], as_of) == []
+    assert query.select_snapshot(2, 0, [1, 1], writer.commit_time)[0].columns == [2, 21]
+
+
+def test_aborted_versions_stay_hidden(table):
+    query = Query(table)
+    assert query.insert(3, 30)
+    writer = Transaction()
+    write(writer, table, query.update, 3, None, 31)
+    assert writer.abort() is False
+    assert query.select_snapshot(3, 0, [1, 1], timestamp())[0].columns == [3, 30]
+    assert query.select(3, 0, [1, 1])[0].columns == [3, 30]
@@ -0,0 +1,54 @@
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker, percentile
+import pytest
+
+
+def test_percentile():
+    samples = [5, 1, 4, 2, 3]
+    assert percentile(samples, 50) == 3
+    assert percentile(samples, 99) == 5
+    assert percentile(samples, 0) == 1
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([], 50) is None
+
+
+def test_summary_before_run():
+    summary = TransactionWorker().summary()
+    assert summary['transactions'] == 0 and summary['throughput'] == 0.0
+    assert summary['latency_p50'] is None and summary['latency_max'] is None
+
+
+"""
+# A worker's summary counts its commits and aborts and reports throughput and latency percentiles in milliseconds
+"""
+@pytest.mark.parametrize('num_threads', [1, 3])
+def test_summary(db, num_threads):
+    table = db.create_table('W', 2, 0)
+    query = Query(table)
+    transactions = []
+    for key in range(8):
+        transaction = Transaction()
+        transaction.add_query(query.insert, table, key, key)
+        transaction.add_query(query.update, table, key, None, key + 100)
+        transactions.append(transaction)
+    for key in (100, 101):
+        # updating a key that does not exist fails and aborts the transaction
+        transaction = Transaction()
+        transaction.add_query(query.update, table, key, None, 0)
+        transactions.append(transaction)
+
+    worker = TransactionWorker(transactions, num_threads=num_threads)
+    worker.run()
+    worker.join()
+    summary = worker.summary()
+    assert set(summary) == {'transactions', 'commits', 'aborts', 'elapsed', 'throughput',
+                            'latency_p50', 'latency_p95', 'latency_p99', 'latency_max'}
+    assert (summary['transactions'], summary['commits'], summary['aborts']) == (10, 8, 2)
+    assert worker.result == 8
+    assert summary['elapsed'] > 0
+    assert summary['throughput'] == pytest.approx(8 / summary['elapsed'])
+    assert 0 < summary['latency_p50'] <= summary['latency_p95'] <= summary['latency_p99'] <= summary['latency_max']
+    assert summary['latency_max'] == pytest.approx(max(worker.latencies) * 1000)
+    assert summary['latency_max'] <= summary['elapsed'] * 1000
+    assert query.sum(0, 7, 1) == sum(range(100, 108))
@@ -0,0 +1,119 @@
+from lstore.wal import WriteAheadLog, checkpoint_lsn, recovery_tables
+import os
+import pytest
+import time
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'wal')
+
+
+"""
+# The records a recovery opening the log directory now would read
+"""
+def logged(path):
+    log = WriteAheadLog(path)
+    try:
+        return log.records()
+    finally:
+        log.close()
+
+
+def test_records_survive_reopen_and_lsns_continue(path):
+    log = WriteAheadLog(path)
+    first = log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 1})
+    second = log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 2})
+    log.close()
+
+    log = WriteAheadLog(path)
+    assert [(record['lsn'], record['v']) for record in log.records()] == [(first, 1), (second, 2)]
+    assert log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 3}) == second + 1
+    log.close()
+
+
+def test_torn_frame_ends_the_log(path):
+    log = WriteAheadLog(path)
+    log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 1})
+    log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 2})
+    log.close()
+    segment = log.segment_path(log.segments[-1])
+    os.truncate(segment, os.path.getsize(segment) - 3) # a crash in the middle of the last write
+
+    log = WriteAheadLog(path)
+    assert [record['v'] for record in log.records()] == [1]
+    # the torn bytes are cut off, so records appended now are read back
+    log.append({'op': 'cell', 't': 'A', 'x': 0, 'v': 4})
+    log.close()
+    assert [record['v'] for record in logged(path)] == [1, 4]
+
+
+def test_commit_policy_makes_commits_durable(path):
+    log = WriteAheadLog(path, 'commit')
+    log.append({'op': 'cell', 't': 'A', 'x': 1})
+    lsn = log.commit(1)
+    assert log.is_durable(lsn)
+    assert log.stats['fsyncs'] == 1
+    log.close()
+
+
+def test_none_policy_writes_commits_without_fsync(path):
+    log = WriteAheadLog(path, 'none')
+    log.append({'op': 'cell', 't': 'A', 'x': 1})
+    lsn = log.commit(1)
+    assert log.written_lsn >= lsn
+    assert not log.is_durable(lsn)
+    assert log.stats['fsyncs'] == 0
+    # written to the operating system: another reader of the directory sees the commit
+    assert [record['op'] for record in logged(path)] == ['cell', 'commit']
+    log.close()
+
+
+def test_interval_policy_syncs_in_the_background(path):
+    log = WriteAheadLog(path, 'interval', sync_interval=0.01)
+    log.append({'op': 'cell', 't': 'A', 'x': 1})
+    lsn = log.commit(1)
+    deadline = time.monotonic() + 5
+    while not log.is_durable(lsn) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert log.is_durable(lsn)
+    log.close()
+
+
+def test_unknown_sync_policy(path):
+    with pytest.raises(Exception):
+        WriteAheadLog(path, 'sometimes')
+
+
+"""
+# A checkpoint deletes the segments before its begin LSN, except those holding records of running transactions
+"""
+def test_checkpoint_keeps_segments_of_running_transactions(path):
+    log = WriteAheadLog(path)
+    log.append({'op': 'cell', 't': 'A', 'x': 0})
+    log.end_checkpoint(log.begin_checkpoint())
+    log.append({'op': 'cell', 't': 'A', 'x': 7}) # transaction 7 starts and keeps running
+    begin_lsn = log.begin_checkpoint()
+    log.end_checkpoint(begin_lsn)
+    log.append({'op': 'cell', 't': 'B', 'x': 0})
+    log.end_checkpoint(log.begin_checkpoint())
+
+    records = logged(path)
+    assert [record['x'] for record in records if record['op'] == 'cell'] == [7, 0]
+    log.commit(7)
+    log.end_checkpoint(log.begin_checkpoint())
+    assert all(record['op'] != 'cell' for record in logged(path))
+    log.close()
+
+
+def test_recovery_tables():
+    records = [
+        {'op': 'cell', 't': 'A', 'x': 0, 'lsn': 1},
+        {'op': 'cell', 't': 'B', 'x': 5, 'lsn': 2}, # loser, before the checkpoint
+        {'op': 'cell', 't': 'C', 'x': 6, 'lsn': 3}, # committed before the checkpoint
+        {'op': 'commit', 'x': 6, 'lsn': 4},
+        {'op': 'checkpoint', 'begin': 4, 'lsn': 5},
+        {'op': 'cell', 't': 'D', 'x': 0, 'lsn': 6},
+    ]
+    assert checkpoint_lsn(records) == 4
+    assert recovery_tables(records) == {'B', 'D'}